@@ -6,4 +6,24 @@ SMTP_PORT = os.environ['SMTP_PORT']
 SMTP_LOGIN = os.environ['SMTP_LOGIN']
 SMTP_PASSWORD = os.environ['SMTP_PASSWORD']
 SENDER_EMAIL = os.environ['SENDER_EMAIL']
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+# Seconds after which an idle SMTP connection is closed.
+SMTP_IDLE_TIMEOUT = float(os.environ.get('SMTP_IDLE_TIMEOUT', 60))
+# Seconds after which an idle SMTP connection is checked with NOOP before reuse.
+SMTP_HEALTH_CHECK_AFTER = float(os.environ.get('SMTP_HEALTH_CHECK_AFTER', 10))
+# Maximum number of RCPT TO commands the SMTP provider accepts for one message.
+SMTP_MAX_RECIPIENTS = int(os.environ.get('SMTP_MAX_RECIPIENTS', 100))
 DEBUG = os.environ.get('DEBUG', False) == 'True'
+# Maximum number of mails waiting in the spool.
+QUEUE_SIZE = int(os.environ.get('QUEUE_SIZE', 1000))
+QUEUE_WORKERS = int(os.environ.get('QUEUE_WORKERS', 4))
+# SQLite database keeping accepted mails until they are delivered.
+SPOOL_PATH = os.environ.get('SPOOL_PATH', 'spool.sqlite3')
+SPOOL_MAX_ATTEMPTS = int(os.environ.get('SPOOL_MAX_ATTEMPTS', 10))
+# Seconds before the first retry. It doubles with each attempt up to SPOOL_MAX_RETRY_BACKOFF.
+SPOOL_RETRY_BACKOFF = float(os.environ.get('SPOOL_RETRY_BACKOFF', 30))
+SPOOL_MAX_RETRY_BACKOFF = float(os.environ.get('SPOOL_MAX_RETRY_BACKOFF', 3600))
+SPOOL_POLL_INTERVAL = float(os.environ.get('SPOOL_POLL_INTERVAL', 1))
+SPOOL_COMPACT_INTERVAL = float(os.environ.get('SPOOL_COMPACT_INTERVAL', 600))
+# Seconds for which dead mails and finished batches are kept.
+SPOOL_RETENTION = float(os.environ.get('SPOOL_RETENTION', 86400))
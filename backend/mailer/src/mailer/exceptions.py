@@ -44,6 +44,12 @@ class NotFound(CoreHttpError):
     message = 'Given resource does not exist.'
 
 
+class ServiceUnavailable(CoreHttpError):
+    status = 503
+    code = 'service_unavailable'
+    message = 'Service is overloaded. Try again later.'
+
+
 class WerkzeugHTTPError(CoreHttpError):
     def __init__(self, original_exc: werkzeug.exceptions.HTTPException, **kwargs):
         super().__init__(**kwargs)
@@ -1,55 +1,70 @@
 import logging
 import smtplib
-import ssl
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Type
+from typing import Optional, Type
 
 from marshmallow import Schema
 
-from mailer.config import MODE, SMTP_SERVER, SMTP_PORT, SMTP_PASSWORD, SMTP_LOGIN, SENDER_EMAIL
+from mailer.config import SENDER_EMAIL, SMTP_MAX_RECIPIENTS, SMTP_POOL_SIZE
 from mailer.exceptions import NoHandlerForTemplate
-from mailer.schemas import NewUploadSchema, UploadDownloadedSchema
+from mailer.schemas import NewBatchUploadSchema, NewUploadSchema, UploadDownloadedSchema
+from mailer.smtp import SMTPConnectionPool, get_smtp_pool
 
 
 class Mail:
     schema: Type[Schema] = NotImplementedError
     name: str = NotImplementedError
 
-    def __init__(self, logger: logging.Logger = logging.getLogger(__name__)):
+    def __init__(
+        self,
+        pool: Optional[SMTPConnectionPool] = None,
+        logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self._pool = pool or get_smtp_pool()
         self._logger = logger
 
     def template(self, *args, **kwargs):
         raise NotImplementedError
 
-    def handle(self, *args, **kwargs):
+    def validate(self, data) -> dict:
+        """
+        Raises:
+            marshmallow.ValidationError
+        """
+        return self.schema().load(data)
+
+    def deliver(self, cleaned_data) -> bool:
         raise NotImplementedError
 
-    def send(self, recipients, message):
-        if MODE == 'SSL':
-            with smtplib.SMTP_SSL(
-                    SMTP_SERVER, SMTP_PORT, context=ssl.create_default_context()
-            ) as server:
-                server.login(SMTP_LOGIN, SMTP_PASSWORD)
-                server.sendmail(SENDER_EMAIL, recipients, message)
-        elif MODE == 'TLS':
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls(context=ssl.create_default_context())
-                server.login(SMTP_LOGIN, SMTP_PASSWORD)
-                server.sendmail(SENDER_EMAIL, recipients, message)
-        else:
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls(context=ssl.create_default_context())
-                server.sendmail(SENDER_EMAIL, recipients, message)
+    def handle(self, data) -> bool:
+        return self.deliver(self.validate(data))
+
+    def send(self, recipients, message) -> dict:
+        """
+        Returns recipients refused by the server, as smtplib.SMTP.sendmail does.
+        """
+        # Pooled connection may have been dropped by the server while idle,
+        # so a disconnect is retried once on a fresh connection.
+        for attempt in range(2):
+            try:
+                with self._pool.connection() as server:
+                    return server.sendmail(SENDER_EMAIL, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                self._logger.debug('SMTP connection lost. Retrying.')
+        raise smtplib.SMTPServerDisconnected('SMTP connection lost.')
 
 
 class NewUpload(Mail):
-    schema = NewUploadSchema
+    schema: Type[Schema] = NewUploadSchema
     name = 'new_upload'
 
-    def handle(self, data):
+    def deliver(self, cleaned_data):
         self._logger.debug('Handle')
-        cleaned_data = self.schema().load(data)
+        cleaned_data = dict(cleaned_data)
         email = cleaned_data.pop('email')
         message = self.template(**cleaned_data)
         self._logger.debug(f'email: {email}')
@@ -74,6 +89,86 @@ class NewUpload(Mail):
         return message.as_string()
 
 
+class NewBatchUpload(NewUpload):
+    """
+    Single mail about files shared together, with a link to each of them.
+    """
+    schema = NewBatchUploadSchema
+    name = 'new_batch_upload'
+
+    def template(self, urls):
+        message = MIMEMultipart()
+        message['Subject'] = 'New Sharethis upload'
+        links = '\n'.join(urls)
+        message.attach(MIMEText(
+            'Hello from Sharethis.\n'
+            f'{len(urls)} new Sharethis uploads are available.\n'
+            f'You can download them here:\n{links}',
+            'plain'
+        ))
+        return message.as_string()
+
+
+class UploadDownloaded(Mail):
+    """
+    Notify many recipients with one rendered message.
+
+    Recipients are split into chunks of at most `max_recipients`, each sent as a single
+    message over one pooled connection, and chunks are sent in parallel.
+    """
+    schema = UploadDownloadedSchema
+    name = 'upload_downloaded'
+
+    def __init__(
+        self,
+        pool: Optional[SMTPConnectionPool] = None,
+        max_recipients: int = SMTP_MAX_RECIPIENTS,
+        max_workers: int = SMTP_POOL_SIZE,
+        logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        super().__init__(pool=pool, logger=logger)
+        self._max_recipients = max_recipients
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='mail-fan-out'
+        )
+
+    def deliver(self, cleaned_data):
+        """
+        On a partial failure `cleaned_data['recipients']` is narrowed to the recipients
+        of failed chunks, so a retry does not send the message twice.
+        """
+        # Keep the order, but send only once to an address listed twice.
+        recipients = list(dict.fromkeys(cleaned_data['recipients']))
+        message = self.template(cleaned_data['url'])
+        chunks = [
+            recipients[i:i + self._max_recipients]
+            for i in range(0, len(recipients), self._max_recipients)
+        ]
+        futures = [self._executor.submit(self.send, chunk, message) for chunk in chunks]
+        failed = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                if refused := future.result():
+                    self._logger.warning(f'Recipients refused: {list(refused)}')
+            except Exception as e:
+                self._logger.debug(e)
+                failed.extend(chunk)
+        cleaned_data['recipients'] = failed
+        return not failed
+
+    def template(self, url):
+        message = MIMEMultipart()
+        message['Subject'] = 'Sharethis upload downloaded'
+        # Recipients of a fan-out must not see each other.
+        message['To'] = 'undisclosed-recipients:;'
+        message.attach(MIMEText(
+            'Hello from Sharethis.\n'
+            f'Sharethis upload has been downloaded: {url}',
+            'plain'
+        ))
+        return message.as_string()
+
+
 class MailCollector:
     def __init__(
         self,
@@ -1,27 +1,69 @@
 import logging
 
-from flask import Flask, request
+from flask import Blueprint, Flask, current_app, request
+from marshmallow import ValidationError
 
+from mailer.config import (
+    QUEUE_SIZE,
+    QUEUE_WORKERS,
+    SPOOL_PATH,
+    SPOOL_MAX_ATTEMPTS,
+    SPOOL_RETRY_BACKOFF,
+    SPOOL_MAX_RETRY_BACKOFF,
+    SPOOL_POLL_INTERVAL,
+    SPOOL_COMPACT_INTERVAL,
+    SPOOL_RETENTION,
+)
 from mailer.exceptions import (
     ExceptionHandlerMapper,
     BadRequest,
     NotFound,
-    CoreHttpError,
-    NoHandlerForTemplate
+    NoHandlerForTemplate,
+    ServiceUnavailable,
 )
 from mailer.logging import config_logger
-from mailer.mails import MailCollector, NewUpload
+from mailer.mails import MailCollector, NewBatchUpload, NewUpload, UploadDownloaded
+from mailer.spool import MailSpool
+from mailer.workers import MailQueue, QueueFull
+
 
+logger = logging.getLogger(__name__)
+mc = MailCollector(mail_handlers=[NewUpload, NewBatchUpload, UploadDownloaded])
+views = Blueprint('mailer', __name__)
 
-config_logger()
-app = Flask(__name__)
-ExceptionHandlerMapper(app)
 
+def create_app(spool_path: str = SPOOL_PATH) -> Flask:
+    """
+    Build the application with its spool and start delivery workers. Has to be
+    called in the serving process, worker threads do not survive a fork.
+    """
+    config_logger()
+    app = Flask(__name__)
+    ExceptionHandlerMapper(app)
+    app.register_blueprint(views)
+    mail_queue = MailQueue(
+        spool=MailSpool(spool_path),
+        collector=mc,
+        max_size=QUEUE_SIZE,
+        workers=QUEUE_WORKERS,
+        max_attempts=SPOOL_MAX_ATTEMPTS,
+        backoff=SPOOL_RETRY_BACKOFF,
+        max_backoff=SPOOL_MAX_RETRY_BACKOFF,
+        poll_interval=SPOOL_POLL_INTERVAL,
+        compact_interval=SPOOL_COMPACT_INTERVAL,
+        retention=SPOOL_RETENTION,
+    )
+    # Spooled mails are delivered also when nothing new is submitted, e.g. after a restart.
+    mail_queue.start()
+    app.extensions['mail_queue'] = mail_queue
+    return app
 
-logger = logging.getLogger(__name__)
 
+def get_mail_queue() -> MailQueue:
+    return current_app.extensions['mail_queue']
 
-@app.route('/send', methods=['POST'])
+
+@views.route('/send', methods=['POST'])
 def send_view():
     if not (data := request.json):
         raise BadRequest
@@ -32,12 +74,50 @@ def send_view():
         logger.debug(handler)
     except NoHandlerForTemplate:
         raise BadRequest('Given template does not exist.')
-    if not handler.handle(data):
-        raise CoreHttpError(message='Mail server is unavailable.')
+    try:
+        get_mail_queue().submit([(handler, handler.validate(data))])
+    except QueueFull:
+        raise ServiceUnavailable
     logger.debug('Send')
-    return {'success': True, 'message': 'Email send successfully.'}, 200
+    return {'success': True, 'message': 'Email accepted for delivery.'}, 202
+
+
+@views.route('/send/batch', methods=['POST'])
+def send_batch_view():
+    if not (data := request.json) or not isinstance(messages := data.get('messages'), list):
+        raise BadRequest(details={'messages': 'List of messages is required.'})
+    mails, errors = [], {}
+    for index, message in enumerate(messages):
+        try:
+            message = dict(message)
+            handler = mc.get_handler(message.pop('template', None))
+            mails.append((handler, handler.validate(message)))
+        except NoHandlerForTemplate:
+            errors[index] = {'template': 'Given template does not exist.'}
+        except (TypeError, ValueError):
+            errors[index] = 'Message must be an object.'
+        except ValidationError as e:
+            errors[index] = e.messages
+    if errors:
+        raise BadRequest(details=errors)
+    try:
+        status = get_mail_queue().submit(mails)
+    except QueueFull:
+        raise ServiceUnavailable
+    return status.as_dict(), 202
+
+
+@views.route('/send/batch/<string:batch_id>', methods=['GET'])
+def send_batch_status_view(batch_id):
+    if not (status := get_mail_queue().status(batch_id)):
+        raise NotFound
+    return status.as_dict(), 200
+
+
+@views.route('/stats', methods=['GET'])
+def stats_view():
+    return get_mail_queue().stats(), 200
 
 
 if __name__ == '__main__':
-    mc = MailCollector(mail_handlers=[NewUpload])
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 
 
 class NewUploadSchema(Schema):
@@ -6,6 +6,11 @@ class NewUploadSchema(Schema):
     url = fields.URL(required=True)
 
 
+class NewBatchUploadSchema(Schema):
+    email = fields.Email(required=True)
+    urls = fields.List(fields.URL, required=True, validate=validate.Length(min=1))
+
+
 class UploadDownloadedSchema(Schema):
     recipients = fields.List(fields.Email, required=True)
     url = fields.URL(required=True)
@@ -0,0 +1,135 @@
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+
+from mailer.config import (
+    MODE,
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_LOGIN,
+    SMTP_PASSWORD,
+    SMTP_POOL_SIZE,
+    SMTP_IDLE_TIMEOUT,
+    SMTP_HEALTH_CHECK_AFTER,
+)
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP sessions.
+
+    Idle sessions older than `idle_timeout` are closed, sessions idle longer than
+    `health_check_after` are checked with NOOP before reuse and a session which
+    failed during use is discarded, so the next checkout reconnects.
+    """
+    def __init__(
+        self,
+        mode: str,
+        server: str,
+        port,
+        login: str,
+        password: str,
+        max_size: int = 4,
+        idle_timeout: float = 60,
+        health_check_after: float = 10,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self._mode = mode
+        self._server = server
+        self._port = port
+        self._login = login
+        self._password = password
+        self._idle_timeout = idle_timeout
+        self._health_check_after = health_check_after
+        self._logger = logger
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (connection, time it was returned to the pool)
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._mode == 'SSL':
+            server: smtplib.SMTP = smtplib.SMTP_SSL(
+                self._server, self._port, context=ssl.create_default_context()
+            )
+            server.login(self._login, self._password)
+        elif self._mode == 'TLS':
+            server = smtplib.SMTP(self._server, self._port)
+            server.starttls(context=ssl.create_default_context())
+            server.login(self._login, self._password)
+        else:
+            server = smtplib.SMTP(self._server, self._port)
+            server.starttls(context=ssl.create_default_context())
+        self._logger.debug('New SMTP connection.')
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _healthy(self, server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                # Most recently used session is the most likely to be alive.
+                server, returned_at = self._idle.pop()
+            idle_for = time.monotonic() - returned_at
+            if idle_for >= self._idle_timeout:
+                self._close(server)
+                continue
+            if idle_for >= self._health_check_after and not self._healthy(server):
+                self._logger.debug('Dropping unhealthy SMTP connection.')
+                self._close(server)
+                continue
+            return server
+        return self._connect()
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        Borrow a session. It is returned to the pool unless the block raises.
+        """
+        with self._slots:
+            server = self._checkout()
+            try:
+                yield server
+            except BaseException:
+                self._close(server)
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+@lru_cache(maxsize=None)
+def get_smtp_pool() -> SMTPConnectionPool:
+    return SMTPConnectionPool(
+        mode=MODE,
+        server=SMTP_SERVER,
+        port=SMTP_PORT,
+        login=SMTP_LOGIN,
+        password=SMTP_PASSWORD,
+        max_size=SMTP_POOL_SIZE,
+        idle_timeout=SMTP_IDLE_TIMEOUT,
+        health_check_after=SMTP_HEALTH_CHECK_AFTER,
+    )
@@ -0,0 +1,233 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterator, Optional
+
+
+class SpoolFull(Exception):
+    pass
+
+
+@dataclass
+class BatchStatus:
+    batch_id: str
+    total: int
+    sent: int = 0
+    failed: int = 0
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.sent - self.failed
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), 'pending': self.pending}
+
+
+@dataclass
+class SpooledMail:
+    id: int
+    batch_id: str
+    template: str
+    payload: dict
+    attempts: int
+    created_at: float
+
+
+class MailSpool:
+    """
+    Durable queue of accepted mails kept in a SQLite database in WAL mode.
+
+    A claimed mail is leased for `lease` seconds instead of being locked, so a mail
+    claimed by a process which died is delivered again once the lease runs out.
+    Mails which ran out of attempts stay in the spool as dead until compaction.
+    Timestamps are wall clock seconds, as they have to survive a restart.
+    """
+    def __init__(
+        self,
+        path: str,
+        lease: float = 300,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._path = path
+        self._lease = lease
+        self._clock = clock
+        self._local = threading.local()
+        self._create_schema()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can not be shared between threads.
+        if (connection := getattr(self._local, 'connection', None)) is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front, so read-then-write
+        # sequences are not interleaved between processes sharing the spool.
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _create_schema(self):
+        connection = self._connection
+        # Must be set before the first table is created to have an effect.
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS mails (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL,
+                template TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS mails_next_attempt_at ON mails (next_attempt_at);
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+        ''')
+
+    def add(self, batch_id: str, mails: list[tuple[str, dict]], max_depth: int) -> BatchStatus:
+        """
+        Spool (template, payload) pairs as one batch.
+
+        Raises:
+            SpoolFull
+        """
+        now = self._clock()
+        with self._transaction() as connection:
+            if self._depth(connection) + len(mails) > max_depth:
+                raise SpoolFull
+            connection.execute(
+                'INSERT INTO batches (batch_id, total, created_at) VALUES (?, ?, ?)',
+                (batch_id, len(mails), now)
+            )
+            connection.executemany(
+                'INSERT INTO mails (batch_id, template, payload, created_at, next_attempt_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (batch_id, template, json.dumps(payload), now, now)
+                    for template, payload in mails
+                ]
+            )
+        return BatchStatus(batch_id=batch_id, total=len(mails))
+
+    def claim(self, limit: int) -> list[SpooledMail]:
+        now = self._clock()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                'SELECT id, batch_id, template, payload, attempts, created_at FROM mails '
+                'WHERE next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?',
+                (now, limit)
+            ).fetchall()
+            connection.executemany(
+                'UPDATE mails SET next_attempt_at = ? WHERE id = ?',
+                [(now + self._lease, row[0]) for row in rows]
+            )
+        return [
+            SpooledMail(
+                id=id_, batch_id=batch_id, template=template, payload=json.loads(payload),
+                attempts=attempts, created_at=created_at
+            )
+            for id_, batch_id, template, payload, attempts, created_at in rows
+        ]
+
+    def ack(self, mail: SpooledMail):
+        with self._transaction() as connection:
+            # Mail whose lease ran out may have been delivered twice, but it is counted once.
+            if connection.execute('DELETE FROM mails WHERE id = ?', (mail.id,)).rowcount:
+                connection.execute(
+                    'UPDATE batches SET sent = sent + 1 WHERE batch_id = ?', (mail.batch_id,)
+                )
+
+    def retry(
+        self,
+        mail: SpooledMail,
+        error: str,
+        max_attempts: int,
+        backoff: float,
+        max_backoff: float,
+    ) -> bool:
+        """
+        Schedule another attempt with exponential backoff. The payload is saved too,
+        as a handler may narrow it to what is left to deliver.
+
+        Returns False when the mail ran out of attempts and is dead.
+        """
+        attempts = mail.attempts + 1
+        if attempts >= max_attempts:
+            next_attempt_at = None
+        else:
+            next_attempt_at = self._clock() + min(backoff * 2 ** (attempts - 1), max_backoff)
+        with self._transaction() as connection:
+            connection.execute(
+                'UPDATE mails SET attempts = ?, next_attempt_at = ?, last_error = ?, payload = ? '
+                'WHERE id = ?',
+                (attempts, next_attempt_at, error, json.dumps(mail.payload), mail.id)
+            )
+            if next_attempt_at is None:
+                connection.execute(
+                    'UPDATE batches SET failed = failed + 1 WHERE batch_id = ?', (mail.batch_id,)
+                )
+        return next_attempt_at is not None
+
+    def status(self, batch_id: str) -> Optional[BatchStatus]:
+        row = self._connection.execute(
+            'SELECT batch_id, total, sent, failed FROM batches WHERE batch_id = ?', (batch_id,)
+        ).fetchone()
+        return BatchStatus(*row) if row else None
+
+    def compact(self, retention: float):
+        """
+        Drop dead mails and finished batches older than `retention` seconds
+        and give the freed space back to the filesystem.
+        """
+        older_than = self._clock() - retention
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM mails WHERE next_attempt_at IS NULL AND created_at < ?',
+                (older_than,)
+            )
+            connection.execute(
+                'DELETE FROM batches WHERE sent + failed >= total AND created_at < ?',
+                (older_than,)
+            )
+        self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._connection.execute('PRAGMA incremental_vacuum')
+
+    @staticmethod
+    def _depth(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            'SELECT COUNT(*) FROM mails WHERE next_attempt_at IS NOT NULL'
+        ).fetchone()[0]
+
+    def stats(self) -> dict:
+        connection = self._connection
+        oldest = connection.execute(
+            'SELECT MIN(created_at) FROM mails WHERE next_attempt_at IS NOT NULL'
+        ).fetchone()[0]
+        return {
+            'depth': self._depth(connection),
+            'dead': connection.execute(
+                'SELECT COUNT(*) FROM mails WHERE next_attempt_at IS NULL'
+            ).fetchone()[0],
+            'oldest_age': self._clock() - oldest if oldest is not None else 0.0,
+        }
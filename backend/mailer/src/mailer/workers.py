@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+
+from mailer.exceptions import NoHandlerForTemplate
+from mailer.mails import Mail, MailCollector
+from mailer.spool import BatchStatus, MailSpool, SpooledMail, SpoolFull
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MailQueue:
+    """
+    Mails accepted into the spool and delivered from it by a pool of worker threads.
+
+    Failed deliveries are retried with exponential backoff, so neither an SMTP outage
+    nor a restart loses accepted mail. Every process sharing the spool delivers from it.
+    """
+    def __init__(
+        self,
+        spool: MailSpool,
+        collector: MailCollector,
+        max_size: int = 1000,
+        workers: int = 4,
+        max_attempts: int = 10,
+        backoff: float = 30,
+        max_backoff: float = 3600,
+        poll_interval: float = 1,
+        compact_interval: float = 600,
+        retention: float = 86400,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self._spool = spool
+        self._collector = collector
+        self._max_size = max_size
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._poll_interval = poll_interval
+        self._compact_interval = compact_interval
+        self._retention = retention
+        self._logger = logger
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._delivered = 0
+        self._failed_attempts = 0
+        self._dead = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        # Has to be called in the serving process, threads do not survive a fork.
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self._workers):
+                self._threads.append(threading.Thread(
+                    target=self._work, name=f'mail-worker-{number}', daemon=True
+                ))
+            self._threads.append(threading.Thread(
+                target=self._compact, name='mail-spool-compactor', daemon=True
+            ))
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, mails: list[tuple[Mail, dict]]) -> BatchStatus:
+        """
+        Spool (handler, cleaned data) pairs as one batch.
+
+        Raises:
+            QueueFull
+        """
+        try:
+            status = self._spool.add(
+                batch_id=uuid.uuid4().hex,
+                mails=[(handler.name, data) for handler, data in mails],
+                max_depth=self._max_size,
+            )
+        except SpoolFull:
+            raise QueueFull
+        self._wakeup.set()
+        return status
+
+    def status(self, batch_id: str) -> Optional[BatchStatus]:
+        return self._spool.status(batch_id)
+
+    def stats(self) -> dict:
+        """
+        Spool depth and delivery counters of this process.
+        """
+        with self._lock:
+            delivery = {
+                'delivered': self._delivered,
+                'failed_attempts': self._failed_attempts,
+                'dead': self._dead,
+                'latency_avg': self._latency_total / self._delivered if self._delivered else 0.0,
+                'latency_max': self._latency_max,
+            }
+        return {'spool': self._spool.stats(), 'delivery': delivery}
+
+    def _work(self):
+        while True:
+            try:
+                mails = self._spool.claim(limit=1)
+            except Exception as e:
+                self._logger.exception(e)
+                mails = []
+            if not mails:
+                self._wakeup.wait(self._poll_interval)
+                self._wakeup.clear()
+                continue
+            for mail in mails:
+                self._deliver(mail)
+
+    def _deliver(self, mail: SpooledMail):
+        error = 'Delivery failed.'
+        try:
+            delivered = self._collector.get_handler(mail.template).deliver(mail.payload)
+        except NoHandlerForTemplate:
+            delivered, error = False, f'No handler for template {mail.template}.'
+        except Exception as e:
+            self._logger.exception(e)
+            delivered, error = False, str(e)
+        try:
+            if delivered:
+                self._spool.ack(mail)
+                self._record_delivery(time.time() - mail.created_at)
+            elif self._spool.retry(
+                mail, error, self._max_attempts, self._backoff, self._max_backoff
+            ):
+                with self._lock:
+                    self._failed_attempts += 1
+            else:
+                self._logger.warning(f'Giving up on mail {mail.id}: {error}')
+                with self._lock:
+                    self._failed_attempts += 1
+                    self._dead += 1
+        except Exception as e:
+            # Lease runs out and the mail is picked up again.
+            self._logger.exception(e)
+
+    def _record_delivery(self, latency: float):
+        with self._lock:
+            self._delivered += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def _compact(self):
+        while True:
+            time.sleep(self._compact_interval)
+            try:
+                self._spool.compact(self._retention)
+            except Exception as e:
+                self._logger.exception(e)
@@ -1,5 +1,5 @@
-from mailer.main import app
+from mailer.main import create_app
 
 
 # Gunicorn is looking for application, and we want to keep it default.
-application = app
+application = create_app()
@@ -0,0 +1,10 @@
+import os
+
+
+# mailer.config reads required variables on import.
+os.environ.setdefault('MODE', 'TLS')
+os.environ.setdefault('SMTP_SERVER', 'localhost')
+os.environ.setdefault('SMTP_PORT', '25')
+os.environ.setdefault('SMTP_LOGIN', 'login')
+os.environ.setdefault('SMTP_PASSWORD', 'password')
+os.environ.setdefault('SENDER_EMAIL', 'sender@sharethis.space')
@@ -0,0 +1,65 @@
+import smtplib
+import threading
+from contextlib import contextmanager
+
+from mailer.mails import NewBatchUpload, UploadDownloaded
+
+
+class FakeServer:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def sendmail(self, sender, recipients, message):
+        with self._pool.lock:
+            self._pool.sent.append((list(recipients), message))
+        if set(recipients) & self._pool.failing:
+            raise smtplib.SMTPServerDisconnected
+        return {}
+
+
+class FakePool:
+    def __init__(self, failing=()):
+        self.lock = threading.Lock()
+        self.sent = []
+        self.failing = set(failing)
+
+    @contextmanager
+    def connection(self):
+        yield FakeServer(self)
+
+
+def recipients(count):
+    return [f'user{i}@example.com' for i in range(count)]
+
+
+def test_recipients_are_chunked_and_message_rendered_once():
+    pool = FakePool()
+    mail = UploadDownloaded(pool=pool, max_recipients=2)
+    data = {'recipients': recipients(5) + ['user0@example.com'], 'url': 'http://x.com/k'}
+
+    assert mail.deliver(data)
+
+    assert sorted(len(chunk) for chunk, _ in pool.sent) == [1, 2, 2]
+    assert sorted(r for chunk, _ in pool.sent for r in chunk) == sorted(recipients(5))
+    assert len({message for _, message in pool.sent}) == 1
+
+
+def test_failed_chunks_are_left_for_retry():
+    pool = FakePool(failing={'user3@example.com'})
+    mail = UploadDownloaded(pool=pool, max_recipients=2)
+    data = {'recipients': recipients(5), 'url': 'http://x.com/k'}
+
+    assert not mail.deliver(data)
+
+    assert data['recipients'] == ['user2@example.com', 'user3@example.com']
+
+
+def test_batch_upload_lists_every_link():
+    pool = FakePool()
+    mail = NewBatchUpload(pool=pool)
+
+    assert mail.handle({'email': 'a@example.com', 'urls': ['http://x.com/a', 'http://x.com/b']})
+
+    [(recipients, message)] = pool.sent
+    assert recipients == ['a@example.com']
+    assert 'http://x.com/a\nhttp://x.com/b' in message
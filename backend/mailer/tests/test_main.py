@@ -0,0 +1,29 @@
+import importlib
+import threading
+
+import mailer.main
+
+
+def worker_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('mail-')]
+
+
+def test_import_opens_no_spool(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    threads = worker_threads()
+
+    importlib.reload(mailer.main)
+
+    assert list(tmp_path.iterdir()) == []
+    assert worker_threads() == threads
+
+
+def test_app_serves_its_own_queue(tmp_path):
+    app = mailer.main.create_app(spool_path=str(tmp_path / 'spool.sqlite3'))
+    client = app.test_client()
+
+    response = client.post('/send/batch', json={'messages': [{'template': 'unknown'}]})
+
+    assert response.status_code == 400
+    assert client.get('/stats').json == app.extensions['mail_queue'].stats()
+    assert (tmp_path / 'spool.sqlite3').exists()
@@ -0,0 +1,73 @@
+import smtplib
+
+import pytest
+
+from mailer.smtp import SMTPConnectionPool
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected
+        return 250, b'OK'
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(SMTPConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__('TLS', 'localhost', 25, 'login', 'password', **kwargs)
+        self.created = []
+
+    def _connect(self):
+        self.created.append(FakeSMTP())
+        return self.created[-1]
+
+
+def test_connection_is_reused():
+    pool = FakePool()
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(pool.created) == 1
+
+
+def test_failed_connection_is_discarded():
+    pool = FakePool()
+    with pytest.raises(smtplib.SMTPException):
+        with pool.connection() as server:
+            raise smtplib.SMTPException
+    assert server.closed
+    with pool.connection():
+        pass
+    assert len(pool.created) == 2
+
+
+def test_unhealthy_connection_is_replaced():
+    pool = FakePool(health_check_after=0)
+    with pool.connection() as server:
+        server.alive = False
+    with pool.connection() as replacement:
+        pass
+    assert replacement is not server
+    assert server.closed
+
+
+def test_idle_connection_expires():
+    pool = FakePool(idle_timeout=0)
+    with pool.connection() as server:
+        pass
+    with pool.connection():
+        pass
+    assert server.closed
+    assert len(pool.created) == 2
@@ -0,0 +1,100 @@
+import pytest
+
+from mailer.spool import MailSpool, SpoolFull
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def spool(tmp_path, clock):
+    return MailSpool(str(tmp_path / 'spool.sqlite3'), lease=60, clock=clock)
+
+
+def test_spooled_mail_survives_reopening(tmp_path, spool, clock):
+    spool.add('batch', [('new_upload', {'email': 'a@example.com'})], max_depth=10)
+
+    reopened = MailSpool(str(tmp_path / 'spool.sqlite3'), clock=clock)
+
+    [mail] = reopened.claim(limit=10)
+    assert (mail.template, mail.payload) == ('new_upload', {'email': 'a@example.com'})
+
+
+def test_claimed_mail_is_leased(spool, clock):
+    spool.add('batch', [('new_upload', {})], max_depth=10)
+
+    assert len(spool.claim(limit=10)) == 1
+    assert spool.claim(limit=10) == []
+    clock.now += 60
+    assert len(spool.claim(limit=10)) == 1
+
+
+def test_retry_backs_off_exponentially(spool, clock):
+    spool.add('batch', [('new_upload', {})], max_depth=10)
+
+    delays = []
+    for _ in range(3):
+        [mail] = spool.claim(limit=1)
+        assert spool.retry(mail, 'error', max_attempts=10, backoff=10, max_backoff=30)
+        start = clock.now
+        while not spool.claim(limit=1):
+            clock.now += 1
+        delays.append(clock.now - start)
+        clock.now += 60
+    assert delays == [10, 20, 30]
+
+
+def test_mail_is_dead_after_max_attempts(spool):
+    spool.add('batch', [('new_upload', {})], max_depth=10)
+
+    [mail] = spool.claim(limit=1)
+
+    assert not spool.retry(mail, 'error', max_attempts=1, backoff=10, max_backoff=30)
+    assert spool.status('batch').failed == 1
+    assert spool.stats()['depth'] == 0
+    assert spool.stats()['dead'] == 1
+
+
+def test_ack_updates_batch_once(spool, clock):
+    spool.add('batch', [('new_upload', {}), ('new_upload', {})], max_depth=10)
+    first, second = spool.claim(limit=2)
+
+    spool.ack(first)
+    spool.ack(first)
+
+    assert spool.status('batch').as_dict() == {
+        'batch_id': 'batch', 'total': 2, 'sent': 1, 'failed': 0, 'pending': 1
+    }
+
+
+def test_full_spool_rejects_whole_batch(spool):
+    spool.add('first', [('new_upload', {})], max_depth=2)
+
+    with pytest.raises(SpoolFull):
+        spool.add('second', [('new_upload', {})] * 2, max_depth=2)
+    assert spool.status('second') is None
+    assert spool.stats()['depth'] == 1
+
+
+def test_compact_drops_old_dead_mails_and_finished_batches(spool, clock):
+    spool.add('batch', [('new_upload', {})], max_depth=10)
+    [mail] = spool.claim(limit=1)
+    spool.retry(mail, 'error', max_attempts=1, backoff=10, max_backoff=30)
+
+    spool.compact(retention=100)
+    assert spool.stats()['dead'] == 1
+    clock.now += 101
+    spool.compact(retention=100)
+
+    assert spool.stats()['dead'] == 0
+    assert spool.status('batch') is None
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from mailer.spool import MailSpool
+from mailer.workers import MailQueue, QueueFull
+
+
+class FakeMail:
+    name = 'fake'
+
+    def __init__(self, results):
+        self.delivered = []
+        self._results = results
+
+    def deliver(self, data):
+        self.delivered.append(data['email'])
+        return self._results.pop(0)
+
+
+class FakeCollector:
+    def __init__(self, mail):
+        self._mail = mail
+
+    def get_handler(self, template):
+        return self._mail
+
+
+def make_queue(tmp_path, mail, **kwargs):
+    return MailQueue(
+        spool=MailSpool(str(tmp_path / 'spool.sqlite3')),
+        collector=FakeCollector(mail),
+        workers=1,
+        backoff=0,
+        poll_interval=0.01,
+        **kwargs,
+    )
+
+
+def wait_until_done(queue, batch_id):
+    for _ in range(500):
+        if not (status := queue.status(batch_id)).pending:
+            return status
+        time.sleep(0.01)
+    raise AssertionError('Batch was not processed.')
+
+
+def test_failed_delivery_is_retried(tmp_path):
+    mail = FakeMail(results=[False, True])
+    queue = make_queue(tmp_path, mail)
+    queue.start()
+
+    status = queue.submit([(mail, {'email': 'a@example.com'})])
+
+    assert wait_until_done(queue, status.batch_id).sent == 1
+    assert mail.delivered == ['a@example.com', 'a@example.com']
+    assert queue.stats()['delivery']['failed_attempts'] == 1
+
+
+def test_mail_is_given_up_after_max_attempts(tmp_path):
+    mail = FakeMail(results=[False, False])
+    queue = make_queue(tmp_path, mail, max_attempts=2)
+    queue.start()
+
+    status = queue.submit([(mail, {'email': 'a@example.com'})])
+
+    assert wait_until_done(queue, status.batch_id).failed == 1
+    assert queue.stats()['spool']['dead'] == 1
+
+
+def test_batch_over_capacity_is_rejected(tmp_path):
+    mail = FakeMail(results=[])
+    queue = make_queue(tmp_path, mail, max_size=2)
+
+    with pytest.raises(QueueFull):
+        queue.submit([(mail, {'email': 'a@example.com'})] * 3)
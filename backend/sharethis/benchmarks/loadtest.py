@@ -0,0 +1,515 @@
+"""
+End-to-end load test of the upload, download and cleaner use cases.
+
+The real use cases run against local stand-ins: SQLite or a local Postgres given by
+--db, an in-process bucket and the mock mailer. Every scenario reports throughput,
+latency percentiles and peak RSS, and results are saved as JSON. The upload_memory
+scenario goes through the Flask app with memory tracing on and reports how many bytes
+are allocated per uploaded byte.
+
+    python benchmarks/loadtest.py --output results.json
+    python benchmarks/loadtest.py --output results.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+from werkzeug.datastructures import FileStorage
+
+from sharethis.adapters.bucket import IBucketStorageClient
+
+
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(__file__), 'scenarios.json')
+
+
+class InMemoryBucketStorageClient(IBucketStorageClient):
+    """
+    Thread-safe bucket kept in a dict. `latency` is added to every call which
+    would be a network round trip.
+
+    Only sizes of objects are kept and uploads are read in chunks, so the stand-in
+    adds nothing to memory measured by the benchmark.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, latency: float = 0.0):
+        self._latency = latency
+        self._lock = threading.Lock()
+        self._objects: dict[str, int] = {}
+        self._parts: dict[str, dict[int, int]] = {}
+
+    def _round_trip(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def count(self, prefix: str) -> int:
+        with self._lock:
+            return sum(key.startswith(prefix) for key in self._objects)
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._objects[key] = len(data)
+
+    def upload(self, key, file):
+        self._round_trip()
+        size = 0
+        while chunk := file.read(self.chunk_size):
+            size += len(chunk)
+        with self._lock:
+            self._objects[key] = size
+
+    def generate_temporary_access_link(self, key, content_type=None, content_disposition=None):
+        return f'http://bucket.local/{key}?signature=0'
+
+    def generate_temporary_upload_link(self, key, content_type=None, expires_in=None):
+        return {'url': f'http://bucket.local/{key}?signature=0', 'method': 'PUT', 'headers': {}}
+
+    def get_size(self, key):
+        self._round_trip()
+        with self._lock:
+            return self._objects.get(key)
+
+    def create_multipart_upload(self, key, content_type=None):
+        self._round_trip()
+        with self._lock:
+            self._parts[key] = {}
+        return key
+
+    def upload_part(self, key, upload_id, number, data):
+        self._round_trip()
+        with self._lock:
+            self._parts[key][number] = len(data)
+        return str(number)
+
+    def complete_multipart_upload(self, key, upload_id, parts, content_type=None):
+        self._round_trip()
+        with self._lock:
+            received = self._parts.pop(key)
+            self._objects[key] = sum(received[number] for number, _ in parts)
+
+    def abort_multipart_upload(self, key, upload_id):
+        with self._lock:
+            self._parts.pop(key, None)
+
+    def bulk_delete(self, to_delete: Iterable):
+        self._round_trip()
+        with self._lock:
+            for key in to_delete:
+                self._objects.pop(key, None)
+
+    def provision(self):
+        pass
+
+
+class PeakRSS:
+    """
+    Sample resident set size in a background thread and keep the maximum.
+    """
+    def __init__(self, interval: float = 0.01):
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self.peak = 0
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # Without procfs only the peak of the whole process is known (KiB on Linux).
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self._interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies: list[float]) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'p50': percentile(ordered, 0.50),
+        'p95': percentile(ordered, 0.95),
+        'p99': percentile(ordered, 0.99),
+        'max': ordered[-1] if ordered else 0.0,
+        'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+    }
+
+
+def linear_fit(points: list[tuple[float, float]]) -> tuple[float, float]:
+    """
+    Least squares line through (x, y) points.
+
+    Returns: (slope, intercept)
+    """
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0, mean_y
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    return slope, mean_y - slope * mean_x
+
+
+def unique_content(payload: bytes, size: int, number: int) -> bytes:
+    """
+    Return `size` bytes of the payload which differ for every `number`, so uploads
+    are not deduplicated by their content hash.
+    """
+    prefix = number.to_bytes(8, 'big')
+    return (prefix + payload[len(prefix):size])[:size]
+
+
+def run_concurrently(operation: Callable[[int], None], count: int, concurrency: int):
+    """
+    Returns: (latencies of successful operations, number of errors, elapsed seconds)
+    """
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(number: int):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            operation(number)
+        except Exception as e:
+            with lock:
+                errors += 1
+            print(f'Operation failed: {e!r}', file=sys.stderr)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(count)))
+    return latencies, errors, time.perf_counter() - start
+
+
+class LoadTest:
+    def __init__(self, bucket: InMemoryBucketStorageClient, seed: int = 0):
+        # Imported here, configuration is read from the environment prepared by main().
+        from sharethis.logic import use_cases
+        from sharethis.logic.dtos import UploadDTO
+        from sharethis.jobs import cleaner
+        self._use_cases = use_cases
+        self._cleaner = cleaner
+        self._bucket = bucket
+        self._random = random.Random(seed)
+        self._upload_dto = UploadDTO(
+            time_to_live=timedelta(days=1),
+            encryption_method=None,
+            email='loadtest@sharethis.space',
+        )
+
+    def upload(self, data: bytes, name: str = 'loadtest.bin') -> str:
+        file = FileStorage(
+            stream=io.BytesIO(data), filename=name, content_type='application/octet-stream'
+        )
+        return self._use_cases.UploadUseCase().upload(file, self._upload_dto).key
+
+    def _sizes(self, mix: list[list[int]], count: int) -> list[int]:
+        sizes, weights = zip(*mix)
+        return self._random.choices(sizes, weights=weights, k=count)
+
+    def upload_scenario(self, scenario: dict) -> dict:
+        sizes = self._sizes(scenario['sizes'], scenario['requests'])
+        payload = os.urandom(max(sizes))
+
+        latencies, errors, elapsed = run_concurrently(
+            lambda number: self.upload(unique_content(payload, sizes[number], number)),
+            scenario['requests'],
+            scenario['concurrency'],
+        )
+        return {
+            'operations': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'bytes_per_second': sum(sizes) / elapsed,
+            'latency': summarize(latencies),
+        }
+
+    def download_scenario(self, scenario: dict) -> dict:
+        keys = [self.upload(b'x' * 1024) for _ in range(scenario['files'])]
+        download = self._use_cases.DownloadUseCase().download
+
+        latencies, errors, elapsed = run_concurrently(
+            lambda number: download(keys[number % len(keys)]),
+            scenario['requests'],
+            scenario['concurrency'],
+        )
+        return {
+            'operations': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'latency': summarize(latencies),
+        }
+
+    def upload_memory_scenario(self, scenario: dict) -> dict:
+        """
+        Upload files of growing size one by one through the Flask app and fit peak
+        memory of a request against its size. Slope of the line is the number of bytes
+        allocated per uploaded byte, intercept is the fixed cost of a request.
+        """
+        import logging
+        from sharethis.entrypoints.api import app
+        from sharethis.infrastructure.main import get_memory_tracer
+        logging.getLogger('sharethis').setLevel(logging.WARNING)
+
+        client = app.test_client()
+        sizes = [size for size in scenario['sizes'] for _ in range(scenario['repeat'])]
+        payload = os.urandom(max(sizes))
+        data = json.dumps({'time_to_live': 1, 'encryption_method': None})
+        started_at = time.time()
+
+        def upload(number: int):
+            content = unique_content(payload, sizes[number], number)
+            response = client.post('/api/upload', data={
+                'file': (io.BytesIO(content), 'loadtest.bin'),
+                'data': data,
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f'Upload failed with {response.status_code}.')
+
+        # Requests of a process are traced one at a time, so they are sent sequentially.
+        latencies, errors, elapsed = run_concurrently(upload, len(sizes), concurrency=1)
+        traces = [
+            trace for trace in get_memory_tracer().store.list()
+            if trace['route'] == '/api/upload' and trace['started_at'] >= started_at
+        ]
+        slope, intercept = linear_fit([(trace['size'], trace['peak']) for trace in traces])
+        worst = max(traces, key=lambda trace: trace['peak'])
+        return {
+            'operations': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed,
+            'latency': summarize(latencies),
+            'memory': {
+                'traced_requests': len(traces),
+                'peak_bytes_per_byte': slope,
+                'fixed_overhead_bytes': intercept,
+                'peak_max': worst['peak'],
+                'top_allocations': worst['top_allocations'][:5],
+            },
+        }
+
+    def _insert_expired(self, count: int):
+        from sharethis.infrastructure.main import get_db
+        from sharethis.infrastructure.models import ContentMeta
+        from sharethis.services.uow import MainUnitOfWork
+
+        expired = datetime.now() - timedelta(days=1)
+        with MainUnitOfWork(get_db(), self._bucket) as uow:
+            for number in range(count):
+                key = f'expired-{number}-{self._random.getrandbits(64):016x}'
+                uow.content_meta.add(ContentMeta(
+                    key=key,
+                    name='expired.bin',
+                    content_type='application/octet-stream',
+                    expiration_date=expired,
+                    encryption_method=None,
+                ))
+                self._bucket.put(key, b'x')
+            uow.commit()
+
+    def cleaner_scenario(self, scenario: dict) -> dict:
+        self._insert_expired(scenario['records'])
+        latencies: list[float] = []
+        delete_expired_batch = self._cleaner.delete_expired_batch
+
+        def timed_batch(batch_size: int):
+            start = time.perf_counter()
+            deleted = delete_expired_batch(batch_size)
+            latencies.append(time.perf_counter() - start)
+            return deleted
+
+        # cleaner() looks the batch function up in its module on every call.
+        self._cleaner.delete_expired_batch = timed_batch
+        try:
+            start = time.perf_counter()
+            asyncio.run(self._cleaner.cleaner(
+                batch_size=scenario['batch_size'], concurrency=scenario['concurrency']
+            ))
+            elapsed = time.perf_counter() - start
+        finally:
+            self._cleaner.delete_expired_batch = delete_expired_batch
+        # Count returned by cleaner() overlaps on SQLite, the bucket tells what is really gone.
+        left = self._bucket.count('expired-')
+        deleted = scenario['records'] - left
+        return {
+            'operations': deleted,
+            'errors': left,
+            'elapsed': elapsed,
+            'throughput': deleted / elapsed,
+            # Latency of a single batch.
+            'latency': summarize(latencies),
+        }
+
+    def run(self, scenario: dict) -> dict:
+        run = getattr(self, f'{scenario["kind"]}_scenario')
+        with PeakRSS() as rss:
+            result = run(scenario)
+        return {**scenario, **result, 'peak_rss_bytes': rss.peak}
+
+
+def install_stand_ins(bucket: InMemoryBucketStorageClient):
+    from sharethis.infrastructure import main as infrastructure
+    from sharethis.jobs import cleaner, mails
+    from sharethis.logic import use_cases
+
+    for module in (infrastructure, cleaner, mails, use_cases):
+        module.get_bucket_storage_client = lambda: bucket
+    infrastructure.get_db().create_database()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print throughput change against a baseline.
+
+    Returns: True when any scenario is slower than the baseline by more than `tolerance`.
+    """
+    previous = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    regressed = False
+    for scenario in results['scenarios']:
+        if not (before := previous.get(scenario['name'])):
+            continue
+        change = scenario['throughput'] / before['throughput'] - 1
+        slower = change < -tolerance
+        regressed |= slower
+        print(
+            f'{scenario["name"]:<24} {before["throughput"]:>10.1f} -> '
+            f'{scenario["throughput"]:>10.1f} ops/s ({change:+.1%})'
+            f'{"  REGRESSION" if slower else ""}'
+        )
+    return regressed
+
+
+def over_memory_budget(result: dict) -> bool:
+    if (budget := result.get('max_peak_bytes_per_byte')) is None:
+        return False
+    if over := result['memory']['peak_bytes_per_byte'] > budget:
+        print(
+            f'{result["name"]:<24} {result["memory"]["peak_bytes_per_byte"]:.3f} bytes '
+            f'allocated per uploaded byte, budget is {budget}  REGRESSION'
+        )
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help='JSON list of scenarios.')
+    parser.add_argument('--only', nargs='*', help='Names of scenarios to run.')
+    parser.add_argument('--db', help='Connection string, a temporary SQLite file by default.')
+    parser.add_argument('--bucket-latency-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='File to save results to.')
+    parser.add_argument('--compare', help='Results of a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed throughput drop against --compare, 0.2 is 20%%.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sharethis-loadtest-')
+    os.environ.update({
+        'DB_CONNECTION_STRING': args.db or f'sqlite:///{workdir}/loadtest.sqlite3',
+        # Only to satisfy the configuration, the bucket is replaced by a stand-in.
+        'OBJECT_STORAGE_PROVIDER': 'AWS',
+        'AWS_BUCKET_URL': 'http://bucket.local',
+        'AWS_ACCESS_KEY': 'loadtest',
+        'AWS_SECRET_KEY': 'loadtest',
+        'AWS_BUCKET_NAME': 'loadtest',
+        'MAIL_SERVICE': 'mock',
+        'MEMORY_TRACING_ENABLED': 'True',
+        'MEMORY_TRACING_DIRECTORY': os.path.join(workdir, 'memory'),
+        'MEMORY_TRACING_CAPACITY': '10000',
+    })
+    bucket = InMemoryBucketStorageClient(latency=args.bucket_latency_ms / 1000)
+    install_stand_ins(bucket)
+
+    with open(args.scenarios) as scenarios_file:
+        scenarios = [
+            scenario for scenario in json.load(scenarios_file)
+            if not args.only or scenario['name'] in args.only
+        ]
+    load_test = LoadTest(bucket, seed=args.seed)
+    results = {
+        'started_at': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': os.environ['DB_CONNECTION_STRING'].split(':', 1)[0],
+        'bucket_latency_ms': args.bucket_latency_ms,
+        'scenarios': [],
+    }
+    for scenario in scenarios:
+        result = load_test.run(scenario)
+        results['scenarios'].append(result)
+        latency = result['latency']
+        print(
+            f'{result["name"]:<24} {result["throughput"]:>10.1f} ops/s  '
+            f'p50 {latency["p50"] * 1000:.1f} ms  p95 {latency["p95"] * 1000:.1f} ms  '
+            f'p99 {latency["p99"] * 1000:.1f} ms  errors {result["errors"]}  '
+            f'peak RSS {result["peak_rss_bytes"] / 2 ** 20:.0f} MiB'
+        )
+        if memory := result.get('memory'):
+            print(
+                f'{"":<24} {memory["peak_bytes_per_byte"]:.3f} bytes allocated per uploaded '
+                f'byte + {memory["fixed_overhead_bytes"] / 1024:.0f} KiB per request'
+            )
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    failed = any([over_memory_budget(result) for result in results['scenarios']])
+    if args.compare:
+        with open(args.compare) as baseline:
+            failed |= compare(results, json.load(baseline), args.tolerance)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,122 @@
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import io
 import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-from typing import Iterable, Optional
+from itertools import islice
+from typing import AsyncIterator, IO, Iterable, Iterator, Mapping, Optional
+from urllib.parse import urlencode
 
-from azure.core.exceptions import ResourceExistsError, AzureError
+import aiohttp
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, AzureError
 from azure.storage.blob import (
     BlobServiceClient,
     BlobClient,
+    BlobBlock,
     ContainerClient,
     ContentSettings,
     generate_blob_sas,
-    BlobSasPermissions, PartialBatchErrorException,
+    BlobSasPermissions,
 )
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import BaseClient
 from botocore.exceptions import ClientError, BotoCoreError
-
+from starlette.datastructures import UploadFile
 from werkzeug.datastructures import FileStorage
 
+from sharethis.infrastructure.metrics import time_methods
+
+
+# Validity of links returned by generate_temporary_access_link.
+TEMPORARY_ACCESS_LINK_TTL = timedelta(minutes=2)
+
 
 class BucketStorageError(Exception):
     pass
 
 
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _block_id(index: int) -> str:
+    # All block ids of a single blob have to be of the same length.
+    return f'{index:08d}'
+
+
+def stage_blocks(
+    blob_client: BlobClient,
+    stream: IO[bytes],
+    block_size: int,
+    max_concurrency: int,
+    first_block: bytes = b'',
+) -> list[BlobBlock]:
+    """
+    Read a stream in fixed-size blocks and stage them concurrently.
+
+    At most `max_concurrency` blocks are in flight, so memory used by a single
+    upload is bounded by roughly block_size * (max_concurrency + 1).
+
+    Args:
+        blob_client: client of the destination blob.
+        stream: readable binary stream.
+        block_size: number of bytes in a single block.
+        max_concurrency: maximum number of blocks staged at the same time.
+        first_block: data already read from the stream which starts the blob.
+    Returns: ordered list of staged blocks ready for `commit_block_list`.
+    """
+    blocks: list[BlobBlock] = []
+    in_flight: set[Future] = set()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while chunk := first_block or stream.read(block_size):
+            first_block = b''
+            if len(in_flight) >= max_concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            block_id = _block_id(len(blocks))
+            blocks.append(BlobBlock(block_id=block_id))
+            in_flight.add(executor.submit(blob_client.stage_block, block_id, chunk))
+        for future in wait(in_flight).done:
+            future.result()
+    return blocks
+
+
+class TransferProgress:
+    """
+    Thread-safe counter of transferred bytes used as a boto3 transfer callback.
+    """
+    def __init__(self):
+        self.transferred = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount: int):
+        with self._lock:
+            self.transferred += bytes_amount
+
+
 class IBucketStorageClient(ABC):
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        time_methods(cls, IBucketStorageClient.__abstractmethods__)
+
     @abstractmethod
     def upload(self, key: str, file: FileStorage):
         raise NotImplementedError
@@ -33,23 +125,95 @@ class IBucketStorageClient(ABC):
     def generate_temporary_access_link(
         self,
         key: str,
-        content_type: str = None,
-        content_disposition: str = None,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
     ):
         raise NotImplementedError
 
+    @abstractmethod
+    def generate_temporary_upload_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        expires_in: timedelta = timedelta(minutes=15),
+    ) -> dict:
+        """
+        Return a write-only link which lets a client upload an object directly to the bucket.
+
+        Returns: {'url': str, 'method': str, 'headers': dict}
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_size(self, key: str) -> Optional[int]:
+        """
+        Return size of a stored object in bytes or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_multipart_upload(
+        self, key: str, content_type: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Start an upload which is sent in numbered parts.
+
+        Returns: provider upload id or None if the provider does not need one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def upload_part(self, key: str, upload_id: Optional[str], number: int, data: bytes) -> str:
+        """
+        Upload a single part. Parts are numbered from 0 and can be sent in any order.
+
+        Returns: part identifier required to complete the upload.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete_multipart_upload(
+        self,
+        key: str,
+        upload_id: Optional[str],
+        parts: list[tuple[int, str]],
+        content_type: Optional[str] = None,
+    ):
+        """
+        Assemble the object from (number, part identifier) pairs ordered by number.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def abort_multipart_upload(self, key: str, upload_id: Optional[str]):
+        raise NotImplementedError
+
     @abstractmethod
     def bulk_delete(self, to_delete: Iterable):
         raise NotImplementedError
 
+    @abstractmethod
+    def provision(self):
+        """
+        Create the bucket if it does not exist yet.
+        """
+        raise NotImplementedError
+
 
 class AWSS3Client(IBucketStorageClient):
+    # Maximum number of keys accepted by a single delete_objects call.
+    bulk_delete_limit = 1000
+
     def __init__(
         self,
         url,
         access_key,
         secret_key,
         bucket_name,
+        upload_part_size: int = 8 * 1024 * 1024,
+        upload_max_concurrency: int = 10,
+        upload_multipart_threshold: int = 8 * 1024 * 1024,
+        upload_io_chunksize: int = 256 * 1024,
         logger: logging.Logger = logging.getLogger(__name__)
     ):
         self._client: BaseClient = boto3.client(
@@ -60,29 +224,60 @@ class AWSS3Client(IBucketStorageClient):
         )
         self._logger = logger
         self._bucket_name = bucket_name
+        self._transfer_config = TransferConfig(
+            multipart_threshold=upload_multipart_threshold,
+            multipart_chunksize=upload_part_size,
+            max_concurrency=upload_max_concurrency,
+            io_chunksize=upload_io_chunksize,
+            use_threads=upload_max_concurrency > 1,
+        )
+
+    def provision(self):
         self.create_bucket()
 
-    def create_bucket(self, bucket_name: str = None):
+    def create_bucket(self, bucket_name: Optional[str] = None):
         try:
             self._client.create_bucket(Bucket=bucket_name or self._bucket_name)
         except ClientError:
             self._logger.debug('Container already exists. Continue process.')
 
     def upload(self, key: str, file: FileStorage):
+        progress = TransferProgress()
+        start = time.monotonic()
         try:
-            self._client.upload_fileobj(Fileobj=file, Bucket=self._bucket_name, Key=key)
+            self._client.upload_fileobj(
+                Fileobj=file,
+                Bucket=self._bucket_name,
+                Key=key,
+                Config=self._transfer_config,
+                Callback=progress,
+            )
         except BotoCoreError as e:
             self._logger.warning('AWSS3Client encountered an error during file upload.')
             self._logger.exception(e)
             raise BucketStorageError('Upload error.')
+        self._log_throughput(key, progress.transferred, time.monotonic() - start)
+
+    def _log_throughput(self, key: str, size: int, elapsed: float):
+        if size < self._transfer_config.multipart_threshold:
+            parts = 1
+        else:
+            parts = math.ceil(size / self._transfer_config.multipart_chunksize)
+        self._logger.info(
+            f'Uploaded {key}: {size} bytes in {elapsed:.3f}s '
+            f'({size / max(elapsed, 1e-6):.0f} bytes/s, {parts} parts).'
+        )
 
     def generate_temporary_access_link(
-        self, key: str, content_type: str = None, content_disposition: str = None
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
     ):
         try:
             return self._client.generate_presigned_url(
                 ClientMethod='get_object',
-                ExpiresIn=timedelta(minutes=2).seconds,
+                ExpiresIn=int(TEMPORARY_ACCESS_LINK_TTL.total_seconds()),
                 Params={
                     'Bucket': self._bucket_name,
                     'Key': key,
@@ -97,38 +292,158 @@ class AWSS3Client(IBucketStorageClient):
             self._logger.exception(e)
             raise BucketStorageError('Presigned url creation error.')
 
-    def bulk_delete(self, to_delete: Iterable):
+    def generate_temporary_upload_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        expires_in: timedelta = timedelta(minutes=15),
+    ) -> dict:
+        params = {'Bucket': self._bucket_name, 'Key': key}
+        headers = {}
+        if content_type:
+            params['ContentType'] = headers['Content-Type'] = content_type
         try:
-            self._client.delete_objects(
+            url = self._client.generate_presigned_url(
+                ClientMethod='put_object',
+                ExpiresIn=int(expires_in.total_seconds()),
+                Params=params,
+            )
+        except BotoCoreError as e:
+            self._logger.warning(
+                'AWSS3Client encountered an error during presigned upload url creation.'
+            )
+            self._logger.exception(e)
+            raise BucketStorageError('Presigned url creation error.')
+        return {'url': url, 'method': 'PUT', 'headers': headers}
+
+    def get_size(self, key: str) -> Optional[int]:
+        try:
+            return self._client.head_object(Bucket=self._bucket_name, Key=key)['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            self._logger.warning('AWSS3Client encountered an error during object head.')
+            self._logger.exception(e)
+            raise BucketStorageError('Object metadata error.')
+        except BotoCoreError as e:
+            self._logger.warning('AWSS3Client encountered an error during object head.')
+            self._logger.exception(e)
+            raise BucketStorageError('Object metadata error.')
+
+    def create_multipart_upload(
+        self, key: str, content_type: Optional[str] = None
+    ) -> Optional[str]:
+        params = {'Bucket': self._bucket_name, 'Key': key}
+        if content_type:
+            params['ContentType'] = content_type
+        try:
+            return self._client.create_multipart_upload(**params)['UploadId']
+        except (BotoCoreError, ClientError) as e:
+            self._logger.warning('AWSS3Client encountered an error during multipart upload start.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+
+    def upload_part(self, key: str, upload_id: Optional[str], number: int, data: bytes) -> str:
+        try:
+            return self._client.upload_part(
                 Bucket=self._bucket_name,
-                Delete={
-                    'Objects': [{'Key': key} for key in to_delete],
-                    'Quiet': False,
-                }
+                Key=key,
+                UploadId=upload_id,
+                # S3 part numbers start from 1.
+                PartNumber=number + 1,
+                Body=data,
+            )['ETag']
+        except (BotoCoreError, ClientError) as e:
+            self._logger.warning('AWSS3Client encountered an error during part upload.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+
+    def complete_multipart_upload(
+        self,
+        key: str,
+        upload_id: Optional[str],
+        parts: list[tuple[int, str]],
+        content_type: Optional[str] = None,
+    ):
+        try:
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    'Parts': [{'PartNumber': number + 1, 'ETag': etag} for number, etag in parts]
+                },
             )
+        except (BotoCoreError, ClientError) as e:
+            self._logger.warning(
+                'AWSS3Client encountered an error during multipart upload completion.'
+            )
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+
+    def abort_multipart_upload(self, key: str, upload_id: Optional[str]):
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket_name, Key=key, UploadId=upload_id
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                self._logger.debug(f'Multipart upload of {key} does not exist. Continue process.')
+                return
+            self._logger.warning('AWSS3Client encountered an error during multipart upload abort.')
+            self._logger.exception(e)
+            raise BucketStorageError('Abort error.')
         except BotoCoreError as e:
-            self._logger.warning('AWSS3Client encountered an error during bulk file delete.')
+            self._logger.warning('AWSS3Client encountered an error during multipart upload abort.')
             self._logger.exception(e)
-            raise BucketStorageError('Delete error.')
+            raise BucketStorageError('Abort error.')
+
+    def bulk_delete(self, to_delete: Iterable):
+        for chunk in chunked(to_delete, self.bulk_delete_limit):
+            try:
+                response = self._client.delete_objects(
+                    Bucket=self._bucket_name,
+                    Delete={
+                        'Objects': [{'Key': key} for key in chunk],
+                        # Only errors are reported back.
+                        'Quiet': True,
+                    }
+                )
+            except (BotoCoreError, ClientError) as e:
+                self._logger.warning('AWSS3Client encountered an error during bulk file delete.')
+                self._logger.exception(e)
+                raise BucketStorageError('Delete error.')
+            if errors := response.get('Errors'):
+                self._logger.warning(f'AWSS3Client could not delete {len(errors)} objects.')
+                self._logger.debug(errors)
 
 
 class AzureBlobClient(IBucketStorageClient):
+    # Maximum number of sub-requests accepted by a single blob batch.
+    bulk_delete_limit = 256
+
     def __init__(
         self,
         connection_string,
         container_name,
+        upload_block_size: int = 4 * 1024 * 1024,
+        upload_max_concurrency: int = 4,
         logger: logging.Logger = logging.getLogger(__name__)
     ):
         self._logger = logger
         self._connection_string: str = connection_string
         self._container_name: str = container_name
+        self._upload_block_size = upload_block_size
+        self._upload_max_concurrency = upload_max_concurrency
         self._container_client: Optional[ContainerClient] = None
         self._blob_service_client: BlobServiceClient = BlobServiceClient.from_connection_string(
             self._connection_string
         )
+
+    def provision(self):
         self.create_container()
 
-    def create_container(self, container_name: str = None):
+    def create_container(self, container_name: Optional[str] = None):
         try:
             self._container_client = self._blob_service_client.create_container(
                 container_name or self._container_name
@@ -142,10 +457,20 @@ class AzureBlobClient(IBucketStorageClient):
                 container=self._container_name,
                 blob=key
             )
-            blob_client.upload_blob(
-                file.read(),
-                content_settings=ContentSettings(content_type=file.content_type)
+            content_settings = ContentSettings(content_type=file.content_type)
+            first_block = file.read(self._upload_block_size)
+            # Small files fit into a single request, so there is no need to stage blocks.
+            if len(first_block) < self._upload_block_size:
+                blob_client.upload_blob(first_block, content_settings=content_settings)
+                return
+            blocks = stage_blocks(
+                blob_client,
+                file.stream,
+                block_size=self._upload_block_size,
+                max_concurrency=self._upload_max_concurrency,
+                first_block=first_block,
             )
+            blob_client.commit_block_list(blocks, content_settings=content_settings)
         # Catch any Azure error because we don't need any specific error for now.
         # We want to map client specific errors into internal errors.
         except AzureError as e:
@@ -154,7 +479,10 @@ class AzureBlobClient(IBucketStorageClient):
             raise BucketStorageError('Upload error.')
 
     def generate_temporary_access_link(
-        self, key: str, content_type: str = None, content_disposition: str = None
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
     ):
         sas = generate_blob_sas(
             account_name=self._blob_service_client.account_name,
@@ -163,20 +491,481 @@ class AzureBlobClient(IBucketStorageClient):
             container_name=self._container_name,
             blob_name=key,
             permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(minutes=2),
+            expiry=datetime.utcnow() + TEMPORARY_ACCESS_LINK_TTL,
             content_type=content_type,
             content_disposition=content_disposition,
         )
+        return self._blob_url(key, sas)
+
+    def generate_temporary_upload_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        expires_in: timedelta = timedelta(minutes=15),
+    ) -> dict:
+        sas = generate_blob_sas(
+            account_name=self._blob_service_client.account_name,
+            account_key=self._blob_service_client.credential.account_key,
+
+            container_name=self._container_name,
+            blob_name=key,
+            permission=BlobSasPermissions(create=True, write=True),
+            expiry=datetime.utcnow() + expires_in,
+        )
+        headers = {'x-ms-blob-type': 'BlockBlob'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        return {'url': self._blob_url(key, sas), 'method': 'PUT', 'headers': headers}
+
+    def get_size(self, key: str) -> Optional[int]:
+        blob_client: BlobClient = self._blob_service_client.get_blob_client(
+            container=self._container_name,
+            blob=key
+        )
+        try:
+            return blob_client.get_blob_properties().size
+        except ResourceNotFoundError:
+            return None
+        except AzureError as e:
+            self._logger.warning('AzureBlobClient encountered an error during blob properties.')
+            self._logger.exception(e)
+            raise BucketStorageError('Object metadata error.')
+
+    def create_multipart_upload(
+        self, key: str, content_type: Optional[str] = None
+    ) -> Optional[str]:
+        # Blocks are staged directly against the blob, so there is no upload id.
+        return None
+
+    def upload_part(self, key: str, upload_id: Optional[str], number: int, data: bytes) -> str:
+        block_id = _block_id(number)
+        try:
+            self._blob_service_client.get_blob_client(
+                container=self._container_name,
+                blob=key
+            ).stage_block(block_id, data)
+        except AzureError as e:
+            self._logger.warning('AzureBlobClient encountered an error during block upload.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+        return block_id
+
+    def complete_multipart_upload(
+        self,
+        key: str,
+        upload_id: Optional[str],
+        parts: list[tuple[int, str]],
+        content_type: Optional[str] = None,
+    ):
+        try:
+            self._blob_service_client.get_blob_client(
+                container=self._container_name,
+                blob=key
+            ).commit_block_list(
+                [BlobBlock(block_id=block_id) for _, block_id in parts],
+                content_settings=ContentSettings(content_type=content_type),
+            )
+        except AzureError as e:
+            self._logger.warning('AzureBlobClient encountered an error during block list commit.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+
+    def abort_multipart_upload(self, key: str, upload_id: Optional[str]):
+        # Uncommitted blocks cannot be removed explicitly.
+        # Azure garbage collects them after a week.
+        self._logger.debug(f'Uncommitted blocks of {key} are left for Azure to collect.')
+
+    def _blob_url(self, key: str, sas: str) -> str:
         return 'https://{}.blob.core.windows.net/{}/{}?{}'.format(
             self._blob_service_client.account_name, self._container_name, key, sas
         )
 
     def bulk_delete(self, to_delete: Iterable):
         container_client = self._blob_service_client.get_container_client(self._container_name)
+        for chunk in chunked(to_delete, self.bulk_delete_limit):
+            try:
+                # Pending direct uploads may expire before any blob was written,
+                # so missing blobs are not treated as a failure.
+                result = list(
+                    container_client.delete_blobs(*chunk, raise_on_any_failure=False)
+                )
+                self._logger.debug(result)
+            except AzureError as e:
+                self._logger.warning(
+                    'AzureBlobClient encountered an error during bulk blob delete.'
+                )
+                self._logger.exception(e)
+                raise BucketStorageError('Delete error.')
+            if failed := [r for r in result if r.status_code not in (202, 404)]:
+                self._logger.warning(
+                    'AzureBlobClient encountered an error during bulk blob delete.'
+                )
+                self._logger.debug(failed)
+                raise BucketStorageError('Delete error.')
+
+
+class LocalFilesystemClient(IBucketStorageClient):
+    """
+    Keeps objects as files in a directory tree on a local disk.
+
+    Objects are spread over two levels of directories named after the hash of the key,
+    so no directory grows too big. Every file is written next to its destination and
+    renamed over it, so readers never see a partial object.
+
+    Links point at the API, which only checks their signature. The file itself is sent
+    by nginx from an internal location aliased to `root`, see X-Accel-Redirect.
+    """
+    # Number of keys unlinked between progress logs.
+    bulk_delete_limit = 1000
+    # Keys are generated by the application, anything else is refused.
+    key_pattern = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9._-]*$')
+    multipart_directory = '.multipart'
+
+    def __init__(
+        self,
+        root: str,
+        secret: str,
+        url: str,
+        internal_location: str = '/protected',
+        io_chunksize: int = 1024 * 1024,
+        logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self._root = os.path.abspath(root)
+        self._secret = secret.encode()
+        self._url = url.rstrip('/')
+        self._internal_location = internal_location.rstrip('/')
+        self._io_chunksize = io_chunksize
+        self._logger = logger
+
+    def provision(self):
+        os.makedirs(os.path.join(self._root, self.multipart_directory), exist_ok=True)
+
+    def _relative_path(self, key: str) -> str:
+        if not self.key_pattern.match(key):
+            raise BucketStorageError('Invalid key.')
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f'{digest[:2]}/{digest[2:4]}/{key}'
+
+    def path(self, key: str) -> str:
+        return os.path.join(self._root, self._relative_path(key))
+
+    def internal_url(self, key: str) -> str:
+        """
+        Location to hand over to nginx in the X-Accel-Redirect header.
+        """
+        return f'{self._internal_location}/{self._relative_path(key)}'
+
+    def _multipart_path(self, upload_id: Optional[str]) -> str:
+        if not upload_id or not self.key_pattern.match(upload_id):
+            raise BucketStorageError('Invalid upload id.')
+        return os.path.join(self._root, self.multipart_directory, upload_id)
+
+    def _write_atomically(self, path: str, chunks: Iterable[IO[bytes]]):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for source in chunks:
+                    shutil.copyfileobj(source, destination, self._io_chunksize)
+                destination.flush()
+                os.fsync(destination.fileno())
+            # nginx reads the files as a different user.
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temporary)
+            raise
+
+    def upload(self, key: str, file: FileStorage | IO[bytes]):
+        start = time.monotonic()
+        path = self.path(key)
+        try:
+            self._write_atomically(
+                path, [file.stream if isinstance(file, FileStorage) else file]
+            )
+            size = os.path.getsize(path)
+        except OSError as e:
+            self._logger.warning('LocalFilesystemClient encountered an error during file upload.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+        elapsed = time.monotonic() - start
+        self._logger.info(
+            f'Uploaded {key}: {size} bytes in {elapsed:.3f}s '
+            f'({size / max(elapsed, 1e-6):.0f} bytes/s).'
+        )
+
+    def _signature(self, method: str, key: str, expires: int, headers: dict) -> str:
+        message = '\n'.join(
+            [method, key, str(expires), *(f'{name}={headers[name]}' for name in sorted(headers))]
+        )
+        return hmac.new(self._secret, message.encode(), hashlib.sha256).hexdigest()
+
+    def _signed_url(self, method: str, key: str, expires_in: timedelta, headers: dict) -> str:
+        self._relative_path(key)
+        expires = int(time.time() + expires_in.total_seconds())
+        query = {
+            **headers,
+            'expires': expires,
+            'signature': self._signature(method, key, expires, headers),
+        }
+        return f'{self._url}/{key}?{urlencode(query)}'
+
+    def verify_link(self, method: str, key: str, params: Mapping[str, str]) -> Optional[dict]:
+        """
+        Check a link made by this client.
+
+        Returns: response headers the link was signed with
+            or None if the link is forged or expired.
+        """
+        headers = {
+            name: params[name]
+            for name in ('content_type', 'content_disposition')
+            if name in params
+        }
+        try:
+            expires = int(params.get('expires', ''))
+        except ValueError:
+            return None
+        expected = self._signature(method, key, expires, headers)
+        if not hmac.compare_digest(expected, params.get('signature', '')):
+            return None
+        if expires < time.time() or not self.key_pattern.match(key):
+            return None
+        return headers
+
+    def generate_temporary_access_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+    ):
+        headers = {}
+        if content_type:
+            headers['content_type'] = content_type
+        if content_disposition:
+            headers['content_disposition'] = content_disposition
+        return self._signed_url('GET', key, TEMPORARY_ACCESS_LINK_TTL, headers)
+
+    def generate_temporary_upload_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        expires_in: timedelta = timedelta(minutes=15),
+    ) -> dict:
+        # Content type is known from the metadata, the file keeps only the bytes.
+        url = self._signed_url('PUT', key, expires_in, {})
+        return {'url': url, 'method': 'PUT', 'headers': {}}
+
+    def get_size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self._logger.warning('LocalFilesystemClient encountered an error during file stat.')
+            self._logger.exception(e)
+            raise BucketStorageError('Object metadata error.')
+
+    def create_multipart_upload(
+        self, key: str, content_type: Optional[str] = None
+    ) -> Optional[str]:
+        upload_id = uuid.uuid4().hex
+        try:
+            os.makedirs(self._multipart_path(upload_id))
+        except OSError as e:
+            self._logger.warning(
+                'LocalFilesystemClient encountered an error during multipart upload start.'
+            )
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+        return upload_id
+
+    def upload_part(self, key: str, upload_id: Optional[str], number: int, data: bytes) -> str:
+        part = _block_id(number)
+        try:
+            self._write_atomically(
+                os.path.join(self._multipart_path(upload_id), part), [io.BytesIO(data)]
+            )
+        except OSError as e:
+            self._logger.warning('LocalFilesystemClient encountered an error during part upload.')
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+        return part
+
+    def complete_multipart_upload(
+        self,
+        key: str,
+        upload_id: Optional[str],
+        parts: list[tuple[int, str]],
+        content_type: Optional[str] = None,
+    ):
+        directory = self._multipart_path(upload_id)
+        try:
+            with contextlib.ExitStack() as stack:
+                self._write_atomically(self.path(key), [
+                    stack.enter_context(open(os.path.join(directory, part), 'rb'))
+                    for _, part in parts
+                ])
+        except OSError as e:
+            self._logger.warning(
+                'LocalFilesystemClient encountered an error during multipart upload completion.'
+            )
+            self._logger.exception(e)
+            raise BucketStorageError('Upload error.')
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def abort_multipart_upload(self, key: str, upload_id: Optional[str]):
+        shutil.rmtree(self._multipart_path(upload_id), ignore_errors=True)
+
+    def bulk_delete(self, to_delete: Iterable):
+        # Keys of a batch are grouped by directory, so every directory is resolved once
+        # and its files are unlinked relative to an open descriptor.
+        for chunk in chunked(to_delete, self.bulk_delete_limit):
+            by_directory: dict[str, list[str]] = defaultdict(list)
+            for key in chunk:
+                directory, name = os.path.split(self.path(key))
+                by_directory[directory].append(name)
+            missing = 0
+            try:
+                for directory, names in by_directory.items():
+                    missing += self._unlink_all(directory, names)
+            except OSError as e:
+                self._logger.warning(
+                    'LocalFilesystemClient encountered an error during bulk file delete.'
+                )
+                self._logger.exception(e)
+                raise BucketStorageError('Delete error.')
+            self._logger.debug(f'Deleted {len(chunk) - missing} files, {missing} were missing.')
+
+    @staticmethod
+    def _unlink_all(directory: str, names: list[str]) -> int:
+        missing = 0
+        try:
+            directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except FileNotFoundError:
+            # Pending direct uploads may expire before any file was written.
+            return len(names)
+        try:
+            for name in names:
+                try:
+                    os.unlink(name, dir_fd=directory_fd)
+                except FileNotFoundError:
+                    missing += 1
+        finally:
+            os.close(directory_fd)
+        return missing
+
+
+class IAsyncBucketStorageClient(ABC):
+    """
+    Bucket client for the ASGI entrypoint. Transfers do not block the event loop.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        time_methods(cls, IAsyncBucketStorageClient.__abstractmethods__)
+
+    @abstractmethod
+    async def upload(self, key: str, file: UploadFile, size: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def generate_temporary_access_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+
+class AsyncBucketStorageClient(IAsyncBucketStorageClient):
+    """
+    Streams uploads with aiohttp to write-only links of a regular bucket client.
+
+    Signing links needs no IO, so it is left to the wrapped client, which works with
+    both S3 and Azure. An upload is sent as a single PUT, which both providers accept
+    for objects up to 5 GB.
+    """
+    def __init__(
+        self,
+        client: IBucketStorageClient,
+        io_chunksize: int = 256 * 1024,
+        max_connections: int = 1000,
+        logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self._client = client
+        self._io_chunksize = io_chunksize
+        self._max_connections = max_connections
+        self._logger = logger
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def _http(self) -> aiohttp.ClientSession:
+        # Session has to be created within the running event loop.
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+            )
+        return self._session
+
+    async def _read_chunks(self, file: UploadFile) -> AsyncIterator[bytes]:
+        while chunk := await file.read(self._io_chunksize):
+            yield chunk
+
+    async def upload(self, key: str, file: UploadFile, size: int):
+        link = self._client.generate_temporary_upload_link(key, file.content_type)
+        start = time.monotonic()
         try:
-            result = container_client.delete_blobs(*to_delete)
-            self._logger.debug(result)
-        except PartialBatchErrorException as e:
-            self._logger.warning('AzureBlobClient encountered an error during bulk blob delete.')
+            async with self._http.request(
+                link['method'],
+                link['url'],
+                data=self._read_chunks(file),
+                # Both providers reject chunked transfer encoding.
+                headers={**link['headers'], 'Content-Length': str(size)},
+            ) as response:
+                if response.status >= 300:
+                    self._logger.warning(
+                        f'AsyncBucketStorageClient got {response.status} during file upload.'
+                    )
+                    self._logger.debug(await response.text())
+                    raise BucketStorageError('Upload error.')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._logger.warning(
+                'AsyncBucketStorageClient encountered an error during file upload.'
+            )
             self._logger.exception(e)
-            raise BucketStorageError('Delete error.')
+            raise BucketStorageError('Upload error.')
+        elapsed = time.monotonic() - start
+        self._logger.info(
+            f'Uploaded {key}: {size} bytes in {elapsed:.3f}s '
+            f'({size / max(elapsed, 1e-6):.0f} bytes/s).'
+        )
+
+    def generate_temporary_access_link(
+        self,
+        key: str,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+    ):
+        return self._client.generate_temporary_access_link(key, content_type, content_disposition)
+
+    async def delete(self, key: str):
+        # Rare clean up path, so the blocking client is used from a thread.
+        await asyncio.to_thread(self._client.bulk_delete, [key])
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,9 +1,22 @@
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
+from datetime import timedelta
+from functools import lru_cache
+from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from sharethis.infrastructure.circuit_breaker import CircuitBreaker
 from sharethis.infrastructure.config import current_config
+from sharethis.infrastructure.metrics import timed
+
+
+class MailServiceError(Exception):
+    pass
 
 
 class IMailServiceInterface(ABC):
@@ -12,36 +25,144 @@ class IMailServiceInterface(ABC):
 
     @abstractmethod
     def send_new_upload_mail(self, url, email: str):
+        """
+        Raises:
+            MailServiceError
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def send_new_batch_upload_mail(self, urls: list[str], email: str):
+        """
+        Raises:
+            MailServiceError
+        """
         raise NotImplementedError
 
+    def send(self, template: str, payload: dict):
+        """
+        Send a mail stored in the outbox.
+
+        Raises:
+            MailServiceError
+        """
+        match template:
+            case 'new_upload':
+                self.send_new_upload_mail(**payload)
+            case 'new_batch_upload':
+                self.send_new_batch_upload_mail(**payload)
+            case _:
+                raise MailServiceError(f'Unknown mail template: {template}.')
+
 
 class MailServiceMock(IMailServiceInterface):
     def send_new_upload_mail(self, url, email: str):
         self._logger.debug(f'{url} to {email}')
         self._logger.info('[mock] New upload mail sent successfully.')
 
+    def send_new_batch_upload_mail(self, urls: list[str], email: str):
+        self._logger.debug(f'{urls} to {email}')
+        self._logger.info('[mock] New batch upload mail sent successfully.')
+
 
 class MailService(IMailServiceInterface):
+    """
+    HTTP client of the mailer. Keeps connections alive in a pool, retries
+    failed connections with backoff and fails fast through a circuit breaker
+    while the mailer is down. A request which reached the mailer is not sent
+    again, the outbox retries it later.
+    """
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = 4,
+        retries: int = 3,
+        timeout: float = 2,
+        breaker: Optional[CircuitBreaker] = None,
+        *args,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._url = url
+        self._timeout = timeout
+        self._breaker = breaker or CircuitBreaker(5, timedelta(seconds=30))
+        self._session = requests.Session()
+        self._session.mount(url, HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            # POST is not idempotent, so read errors and error responses are not
+            # retried, a mail could be delivered twice.
+            max_retries=Retry(total=retries, backoff_factor=0.2),
+        ))
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'errors': 0, 'rejected': 0, 'latency_seconds': 0.0}
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self._stats, 'circuit': self._breaker.state}
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    @timed('MailService.send_new_upload_mail')
     def send_new_upload_mail(self, url, email: str):
         self._logger.debug(f'{url} to {email}')
+        self._post({'url': url, 'email': email, 'template': 'new_upload'})
+        self._logger.info('New upload mail sent successfully.')
+
+    @timed('MailService.send_new_batch_upload_mail')
+    def send_new_batch_upload_mail(self, urls: list[str], email: str):
+        self._logger.debug(f'{urls} to {email}')
+        self._post({'urls': urls, 'email': email, 'template': 'new_batch_upload'})
+        self._logger.info('New batch upload mail sent successfully.')
+
+    def _post(self, data: dict):
+        if not self._breaker.allow():
+            self._count(rejected=1)
+            raise MailServiceError('Mail service is unavailable.')
+        start = time.monotonic()
         try:
-            response = requests.post(
-                current_config.MAIL_SERVICE,
-                json={'url': url, 'email': email, 'template': 'new_upload'},
-                timeout=2
-            )
-            self._logger.info('New upload mail sent successfully.')
-            self._logger.debug(response.text)
-        except requests.exceptions.ConnectionError as e:
-            self._logger.critical(str(e))
-            self._logger.critical('Could not send mail.')
-        else:
-            if response.status_code not in [200, 201, 202]:
-                self._logger.critical(f'Could not send email.: {response.status_code}')
-                self._logger.debug(response.text)
-
-
-def get_mail_service(mode=current_config.MAIL_SERVICE):
+            try:
+                response = self._session.post(
+                    self._url,
+                    json=data,
+                    timeout=self._timeout
+                )
+            except requests.exceptions.RequestException as e:
+                self._breaker.record_failure()
+                self._count(requests=1, errors=1, latency_seconds=time.monotonic() - start)
+                self._logger.warning(str(e))
+                raise MailServiceError('Could not send mail.')
+            # Mailer which rejects a mail with 4xx is up, only 5xx counts against it.
+            if response.status_code >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
+        finally:
+            # A trial call has to settle the breaker, even when it ends with an
+            # unexpected error. Otherwise it stays half open and rejects every mail.
+            self._breaker.release()
+        self._logger.debug(response.text)
+        if response.status_code not in [200, 201, 202]:
+            self._count(requests=1, errors=1, latency_seconds=time.monotonic() - start)
+            raise MailServiceError(f'Could not send email.: {response.status_code}')
+        self._count(requests=1, latency_seconds=time.monotonic() - start)
+
+
+@lru_cache(maxsize=None)
+def get_mail_service(mode=current_config.MAIL_SERVICE) -> IMailServiceInterface:
+    # One long-living instance per process, so its connection pool is reused.
     if not mode or mode == 'mock':
         return MailServiceMock()
-    return MailService()
+    return MailService(
+        url=mode,
+        pool_size=current_config.MAIL_SERVICE_POOL_SIZE,
+        retries=current_config.MAIL_SERVICE_RETRIES,
+        timeout=current_config.MAIL_SERVICE_TIMEOUT,
+        breaker=CircuitBreaker(
+            failure_threshold=current_config.MAIL_SERVICE_BREAKER_THRESHOLD,
+            reset_timeout=timedelta(seconds=current_config.MAIL_SERVICE_BREAKER_RESET_SECONDS),
+        ),
+    )
@@ -1,11 +1,31 @@
 import datetime
 import logging
 from abc import ABC
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Optional
 
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, SessionTransaction
 from werkzeug.datastructures import FileStorage
 
-from sharethis.adapters.bucket import IBucketStorageClient
-from sharethis.infrastructure.models import ContentMeta
+from starlette.datastructures import UploadFile
+
+from sharethis.adapters.bucket import (
+    IAsyncBucketStorageClient,
+    IBucketStorageClient,
+    TEMPORARY_ACCESS_LINK_TTL,
+)
+from sharethis.infrastructure.cache import TTLCache
+from sharethis.infrastructure.models import (
+    Blob,
+    ContentMeta,
+    ContentStatus,
+    MailOutbox,
+    UploadSession,
+    UploadSessionPart,
+)
 
 
 class RepositoryException(Exception):
@@ -16,6 +36,34 @@ class EntityDoesNotExist(RepositoryException):
     pass
 
 
+@dataclass(frozen=True)
+class ContentMetaSnapshot:
+    """
+    Immutable copy of ContentMeta which can be safely shared between requests.
+    """
+    key: str
+    name: str
+    content_type: str
+    expiration_date: datetime.datetime
+    encryption_method: Optional[str]
+    blob_key: Optional[str] = None
+
+    @property
+    def object_key(self) -> str:
+        return self.blob_key or self.key
+
+    @classmethod
+    def from_model(cls, instance: ContentMeta) -> 'ContentMetaSnapshot':
+        return cls(
+            key=instance.key,
+            name=instance.name,
+            content_type=instance.content_type,
+            expiration_date=instance.expiration_date,
+            encryption_method=instance.encryption_method,
+            blob_key=instance.blob_key,
+        )
+
+
 class IRepository(ABC):
     def __init__(
         self,
@@ -30,6 +78,12 @@ class IBucketStorageRepository(IRepository):
         super().__init__(*args, **kwargs)
 
 
+class IAsyncBucketStorageRepository(IRepository):
+    def __init__(self, client: IAsyncBucketStorageClient, *args, **kwargs):
+        self._client = client
+        super().__init__(*args, **kwargs)
+
+
 class ISQLAlchemyRepository(IRepository):
     def __init__(self, session, *args, **kwargs):
         self._session = session
@@ -37,6 +91,13 @@ class ISQLAlchemyRepository(IRepository):
 
 
 class ContentRepository(IBucketStorageRepository):
+    # Shared by all instances in a process. The same link is handed out until
+    # shortly before it expires, so clients always have time to use it.
+    download_link_cache = TTLCache(
+        maxsize=4096,
+        ttl=TEMPORARY_ACCESS_LINK_TTL - datetime.timedelta(seconds=30),
+    )
+
     def upload(self, key, file: FileStorage):
         self._client.upload(key, file)
 
@@ -45,29 +106,172 @@ class ContentRepository(IBucketStorageRepository):
             self._client.bulk_delete(to_delete)
 
     def presigned_download_link(self, key, content_type, file_name):
-        return self._client.generate_temporary_access_link(
-            key, content_type, f'attachment; filename={file_name}'
+        content_disposition = f'attachment; filename={file_name}'
+        return ContentRepository.download_link_cache.get_or_set(
+            (key, content_type, content_disposition),
+            lambda: self._client.generate_temporary_access_link(
+                key, content_type, content_disposition
+            ),
         )
 
+    def presigned_upload_link(self, key, content_type) -> dict:
+        return self._client.generate_temporary_upload_link(key, content_type)
+
+    def size(self, key):
+        return self._client.get_size(key)
+
+    def start_multipart_upload(self, key, content_type):
+        return self._client.create_multipart_upload(key, content_type)
+
+    def upload_part(self, key, upload_id, number, data: bytes):
+        return self._client.upload_part(key, upload_id, number, data)
+
+    def complete_multipart_upload(self, key, upload_id, parts, content_type):
+        self._client.complete_multipart_upload(key, upload_id, parts, content_type)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self._client.abort_multipart_upload(key, upload_id)
+
+
+class AsyncContentRepository(IAsyncBucketStorageRepository):
+    # Link generation does no IO. Links are shared with ContentRepository.
+    presigned_download_link = ContentRepository.presigned_download_link
+
+    async def upload(self, key, file: UploadFile, size: int):
+        await self._client.upload(key, file, size)
+
+    async def delete(self, key):
+        await self._client.delete(key)
+
 
 class ContentMetaRepository(ISQLAlchemyRepository):
+    # Uploaded metadata never changes, so snapshots are only bounded by the row expiration.
+    # The cache is local to a process. A record deleted before its expiration by another
+    # process, e.g. a cleaner replica, is still served here for at most snapshot_ttl.
+    snapshot_ttl = datetime.timedelta(minutes=10)
+    snapshot_cache = TTLCache(maxsize=16384, ttl=snapshot_ttl)
+    # Postgres channel which announces expiration dates of new records to the cleaner.
+    expiration_channel = 'sharethis_content_expiration'
+    notify_dialects = {'postgresql'}
+    # Session.info key of expiration dates announced on commit.
+    pending_expirations = 'sharethis_pending_expirations'
+
     def add(self, instance: ContentMeta):
         self._session.add(instance)
+        self.notify_expiration_on_commit(self._session, instance.expiration_date)
+
+    def add_all(self, instances: list[ContentMeta]):
+        """
+        Insert many records with a single statement.
+        """
+        if not instances:
+            return
+        self._session.bulk_save_objects(instances)
+        self.notify_expiration_on_commit(
+            self._session, min(instance.expiration_date for instance in instances)
+        )
+
+    @classmethod
+    def notify_expiration_on_commit(cls, session: Session, expiration_date: datetime.datetime):
+        # NOTIFY is sent by notify_pending_expirations right before commit, so adding
+        # a record does not open a transaction, eg. for the whole bucket transfer.
+        session.info.setdefault(cls.pending_expirations, []).append(expiration_date)
+
+    @classmethod
+    def notify_expiration_statement(cls, expiration_date: datetime.datetime):
+        # NOTIFY is transactional, so the cleaner is only told about committed records.
+        return select(func.pg_notify(cls.expiration_channel, expiration_date.isoformat()))
+
+    def next_expiration_date(self) -> Optional[datetime.datetime]:
+        return self._session.query(func.min(ContentMeta.expiration_date)).scalar()
 
     def delete_by_key(self, key):
         self._session.query(ContentMeta).filter(ContentMeta.key == key).delete()
+        self.snapshot_cache.pop(key)
+
+    def delete_expired(self, limit: int = 1000) -> list[tuple[str, Optional[str]]]:
+        """
+        Delete at most `limit` expired records, oldest first.
+        Rows locked by other transactions are skipped, so concurrent callers
+        get disjoint batches.
 
-    def delete_expired(self):
-        records_to_delete = self._session.query(ContentMeta).filter(
+        Returns: (key, blob key) pairs of deleted records.
+        """
+        expired_ids = select(ContentMeta.id).where(
             ContentMeta.expiration_date <= datetime.datetime.now()
+        ).order_by(ContentMeta.expiration_date).limit(limit).with_for_update(skip_locked=True)
+        if self._session.get_bind().dialect.full_returning:
+            deleted = [tuple(row) for row in self._session.execute(
+                delete(ContentMeta)
+                .where(ContentMeta.id.in_(expired_ids))
+                .returning(ContentMeta.key, ContentMeta.blob_key)
+                .execution_options(synchronize_session=False)
+            )]
+        else:
+            # Without RETURNING (SQLite) there is no row locking either,
+            # so concurrent callers may get overlapping batches.
+            rows = self._session.execute(
+                select(ContentMeta.id, ContentMeta.key, ContentMeta.blob_key)
+                .where(ContentMeta.id.in_(expired_ids))
+            ).all()
+            self._session.execute(
+                delete(ContentMeta)
+                .where(ContentMeta.id.in_([row.id for row in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            deleted = [(row.key, row.blob_key) for row in rows]
+        for key, _ in deleted:
+            self.snapshot_cache.pop(key)
+        return deleted
+
+    def retrieve_non_expired_by_key(self, key):
+        """
+        Raises:
+            sqlalchemy.exc.MultipleResultsFound
+            sqlalchemy.exc.NoResultFound
+        """
+        return self._session.execute(self.non_expired_by_key_statement(key)).scalar_one()
+
+    @staticmethod
+    def non_expired_by_key_statement(key):
+        return select(ContentMeta).where(
+            ContentMeta.key == key,
+            ContentMeta.status == ContentStatus.UPLOADED,
+            ContentMeta.expiration_date > datetime.datetime.now()
         )
-        keys_to_delete = list(
-            map(lambda instance: getattr(instance, 'key'), records_to_delete.all())
+
+    def retrieve_non_expired_snapshot_by_key(self, key) -> ContentMetaSnapshot:
+        """
+        Read-through cached variant of retrieve_non_expired_by_key.
+        A cache hit does not touch the database, so it may return a record deleted
+        by another process within the last snapshot_ttl, but never an expired one.
+
+        Raises:
+            sqlalchemy.exc.MultipleResultsFound
+            sqlalchemy.exc.NoResultFound
+        """
+        if snapshot := self.cached_snapshot(key):
+            return snapshot
+        return self.cache_snapshot(self.retrieve_non_expired_by_key(key))
+
+    @classmethod
+    def cached_snapshot(cls, key) -> Optional[ContentMetaSnapshot]:
+        snapshot = cls.snapshot_cache.get(key)
+        if snapshot and snapshot.expiration_date > datetime.datetime.now():
+            return snapshot
+        return None
+
+    @classmethod
+    def cache_snapshot(cls, instance: ContentMeta) -> ContentMetaSnapshot:
+        snapshot = ContentMetaSnapshot.from_model(instance)
+        cls.snapshot_cache.set(
+            snapshot.key,
+            snapshot,
+            ttl=min(cls.snapshot_ttl, snapshot.expiration_date - datetime.datetime.now()),
         )
-        records_to_delete.delete()
-        return keys_to_delete
+        return snapshot
 
-    def retrieve_non_expired_by_key(self, key):
+    def retrieve_pending_by_key(self, key):
         """
         Raises:
             sqlalchemy.exc.MultipleResultsFound
@@ -75,5 +279,219 @@ class ContentMetaRepository(ISQLAlchemyRepository):
         """
         return self._session.query(ContentMeta).filter(
             ContentMeta.key == key,
+            ContentMeta.status == ContentStatus.PENDING,
             ContentMeta.expiration_date > datetime.datetime.now()
+        ).with_for_update().one()
+
+
+@event.listens_for(Session, 'before_commit')
+def notify_pending_expirations(session: Session):
+    if not (dates := session.info.pop(ContentMetaRepository.pending_expirations, None)):
+        return
+    if session.get_bind().dialect.name in ContentMetaRepository.notify_dialects:
+        # The earliest date is enough, the cleaner only needs to know when to wake up.
+        session.execute(ContentMetaRepository.notify_expiration_statement(min(dates)))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def forget_pending_expirations(session: Session, transaction: SessionTransaction):
+    # Records of a rolled back transaction are not announced by the next one.
+    if transaction.parent is None:
+        session.info.pop(ContentMetaRepository.pending_expirations, None)
+
+
+class AsyncContentMetaRepository(ISQLAlchemyRepository):
+    """
+    ContentMetaRepository counterpart for sqlalchemy.ext.asyncio.AsyncSession.
+    Snapshots are shared with ContentMetaRepository.
+    """
+    async def add(self, instance: ContentMeta):
+        self._session.add(instance)
+        ContentMetaRepository.notify_expiration_on_commit(
+            self._session.sync_session, instance.expiration_date
+        )
+
+    async def retrieve_non_expired_snapshot_by_key(self, key) -> ContentMetaSnapshot:
+        """
+        Raises:
+            sqlalchemy.exc.MultipleResultsFound
+            sqlalchemy.exc.NoResultFound
+        """
+        if snapshot := ContentMetaRepository.cached_snapshot(key):
+            return snapshot
+        result = await self._session.execute(
+            ContentMetaRepository.non_expired_by_key_statement(key)
+        )
+        return ContentMetaRepository.cache_snapshot(result.scalar_one())
+
+
+class BlobRepository(ISQLAlchemyRepository):
+    # Dialects which can insert a blob or add a reference to it in a single statement.
+    upsert_dialects = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+    def missing(self, keys: list[str]) -> list[str]:
+        """
+        Returns: keys, in the given order, which have no blob.
+        """
+        existing = set(self._session.execute(select(Blob.key).where(Blob.key.in_(keys))).scalars())
+        return [key for key in keys if key not in existing]
+
+    def acquire(self, key: str, references: int = 1) -> bool:
+        """
+        Add references to an existing blob. The row stays locked until commit,
+        so the cleaner can not delete the blob in the meantime.
+
+        Returns: False if there is no such blob.
+        """
+        return self._session.execute(
+            update(Blob)
+            .where(Blob.key == key)
+            .values(ref_count=Blob.ref_count + references)
+            .execution_options(synchronize_session=False)
+        ).rowcount > 0
+
+    def add(self, key: str, size: int, references: int = 1):
+        """
+        Insert a blob with the given number of references. When the same content was
+        inserted concurrently, the existing blob gets the references instead.
+        """
+        if not (insert := self.upsert_dialects.get(self._session.get_bind().dialect.name)):
+            self._session.add(Blob(key=key, size=size, ref_count=references))
+            return
+        self._session.execute(
+            insert(Blob)
+            .values(key=key, size=size, ref_count=references)
+            .on_conflict_do_update(
+                index_elements=[Blob.key], set_={'ref_count': Blob.ref_count + references}
+            )
+        )
+
+    def release(self, keys: list[str]) -> list[str]:
+        """
+        Drop one reference for every occurrence of a key and delete blobs
+        which are not referenced anymore.
+
+        Returns: keys of deleted blobs, whose objects have to be removed from the bucket.
+        """
+        if not keys:
+            return []
+        references = Counter(keys)
+        # Rows are locked in the same order by every cleaner, so they do not deadlock.
+        self._session.execute(
+            select(Blob.id).where(Blob.key.in_(references)).order_by(Blob.key).with_for_update()
+        ).all()
+        by_count = defaultdict(list)
+        for key, count in references.items():
+            by_count[count].append(key)
+        for count, counted_keys in by_count.items():
+            self._session.execute(
+                update(Blob)
+                .where(Blob.key.in_(counted_keys))
+                .values(ref_count=Blob.ref_count - count)
+                .execution_options(synchronize_session=False)
+            )
+        unused = list(self._session.execute(
+            select(Blob.key).where(Blob.key.in_(references), Blob.ref_count <= 0)
+        ).scalars())
+        if unused:
+            self._session.execute(
+                delete(Blob)
+                .where(Blob.key.in_(unused))
+                .execution_options(synchronize_session=False)
+            )
+        return unused
+
+
+class UploadSessionRepository(ISQLAlchemyRepository):
+    def add(self, instance: UploadSession):
+        self._session.add(instance)
+
+    def delete(self, instance: UploadSession):
+        self._session.delete(instance)
+
+    def retrieve_active_by_key(self, key):
+        """
+        Raises:
+            sqlalchemy.exc.MultipleResultsFound
+            sqlalchemy.exc.NoResultFound
+        """
+        return self._session.query(UploadSession).filter(
+            UploadSession.key == key,
+            UploadSession.expiration_date > datetime.datetime.now()
         ).one()
+
+    def save_part(self, upload_session: UploadSession, number: int, size: int, etag: str):
+        # Re-sent chunk replaces the previous one.
+        for part in upload_session.parts:
+            if part.number == number:
+                part.size, part.etag = size, etag
+                return
+        upload_session.parts.append(UploadSessionPart(number=number, size=size, etag=etag))
+
+    def delete_expired(self, limit: int = 1000) -> list[tuple[str, str]]:
+        """
+        Delete at most `limit` expired sessions. Sessions locked by other
+        transactions are skipped, so concurrent callers get disjoint batches.
+
+        Returns: (key, upload_id) pairs of deleted sessions.
+        """
+        expired = self._session.query(
+            UploadSession.id, UploadSession.key, UploadSession.upload_id
+        ).filter(
+            UploadSession.expiration_date <= datetime.datetime.now()
+        ).order_by(
+            UploadSession.expiration_date
+        ).limit(limit).with_for_update(skip_locked=True).all()
+        ids = [session_id for session_id, _, _ in expired]
+        if ids:
+            self._session.query(UploadSessionPart).filter(
+                UploadSessionPart.session_id.in_(ids)
+            ).delete(synchronize_session=False)
+            self._session.query(UploadSession).filter(
+                UploadSession.id.in_(ids)
+            ).delete(synchronize_session=False)
+        return [(key, upload_id) for _, key, upload_id in expired]
+
+
+class MailOutboxRepository(ISQLAlchemyRepository):
+    def add(self, template: str, payload: dict):
+        self._session.add(MailOutbox(
+            template=template,
+            payload=payload,
+            attempts=0,
+            next_attempt_at=datetime.datetime.now(),
+        ))
+
+    def delete(self, instance: MailOutbox):
+        self._session.delete(instance)
+
+    def claim_due(self, limit: int = 100) -> list[MailOutbox]:
+        """
+        Lock at most `limit` mails which are due. Mails locked by other
+        transactions are skipped, so concurrent dispatchers never send a mail twice.
+        """
+        return self._session.query(MailOutbox).filter(
+            MailOutbox.next_attempt_at <= datetime.datetime.now()
+        ).order_by(
+            MailOutbox.next_attempt_at
+        ).limit(limit).with_for_update(skip_locked=True).all()
+
+    def mark_failed(
+        self,
+        instance: MailOutbox,
+        error: str,
+        max_attempts: int,
+        backoff: datetime.timedelta = datetime.timedelta(seconds=30),
+        max_backoff: datetime.timedelta = datetime.timedelta(hours=1),
+    ):
+        instance.attempts += 1
+        instance.last_error = error
+        if instance.attempts >= max_attempts:
+            instance.next_attempt_at = None
+            self._logger.critical(
+                f'Mail {instance.id} was not sent after {instance.attempts} attempts.'
+            )
+            return
+        instance.next_attempt_at = datetime.datetime.now() + min(
+            backoff * 2 ** (instance.attempts - 1), max_backoff
+        )
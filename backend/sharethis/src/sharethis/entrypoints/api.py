@@ -1,24 +1,45 @@
 import logging
 from dataclasses import asdict
+from typing import Optional
 
-from flask import request
+from flask import request, send_file
 from flask_cors import CORS
 
 from sharethis.infrastructure.config import current_config
-from sharethis.infrastructure.main import (
-    app, db
+from sharethis.infrastructure.exceptions import Forbidden, NotFound
+from sharethis.infrastructure.main import create_app, get_db, get_memory_tracer, get_profiler
+from sharethis.infrastructure import metrics
+from sharethis.infrastructure.schemas import (
+    UploadSchema,
+    UploadBatchSchema,
+    PresignedUploadSchema,
+    UploadSessionSchema,
+)
+from sharethis.logic.dtos import (
+    UploadResultDTO,
+    UploadBatchResultDTO,
+    UploadDTO,
+    PresignedUploadDTO,
+    PresignedUploadResultDTO,
+    UploadSessionDTO,
+)
+from sharethis.logic.use_cases import (
+    UploadUseCase,
+    UploadBatchUseCase,
+    DownloadUseCase,
+    PresignedUploadUseCase,
+    ResumableUploadUseCase,
+    LocalFileUseCase,
 )
-from sharethis.infrastructure.schemas import UploadSchema
-from sharethis.logic.dtos import UploadResultDTO, UploadDTO
-from sharethis.logic.use_cases import UploadUseCase, DownloadUseCase
 
 
+app = create_app()
 cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 
 @app.teardown_appcontext
-def shutdown_session(exception: Exception = None) -> None:
-    db.get_session().close()
+def shutdown_session(exception: Optional[BaseException] = None) -> None:
+    get_db().get_session().close()
 
 
 @app.route('/api/upload', methods=['POST'])
@@ -31,16 +52,131 @@ def upload():
     return asdict(result)
 
 
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    request_data: dict = UploadBatchSchema(
+        context={'max_files': current_config.UPLOAD_BATCH_MAX_FILES}
+    ).load({'files': request.files.getlist('files'), **request.form})
+    result: UploadBatchResultDTO = UploadBatchUseCase().upload(
+        files=request_data['files'],
+        upload_dto=UploadDTO(**request_data['data'])
+    )
+    return asdict(result)
+
+
+@app.route('/api/upload/presigned', methods=['POST'])
+def presigned_upload():
+    request_data: dict = PresignedUploadSchema(
+        context={'max_size': current_config.MAX_UPLOAD_SIZE}
+    ).load(request.get_json(silent=True) or {})
+    result: PresignedUploadResultDTO = PresignedUploadUseCase().create(
+        presigned_dto=PresignedUploadDTO(
+            name=request_data['name'],
+            size=request_data['size'],
+            content_type=request_data.get('content_type'),
+        ),
+        upload_dto=UploadDTO(**request_data['data'])
+    )
+    return asdict(result)
+
+
+@app.route('/api/upload/<string:key>/confirm', methods=['POST'])
+def presigned_upload_confirm(key: str):
+    return asdict(PresignedUploadUseCase().confirm(key))
+
+
+@app.route('/api/upload/sessions', methods=['POST'])
+def upload_session_create():
+    request_data: dict = UploadSessionSchema(
+        context={'max_size': current_config.MAX_UPLOAD_SIZE}
+    ).load(request.get_json(silent=True) or {})
+    result: UploadSessionDTO = ResumableUploadUseCase().create(
+        presigned_dto=PresignedUploadDTO(
+            name=request_data['name'],
+            size=request_data['size'],
+            content_type=request_data.get('content_type'),
+        ),
+        upload_dto=UploadDTO(**request_data['data'])
+    )
+    return asdict(result), 201
+
+
+@app.route('/api/upload/sessions/<string:key>', methods=['GET'])
+def upload_session_status(key: str):
+    return asdict(ResumableUploadUseCase().status(key))
+
+
+@app.route('/api/upload/sessions/<string:key>/chunks/<int:number>', methods=['PUT'])
+def upload_session_chunk(key: str, number: int):
+    return asdict(ResumableUploadUseCase().upload_chunk(key, number, request.stream))
+
+
+@app.route('/api/upload/sessions/<string:key>/finalize', methods=['POST'])
+def upload_session_finalize(key: str):
+    return asdict(ResumableUploadUseCase().finalize(key))
+
+
 @app.route('/api/download/<string:key>', methods=['GET'])
 def download(key: str):
     return asdict(DownloadUseCase().download(key))
 
 
+@app.route('/api/files/<string:key>', methods=['GET'])
+def local_file_download(key: str):
+    result = LocalFileUseCase().download(key, request.args)
+    if current_config.LOCAL_STORAGE_X_ACCEL_REDIRECT:
+        # nginx serves the file from its internal location with sendfile.
+        response = app.response_class(headers={'X-Accel-Redirect': result.internal_url})
+    else:
+        response = send_file(result.path, conditional=True)
+    if result.content_type:
+        response.headers['Content-Type'] = result.content_type
+    if result.content_disposition:
+        response.headers['Content-Disposition'] = result.content_disposition
+    return response
+
+
+@app.route('/api/files/<string:key>', methods=['PUT'])
+def local_file_upload(key: str):
+    LocalFileUseCase().upload(key, request.args, request.stream)
+    return '', 204
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     return {'status': 'ok'}
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    data, content_type = metrics.render()
+    return app.response_class(data, content_type=content_type)
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def profiles():
+    if not (profiler := get_profiler()).authenticated(request.headers):
+        raise Forbidden
+    return {'profiles': profiler.store.list()}
+
+
+@app.route('/api/admin/profiles/<string:profile_id>', methods=['GET'])
+def profile(profile_id: str):
+    if not (profiler := get_profiler()).authenticated(request.headers):
+        raise Forbidden
+    if (result := profiler.store.get(profile_id)) is None:
+        raise NotFound
+    # Collapsed stacks, eg. for flamegraph.pl or speedscope.
+    return app.response_class(profiler.store.collapsed(result), content_type='text/plain')
+
+
+@app.route('/api/admin/memory', methods=['GET'])
+def memory_report():
+    if not get_profiler().authenticated(request.headers):
+        raise Forbidden
+    return get_memory_tracer().report()
+
+
 if __name__ == '__main__':
     logger = logging.getLogger(__name__)
     app.run(debug=current_config.DEBUG, host='0.0.0.0', port=8080)
@@ -0,0 +1,128 @@
+"""
+Async variant of the public API, served by uvicorn:
+
+    uvicorn sharethis.entrypoints.asgi:application
+
+Uploads and downloads do not hold a worker, so a single process can serve
+many slow clients at once.
+"""
+import logging
+from dataclasses import asdict
+from typing import Any, Callable
+
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from sharethis.adapters.bucket import AsyncBucketStorageClient
+from sharethis.infrastructure.config import current_config
+from sharethis.infrastructure.db import AsyncSQLAlchemyDatabase
+from sharethis.infrastructure.exceptions import (
+    CoreHttpError,
+    IExceptionHandler,
+    handlers_collection,
+)
+from sharethis.infrastructure import metrics
+from sharethis.infrastructure.main import config_logger, get_bucket_storage_client
+from sharethis.infrastructure.schemas import UploadSchema
+from sharethis.logic.dtos import UploadDTO, UploadResultDTO
+from sharethis.logic.use_cases import AsyncDownloadUseCase, AsyncUploadUseCase
+
+
+logger = logging.getLogger(__name__)
+
+
+async def upload(request: Request):
+    form = await request.form()
+    try:
+        files = {name: value for name, value in form.items() if isinstance(value, UploadFile)}
+        fields = {name: value for name, value in form.items() if isinstance(value, str)}
+        request_data: dict = UploadSchema().load({**files, **fields})
+        result: UploadResultDTO = await AsyncUploadUseCase(
+            request.app.state.db, request.app.state.bucket_storage_client
+        ).upload(
+            file=request_data['file'],
+            upload_dto=UploadDTO(**request_data['data'])
+        )
+    finally:
+        await form.close()
+    return JSONResponse(asdict(result))
+
+
+async def download(request: Request):
+    result = await AsyncDownloadUseCase(
+        request.app.state.db, request.app.state.bucket_storage_client
+    ).download(request.path_params['key'])
+    return JSONResponse(asdict(result))
+
+
+async def health(request: Request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def metrics_endpoint(request: Request):
+    data, content_type = metrics.render()
+    # Content type already carries the charset, which media_type would add again.
+    return Response(data, headers={'Content-Type': content_type})
+
+
+def to_starlette_handler(handler: type[IExceptionHandler]):
+    async def handle(request: Request, exc: Exception):
+        body, status = handler.handle_from_error(exc)
+        return JSONResponse(body, status_code=status)
+    return handle
+
+
+async def handle_http_exception(request: Request, exc: HTTPException):
+    body, status = CoreHttpError(
+        message=exc.detail,
+        status=exc.status_code,
+        code='unassigned_error'
+    ).get_response()
+    return JSONResponse(body, status_code=status)
+
+
+# Handlers of both collections are registered, so their exception types differ.
+exception_handlers: dict[Any, Callable] = {
+    **{handler.catch: to_starlette_handler(handler) for handler in handlers_collection},
+    HTTPException: handle_http_exception,
+}
+
+
+async def startup():
+    config_logger()
+    application.state.db = AsyncSQLAlchemyDatabase(
+        current_config.DB_CONNECTION_STRING, pool_size=current_config.ASYNC_DB_POOL_SIZE
+    )
+    application.state.bucket_storage_client = AsyncBucketStorageClient(
+        get_bucket_storage_client(),
+        io_chunksize=current_config.ASYNC_UPLOAD_IO_CHUNKSIZE,
+        max_connections=current_config.ASYNC_BUCKET_MAX_CONNECTIONS,
+    )
+
+
+async def shutdown():
+    await application.state.bucket_storage_client.close()
+    await application.state.db.close()
+
+
+application = Starlette(
+    debug=current_config.DEBUG,
+    routes=[
+        Route('/api/upload', upload, methods=['POST']),
+        Route('/api/download/{key:str}', download, methods=['GET']),
+        Route('/api/health', health, methods=['GET']),
+        Route('/api/metrics', metrics_endpoint, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    exception_handlers=exception_handlers,
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
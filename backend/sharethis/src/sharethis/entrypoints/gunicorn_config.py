@@ -0,0 +1,24 @@
+"""
+Gunicorn settings, used with `gunicorn -c python:sharethis.entrypoints.gunicorn_config`.
+
+Workers write metrics to files in a directory shared with the other workers,
+so /api/metrics returns values aggregated across all of them.
+"""
+import os
+import shutil
+
+# Has to be set before prometheus_client is imported, it is inherited by workers.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/sharethis-metrics')
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Values left by a previous run would be added to the new ones.
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,5 @@
 import os
+import socket
 from typing import Optional
 
 
@@ -6,8 +7,9 @@ class ImproperlyConfigured(Exception):
     pass
 
 
-def get_env_var(name, default=None) -> Optional[str]:
-    if not (var := os.environ.get(name, default)) and default is None:
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    var = os.environ.get(name, default)
+    if var is None or not var and default is None:
         raise ImproperlyConfigured(f'No required variable: {name}')
     return var
 
@@ -24,20 +26,102 @@ class Config:
         case 'AZURE':
             AZURE_CONNECTION_STRING = get_env_var('AZURE_CONNECTION_STRING')
             AZURE_BLOB_NAME = get_env_var('AZURE_BLOB_NAME')
+            # Upload memory per request is roughly block size * (concurrency + 1).
+            AZURE_UPLOAD_BLOCK_SIZE = int(
+                get_env_var('AZURE_UPLOAD_BLOCK_SIZE', str(4 * 1024 * 1024))
+            )
+            AZURE_UPLOAD_MAX_CONCURRENCY = int(get_env_var('AZURE_UPLOAD_MAX_CONCURRENCY', '4'))
         case 'AWS':
             AWS_BUCKET_URL = get_env_var('AWS_BUCKET_URL')
             AWS_ACCESS_KEY = get_env_var('AWS_ACCESS_KEY')
             AWS_SECRET_KEY = get_env_var('AWS_SECRET_KEY')
             AWS_BUCKET_NAME = get_env_var('AWS_BUCKET_NAME')
+            # Transfer profile for uploads, see boto3.s3.transfer.TransferConfig.
+            AWS_UPLOAD_PART_SIZE = int(get_env_var('AWS_UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+            AWS_UPLOAD_MAX_CONCURRENCY = int(get_env_var('AWS_UPLOAD_MAX_CONCURRENCY', '10'))
+            AWS_UPLOAD_MULTIPART_THRESHOLD = int(
+                get_env_var('AWS_UPLOAD_MULTIPART_THRESHOLD', str(8 * 1024 * 1024))
+            )
+            AWS_UPLOAD_IO_CHUNKSIZE = int(get_env_var('AWS_UPLOAD_IO_CHUNKSIZE', str(256 * 1024)))
+        case 'LOCAL':
+            LOCAL_STORAGE_PATH = get_env_var('LOCAL_STORAGE_PATH')
+            # Key used to sign links, has to be the same for every API replica.
+            LOCAL_STORAGE_SECRET = get_env_var('LOCAL_STORAGE_SECRET')
+            # Public url of the /api/files endpoint, eg. http://api.localhost/api/files.
+            LOCAL_STORAGE_URL = get_env_var('LOCAL_STORAGE_URL')
+            # Internal nginx location aliased to LOCAL_STORAGE_PATH.
+            LOCAL_STORAGE_INTERNAL_LOCATION = get_env_var(
+                'LOCAL_STORAGE_INTERNAL_LOCATION', '/protected'
+            )
+            # Without nginx in front files are sent by the API itself.
+            LOCAL_STORAGE_X_ACCEL_REDIRECT = get_env_var(
+                'LOCAL_STORAGE_X_ACCEL_REDIRECT', 'True'
+            ) == 'True'
         case _:
             raise ImproperlyConfigured(
                 f'Invalid OBJECT_STORAGE_PROVIDER ({OBJECT_STORAGE_PROVIDER}).'
-                f'Valid options are: AZURE, AWS.'
+                f'Valid options are: AZURE, AWS, LOCAL.'
             )
 
+    # Largest upload in bytes. Direct uploads bypass nginx, so this matches its
+    # client_max_body_size. A single S3 PUT can not be bigger than 5 GiB.
+    MAX_UPLOAD_SIZE = int(get_env_var('MAX_UPLOAD_SIZE', str(2 * 1024 * 1024 * 1024)))
+
+    # Resumable uploads. S3 requires every chunk except the last one to be at least 5 MiB.
+    UPLOAD_CHUNK_SIZE = int(get_env_var('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+    UPLOAD_SESSION_TTL_HOURS = int(get_env_var('UPLOAD_SESSION_TTL_HOURS', '24'))
+
+    # Batch uploads. Files of all requests in a process share a pool of this many
+    # transfer threads.
+    UPLOAD_BATCH_MAX_FILES = int(get_env_var('UPLOAD_BATCH_MAX_FILES', '100'))
+    UPLOAD_BATCH_CONCURRENCY = int(get_env_var('UPLOAD_BATCH_CONCURRENCY', '8'))
+
+    # Number of expired records removed by the cleaner in a single transaction.
+    CLEANER_BATCH_SIZE = int(get_env_var('CLEANER_BATCH_SIZE', '1000'))
+    # Number of batches processed at the same time. Each one holds a database connection.
+    CLEANER_CONCURRENCY = int(get_env_var('CLEANER_CONCURRENCY', '4'))
+    # Cleaner sleeps until the next expiration, but always within these bounds.
+    CLEANER_MIN_INTERVAL_SECONDS = float(get_env_var('CLEANER_MIN_INTERVAL_SECONDS', '1'))
+    CLEANER_MAX_INTERVAL_SECONDS = float(get_env_var('CLEANER_MAX_INTERVAL_SECONDS', '600'))
+    # Name of this cleaner in logs. Any number of replicas can run at the same time.
+    CLEANER_REPLICA_ID = get_env_var('CLEANER_REPLICA_ID', socket.gethostname())
+    # Port of the cleaner Prometheus endpoint, 0 disables it.
+    CLEANER_METRICS_PORT = int(get_env_var('CLEANER_METRICS_PORT', '9100'))
+
     MAIL_SERVICE = get_env_var('MAIL_SERVICE', 'mock')
+    MAIL_SERVICE_POOL_SIZE = int(get_env_var('MAIL_SERVICE_POOL_SIZE', '4'))
+    MAIL_SERVICE_RETRIES = int(get_env_var('MAIL_SERVICE_RETRIES', '3'))
+    MAIL_SERVICE_TIMEOUT = float(get_env_var('MAIL_SERVICE_TIMEOUT', '2'))
+    # Consecutive failures after which calls to the mailer fail fast.
+    MAIL_SERVICE_BREAKER_THRESHOLD = int(get_env_var('MAIL_SERVICE_BREAKER_THRESHOLD', '5'))
+    MAIL_SERVICE_BREAKER_RESET_SECONDS = float(
+        get_env_var('MAIL_SERVICE_BREAKER_RESET_SECONDS', '30')
+    )
+    # Outbox dispatcher running next to the cleaner.
+    MAIL_DISPATCH_INTERVAL_SECONDS = float(get_env_var('MAIL_DISPATCH_INTERVAL_SECONDS', '5'))
+    MAIL_DISPATCH_BATCH_SIZE = int(get_env_var('MAIL_DISPATCH_BATCH_SIZE', '100'))
+    MAIL_MAX_ATTEMPTS = int(get_env_var('MAIL_MAX_ATTEMPTS', '10'))
+
+    # ASGI entrypoint. Uploads are streamed to the bucket in chunks of this size.
+    ASYNC_UPLOAD_IO_CHUNKSIZE = int(get_env_var('ASYNC_UPLOAD_IO_CHUNKSIZE', str(256 * 1024)))
+    ASYNC_BUCKET_MAX_CONNECTIONS = int(get_env_var('ASYNC_BUCKET_MAX_CONNECTIONS', '1000'))
+    ASYNC_DB_POOL_SIZE = int(get_env_var('ASYNC_DB_POOL_SIZE', '10'))
+
+    # Request profiling. A request is profiled when it sends the token in the X-Profile
+    # header or is picked by the sample rate. Profiles are fetched with the same header.
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_SAMPLE_RATE = float(get_env_var('PROFILING_SAMPLE_RATE', '0'))
+    PROFILING_INTERVAL_SECONDS = float(get_env_var('PROFILING_INTERVAL_SECONDS', '0.005'))
+    # Directory shared by all workers, only the last PROFILING_CAPACITY profiles are kept.
+    PROFILING_DIRECTORY = get_env_var('PROFILING_DIRECTORY', '/tmp/sharethis-profiles')
+    PROFILING_CAPACITY = int(get_env_var('PROFILING_CAPACITY', '100'))
+
+    # Diagnostic mode tracing memory allocated by requests, reported with the profiling token.
+    MEMORY_TRACING_ENABLED = get_env_var('MEMORY_TRACING_ENABLED', 'False') == 'True'
+    MEMORY_TRACING_DIRECTORY = get_env_var('MEMORY_TRACING_DIRECTORY', '/tmp/sharethis-memory')
+    MEMORY_TRACING_CAPACITY = int(get_env_var('MEMORY_TRACING_CAPACITY', '100'))
 
-    DEBUG = get_env_var('DEBUG', False) == 'True'
+    DEBUG = get_env_var('DEBUG', 'False') == 'True'
 
 
 current_config = Config
@@ -1,12 +1,69 @@
 import logging
+import time
+from typing import TYPE_CHECKING
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
 from sqlalchemy.ext.declarative import ConcreteBase
 from sqlalchemy.orm.scoping import scoped_session
 from sqlalchemy.orm.session import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 
+from sharethis.infrastructure.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_IN_USE
 from sharethis.infrastructure.models import Base
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# Async drivers used in place of the ones from DB_CONNECTION_STRING.
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+class CheckoutWaitMixin:
+    """
+    Record time spent getting a connection from the pool,
+    which includes opening a new one when the pool is not full yet.
+    """
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(CheckoutWaitMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(CheckoutWaitMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(
+    url: URL, pool_size: int, max_overflow: int, poolclass: type[Pool] = InstrumentedQueuePool
+) -> dict:
+    # SQLite engines do not use a queue pool and reject its sizing.
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {'pool_size': pool_size, 'max_overflow': max_overflow, 'poolclass': poolclass}
+
+
+def count_connections_in_use(engine: Engine):
+    event.listen(engine, 'checkout', lambda *args: DB_POOL_IN_USE.inc())
+    event.listen(engine, 'checkin', lambda *args: DB_POOL_IN_USE.dec())
+    # Detached connections are never checked in.
+    event.listen(engine, 'detach', lambda *args: DB_POOL_IN_USE.dec())
+
+
+def async_connection_url(connection_string: str) -> URL:
+    url = make_url(connection_string)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
 
 class SQLAlchemyDatabase:
     """
@@ -22,10 +79,10 @@ class SQLAlchemyDatabase:
         self._connection_string = connection_string
         self._engine = create_engine(
             self._connection_string,
-            pool_size=10,
-            max_overflow=4,
             pool_pre_ping=True,
+            **pool_options(make_url(self._connection_string), pool_size=10, max_overflow=4),
         )
+        count_connections_in_use(self._engine)
         self._session_maker = scoped_session(
             sessionmaker(
                 bind=self._engine,
@@ -43,6 +100,19 @@ class SQLAlchemyDatabase:
         """
         return self._session_maker()
 
+    @property
+    def dialect_name(self) -> str:
+        return self._engine.dialect.name
+
+    def create_dedicated_connection(self):
+        """
+        Return DBAPI connection which is detached from the pool and owned by the caller.
+        Useful for long-living connections, eg. LISTEN.
+        """
+        connection = self._engine.raw_connection()
+        connection.detach()
+        return connection
+
     def get_session_factory(self) -> scoped_session:
         """
         Return SQLAlchemy session class. This method acts as a factory for database session.
@@ -75,3 +145,42 @@ class SQLAlchemyDatabase:
         except Exception:
             return False
         return True
+
+
+class AsyncSQLAlchemyDatabase:
+    """
+    Abstraction over SQLAlchemy asyncio extension. Schema is created by SQLAlchemyDatabase.
+    """
+    def __init__(
+        self,
+        connection_string: str,
+        pool_size: int = 10,
+        max_overflow: int = 4,
+        logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        # Imported here, so that the sync entrypoints do not pay for it on a cold start.
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        self._logger = logger
+        url = async_connection_url(connection_string)
+        self._engine = create_async_engine(
+            url,
+            pool_pre_ping=True,
+            **pool_options(url, pool_size, max_overflow, InstrumentedAsyncAdaptedQueuePool),
+        )
+        count_connections_in_use(self._engine.sync_engine)
+        self._session_maker = sessionmaker(
+            bind=self._engine,
+            class_=AsyncSession,
+            autocommit=False,
+            expire_on_commit=False,
+        )
+
+    def get_session(self) -> 'AsyncSession':
+        return self._session_maker()
+
+    @property
+    def dialect_name(self) -> str:
+        return self._engine.dialect.name
+
+    async def close(self):
+        await self._engine.dispose()
@@ -1,5 +1,5 @@
 from abc import ABC
-from typing import Type, Iterable, Any
+from typing import Any, Iterable, Optional, Type
 
 from marshmallow.exceptions import ValidationError
 from sqlalchemy.exc import SQLAlchemyError, NoResultFound
@@ -38,7 +38,45 @@ class NotFound(CoreHttpError):
     message = 'Given resource does not exist.'
 
 
+class UploadNotCompleted(CoreHttpError):
+    status = 409
+    code = 'upload_not_completed'
+    message = 'Uploaded object is missing or incomplete.'
+
+
+class InvalidChunk(CoreHttpError):
+    status = 400
+    code = 'invalid_chunk'
+    message = 'Chunk number or size does not match the upload session.'
+
+
+class InvalidUploadSession(CoreHttpError):
+    status = 400
+    code = 'invalid_upload_session'
+    message = 'Upload can not be split into chunks accepted by the bucket.'
+
+
+class ChunkConflict(CoreHttpError):
+    status = 409
+    code = 'chunk_conflict'
+    message = 'The same chunk is being uploaded by another request.'
+
+
+class InvalidLink(CoreHttpError):
+    status = 403
+    code = 'invalid_link'
+    message = 'Link is invalid or has expired.'
+
+
+class Forbidden(CoreHttpError):
+    status = 403
+    code = 'forbidden'
+    message = 'Missing or invalid credentials.'
+
+
 class IExceptionHandler(ABC):
+    catch: Type[Exception]
+
     def __init__(self, err):
         self._err = err
 
@@ -116,7 +154,7 @@ class SQLAlchemyErrorHandler(IExceptionHandler):
 class HandlersController:
     def __init__(
         self,
-        handlers: ExceptionHandlerCollection = None,
+        handlers: Optional[ExceptionHandlerCollection] = None,
     ):
         self._handlers = handlers or []
 
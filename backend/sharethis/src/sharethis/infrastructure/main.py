@@ -1,12 +1,26 @@
+"""
+Providers of shared infrastructure.
+
+Importing this module has no side effects. Clients are created on first use and
+nothing is provisioned implicitly, see sharethis.jobs.provision.
+"""
 import logging
 import logging.config
+from functools import lru_cache
 
 from flask import Flask
 
-from sharethis.adapters.bucket import AzureBlobClient, AWSS3Client
-from sharethis.infrastructure.config import current_config
+from sharethis.adapters.bucket import (
+    AzureBlobClient,
+    AWSS3Client,
+    IBucketStorageClient,
+    LocalFilesystemClient,
+)
+from sharethis.infrastructure.config import ImproperlyConfigured, current_config
 from sharethis.infrastructure.db import SQLAlchemyDatabase
 from sharethis.infrastructure.exceptions import handlers_controller
+from sharethis.infrastructure.memory_tracing import MemoryTracer
+from sharethis.infrastructure.profiling import ProfileStore, RequestProfiler
 
 
 def config_logger():
@@ -57,12 +71,20 @@ def get_logger():
     return logging.getLogger(__name__)
 
 
-def get_bucket_storage_client():
+@lru_cache(maxsize=None)
+def get_db() -> SQLAlchemyDatabase:
+    return SQLAlchemyDatabase(current_config.DB_CONNECTION_STRING)
+
+
+@lru_cache(maxsize=None)
+def get_bucket_storage_client() -> IBucketStorageClient:
     match current_config.OBJECT_STORAGE_PROVIDER:
         case 'AZURE':
             return AzureBlobClient(
                 connection_string=current_config.AZURE_CONNECTION_STRING,
                 container_name=current_config.AZURE_BLOB_NAME,
+                upload_block_size=current_config.AZURE_UPLOAD_BLOCK_SIZE,
+                upload_max_concurrency=current_config.AZURE_UPLOAD_MAX_CONCURRENCY,
             )
         case 'AWS':
             return AWSS3Client(
@@ -70,21 +92,61 @@ def get_bucket_storage_client():
                 access_key=current_config.AWS_ACCESS_KEY,
                 secret_key=current_config.AWS_SECRET_KEY,
                 bucket_name=current_config.AWS_BUCKET_NAME,
+                upload_part_size=current_config.AWS_UPLOAD_PART_SIZE,
+                upload_max_concurrency=current_config.AWS_UPLOAD_MAX_CONCURRENCY,
+                upload_multipart_threshold=current_config.AWS_UPLOAD_MULTIPART_THRESHOLD,
+                upload_io_chunksize=current_config.AWS_UPLOAD_IO_CHUNKSIZE,
             )
+        case 'LOCAL':
+            return LocalFilesystemClient(
+                root=current_config.LOCAL_STORAGE_PATH,
+                secret=current_config.LOCAL_STORAGE_SECRET,
+                url=current_config.LOCAL_STORAGE_URL,
+                internal_location=current_config.LOCAL_STORAGE_INTERNAL_LOCATION,
+            )
+        case _:
+            raise ImproperlyConfigured(
+                f'Invalid OBJECT_STORAGE_PROVIDER ({current_config.OBJECT_STORAGE_PROVIDER}).'
+            )
+
 
+@lru_cache(maxsize=None)
+def get_profiler() -> RequestProfiler:
+    return RequestProfiler(
+        store=ProfileStore(
+            directory=current_config.PROFILING_DIRECTORY,
+            capacity=current_config.PROFILING_CAPACITY,
+        ),
+        token=current_config.PROFILING_TOKEN,
+        sample_rate=current_config.PROFILING_SAMPLE_RATE,
+        interval=current_config.PROFILING_INTERVAL_SECONDS,
+    )
 
-def create_app():
+
+@lru_cache(maxsize=None)
+def get_memory_tracer() -> MemoryTracer:
+    return MemoryTracer(
+        store=ProfileStore(
+            directory=current_config.MEMORY_TRACING_DIRECTORY,
+            capacity=current_config.MEMORY_TRACING_CAPACITY,
+        ),
+    )
+
+
+def create_app() -> Flask:
     config_logger()
     app = Flask(__name__)
     handlers_controller.initialize(app)
+    get_profiler().initialize(app)
+    if current_config.MEMORY_TRACING_ENABLED:
+        get_memory_tracer().initialize(app)
     app.config.from_object(current_config)
-
-    db = SQLAlchemyDatabase(current_config.DB_CONNECTION_STRING)
-    db.create_database()
-
-    bucket_storage_client = get_bucket_storage_client()
-
-    return app, db, bucket_storage_client
+    return app
 
 
-app, db, bucket_storage_client = create_app()
+def provision():
+    """
+    Create database schema and the bucket. Safe to run more than once.
+    """
+    get_db().create_database()
+    get_bucket_storage_client().provision()
@@ -0,0 +1,105 @@
+"""
+Diagnostic mode measuring memory allocated by single requests with tracemalloc.
+
+tracemalloc traces the whole process, so only one request of a process is traced
+at a time and requests which arrive in the meantime are left untraced. Tracing is
+started and stopped around every traced request, so nothing is paid between them,
+but a traced request runs noticeably slower. Top allocation sites are the ones still
+alive when the response is ready, which includes request data like a spooled upload.
+"""
+import logging
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Optional
+
+from flask import Flask, g, request
+
+from sharethis.infrastructure.profiling import ProfileStore
+
+
+class MemoryTracer:
+    def __init__(
+        self,
+        store: ProfileStore,
+        frames: int = 10,
+        top: int = 10,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self.store = store
+        self._frames = frames
+        self._top = top
+        self._logger = logger
+        self._lock = threading.Lock()
+
+    def initialize(self, app: Flask):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        # Tracing started by somebody else, eg. python -X tracemalloc, is left alone.
+        if tracemalloc.is_tracing() or not self._lock.acquire(blocking=False):
+            return
+        g.memory_tracing_started_at = time.time()
+        tracemalloc.start(self._frames)
+
+    def _after_request(self, response):
+        # Request data, eg. a spooled upload, is still referenced here.
+        if 'memory_tracing_started_at' not in g:
+            return response
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        tracemalloc.stop()
+        size = request.content_length or 0
+        record = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else request.path,
+            'status': response.status_code,
+            'size': size,
+            'started_at': g.memory_tracing_started_at,
+            'duration': time.time() - g.memory_tracing_started_at,
+            'peak': peak,
+            'retained': current,
+            'peak_per_byte': peak / size if size else None,
+            'top_allocations': [
+                {'site': str(statistic.traceback[0]), 'size': statistic.size,
+                 'count': statistic.count}
+                for statistic in snapshot.statistics('lineno')[:self._top]
+            ],
+        }
+        try:
+            self.store.save(record)
+        except OSError as e:
+            self._logger.warning('Could not save memory trace.')
+            self._logger.exception(e)
+        return response
+
+    def _teardown_request(self, exception: Optional[BaseException] = None):
+        if g.pop('memory_tracing_started_at', None) is None:
+            return
+        # Request which failed before after_request still has to give tracing back.
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._lock.release()
+
+    def report(self) -> dict:
+        """
+        Return stored traces, newest first, with the worst peak of every route.
+        """
+        traces = self.store.list()
+        summary: defaultdict[str, dict[str, Any]] = defaultdict(
+            lambda: {'requests': 0, 'peak_max': 0, 'peak_per_byte_max': None}
+        )
+        for trace in traces:
+            route = summary[f'{trace["method"]} {trace["route"]}']
+            route['requests'] += 1
+            route['peak_max'] = max(route['peak_max'], trace['peak'])
+            if trace['peak_per_byte'] is not None:
+                route['peak_per_byte_max'] = max(
+                    route['peak_per_byte_max'] or 0.0, trace['peak_per_byte']
+                )
+        return {'summary': dict(summary), 'traces': traces}
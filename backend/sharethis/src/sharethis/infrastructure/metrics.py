@@ -0,0 +1,118 @@
+"""
+Prometheus metrics of the API and the cleaner.
+
+Gunicorn workers are separate processes, so the API keeps metric values in files
+under PROMETHEUS_MULTIPROC_DIR and aggregates them when scraped, see
+sharethis.entrypoints.gunicorn_config. Without the variable values are kept in memory
+of a single process, which is what the cleaner and the ASGI entrypoint use.
+"""
+import functools
+import inspect
+import os
+import time
+from typing import Callable, Iterable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+
+# Uploads of big files take minutes, so buckets go further than the defaults.
+DURATION_BUCKETS = (
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300
+)
+
+STAGE_DURATION = Histogram(
+    'sharethis_stage_duration_seconds',
+    'Time spent in a stage of request handling, eg. a use case or a bucket call.',
+    ['stage'],
+    buckets=DURATION_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    'sharethis_stage_errors_total',
+    'Stages which ended with an exception.',
+    ['stage'],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'sharethis_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the SQLAlchemy pool.',
+    buckets=DURATION_BUCKETS,
+)
+DB_POOL_IN_USE = Gauge(
+    'sharethis_db_pool_connections_in_use',
+    'Connections checked out from the SQLAlchemy pool.',
+    multiprocess_mode='livesum',
+)
+CLEANER_BATCH_SIZE = Histogram(
+    'sharethis_cleaner_batch_size',
+    'Expired records deleted in a single cleaner batch.',
+    buckets=(0, 1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+CLEANER_BATCH_DURATION = Histogram(
+    'sharethis_cleaner_batch_duration_seconds',
+    'Time spent deleting a single cleaner batch with its files.',
+    buckets=DURATION_BUCKETS,
+)
+
+
+def timed(stage: str) -> Callable:
+    """
+    Decorator recording duration of a function, or a coroutine function, as `stage`.
+    """
+    # Series are created on the first call, so clients which are not used
+    # do not show up in the output.
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    STAGE_ERRORS.labels(stage).inc()
+                    raise
+                finally:
+                    STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                STAGE_ERRORS.labels(stage).inc()
+                raise
+            finally:
+                STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def time_methods(cls: type, names: Iterable[str]):
+    """
+    Time methods of `cls` named in `names` as '<class name>.<method name>'.
+    Only methods defined by the class itself are wrapped, inherited ones already are.
+    """
+    for name in names:
+        if callable(method := cls.__dict__.get(name)):
+            setattr(cls, name, timed(f'{cls.__name__}.{name}')(method))
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Return metrics of all processes in the Prometheus text format and its content type.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
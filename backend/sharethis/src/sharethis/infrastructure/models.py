@@ -1,11 +1,26 @@
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    JSON,
+    UniqueConstraint,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import DeclarativeMeta
+from sqlalchemy.orm import DeclarativeMeta, relationship
 
 
 Base: DeclarativeMeta = declarative_base()
 
 
+class ContentStatus:
+    # Direct upload was requested, but the client has not confirmed it yet.
+    PENDING = 'pending'
+    UPLOADED = 'uploaded'
+
+
 class ContentMeta(Base):
     __tablename__ = 'content_meta'
 
@@ -13,8 +28,95 @@ class ContentMeta(Base):
     key = Column(String, unique=True, nullable=False)
     name = Column(String, nullable=False)
     content_type = Column(String, nullable=False)
-    expiration_date = Column(DateTime, nullable=False)
+    expiration_date = Column(DateTime, nullable=False, index=True)
     encryption_method = Column(String)
+    status = Column(String, nullable=False, default=ContentStatus.UPLOADED)
+    size = Column(BigInteger)
+    email = Column(String)
+    # Key of a shared Blob. Empty when the object is stored under the key of the record,
+    # eg. for direct uploads.
+    blob_key = Column(String, index=True)
 
     def __init__(self, *args, **kwargs):
         super(ContentMeta, self).__init__(*args, **kwargs)
+
+    @property
+    def object_key(self) -> str:
+        return self.blob_key or self.key
+
+
+class Blob(Base):
+    """
+    Object in the bucket named after the hash of its content. It is shared by all
+    ContentMeta rows with the same content and deleted with the last of them.
+    """
+    __tablename__ = 'blob'
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+
+    def __init__(self, *args, **kwargs):
+        super(Blob, self).__init__(*args, **kwargs)
+
+
+class UploadSession(Base):
+    """
+    State of a resumable upload. Content itself is described by a pending ContentMeta
+    with the same key.
+    """
+    __tablename__ = 'upload_session'
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True, nullable=False)
+    # Identifier of a multipart upload in the bucket, if the provider uses one.
+    upload_id = Column(String)
+    size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    expiration_date = Column(DateTime, nullable=False, index=True)
+
+    parts = relationship(
+        'UploadSessionPart',
+        cascade='all, delete-orphan',
+        order_by='UploadSessionPart.number',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(UploadSession, self).__init__(*args, **kwargs)
+
+
+class UploadSessionPart(Base):
+    __tablename__ = 'upload_session_part'
+    __table_args__ = (UniqueConstraint('session_id', 'number'),)
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(
+        Integer, ForeignKey('upload_session.id', ondelete='CASCADE'), nullable=False
+    )
+    number = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    # S3 part ETag or Azure block id.
+    etag = Column(String, nullable=False)
+
+    def __init__(self, *args, **kwargs):
+        super(UploadSessionPart, self).__init__(*args, **kwargs)
+
+
+class MailOutbox(Base):
+    """
+    Mail waiting to be sent. Rows are written in the same transaction as the data
+    they notify about and are delivered by a background dispatcher.
+    """
+    __tablename__ = 'mail_outbox'
+
+    id = Column(Integer, primary_key=True)
+    template = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Empty when delivery was given up.
+    next_attempt_at = Column(DateTime, index=True)
+    last_error = Column(String)
+
+    def __init__(self, *args, **kwargs):
+        super(MailOutbox, self).__init__(*args, **kwargs)
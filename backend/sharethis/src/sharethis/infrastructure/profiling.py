@@ -0,0 +1,191 @@
+"""
+Opt-in stack sampling of single requests.
+
+A request is profiled when it carries the profiling token in the X-Profile header or
+is picked by the configured sample rate. Its thread is sampled by a background thread
+and the result is kept as collapsed stacks, the input format of flamegraph.pl and
+speedscope. Requests which are not profiled only pay for a header lookup.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from types import FrameType
+from typing import Mapping, Optional
+
+from flask import Flask, g, request
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """
+    Return a stack as 'root;...;leaf', with frames named module:function.
+    """
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Sample stack of a single thread every `interval` seconds from a daemon thread.
+    """
+    def __init__(self, thread_id: int, interval: float):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self.stacks: Counter[str] = Counter()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            if (frame := sys._current_frames().get(self._thread_id)) is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+class ProfileStore:
+    """
+    Ring buffer of JSON records kept as files in a local directory, so records saved
+    by any gunicorn worker can be fetched from all of them. Oldest records are
+    removed once there are more than `capacity`.
+    """
+    profile_id_pattern = re.compile(r'^[0-9]{20}-[0-9a-f]{8}$')
+
+    def __init__(self, directory: str, capacity: int = 100):
+        self._directory = directory
+        self._capacity = capacity
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self._directory, f'{profile_id}.json')
+
+    def _profile_ids(self) -> list[str]:
+        try:
+            names = os.listdir(self._directory)
+        except FileNotFoundError:
+            return []
+        # Ids start with a timestamp, so they sort from the oldest.
+        return sorted(
+            name[:-len('.json')] for name in names
+            if name.endswith('.json') and self.profile_id_pattern.match(name[:-len('.json')])
+        )
+
+    def save(self, record: dict) -> str:
+        profile_id = f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(self._directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self._directory, prefix='.profile-')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'id': profile_id, **record}, file)
+        os.replace(temporary, self._path(profile_id))
+        for old in self._profile_ids()[:-self._capacity]:
+            try:
+                os.unlink(self._path(old))
+            except FileNotFoundError:
+                pass
+        return profile_id
+
+    def list(self) -> list[dict]:
+        """
+        Return stored records without their stacks, newest first.
+        """
+        profiles = []
+        for profile_id in reversed(self._profile_ids()):
+            if (profile := self.get(profile_id)) is not None:
+                profile.pop('stacks', None)
+                profiles.append(profile)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not self.profile_id_pattern.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            # Removed by another worker in the meantime.
+            return None
+
+    @staticmethod
+    def collapsed(profile: dict) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in profile['stacks'].items())
+
+
+class RequestProfiler:
+    header = 'X-Profile'
+
+    def __init__(
+        self,
+        store: ProfileStore,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self.store = store
+        self._token = token
+        self._sample_rate = sample_rate
+        self._interval = interval
+        self._logger = logger
+
+    def initialize(self, app: Flask):
+        if not self._token and not self._sample_rate:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def authenticated(self, headers: Mapping[str, str]) -> bool:
+        if not self._token:
+            return False
+        return hmac.compare_digest(headers.get(self.header, ''), self._token)
+
+    def _before_request(self):
+        if not self.authenticated(request.headers) and not (
+            self._sample_rate and random.random() < self._sample_rate
+        ):
+            return
+        g.profiler_sampler = StackSampler(threading.get_ident(), self._interval)
+        g.profiler_started_at = time.time()
+        g.profiler_sampler.start()
+
+    @staticmethod
+    def _after_request(response):
+        if 'profiler_sampler' in g:
+            g.profiler_status = response.status_code
+        return response
+
+    def _teardown_request(self, exception: Optional[BaseException] = None):
+        if (sampler := g.pop('profiler_sampler', None)) is None:
+            return
+        stacks = sampler.stop()
+        try:
+            profile_id = self.store.save({
+                'method': request.method,
+                'path': request.path,
+                'status': g.pop('profiler_status', 500),
+                'started_at': g.profiler_started_at,
+                'duration': time.time() - g.profiler_started_at,
+                'samples': sum(stacks.values()),
+                'stacks': dict(stacks),
+            })
+        except OSError as e:
+            self._logger.warning('Could not save request profile.')
+            self._logger.exception(e)
+            return
+        self._logger.info(f'Profiled {request.method} {request.path} as {profile_id}.')
@@ -2,7 +2,7 @@ import datetime
 import json
 from json.decoder import JSONDecodeError
 
-from marshmallow import Schema, fields, validate, ValidationError, pre_load
+from marshmallow import Schema, fields, validate, validates, ValidationError, pre_load
 
 
 class UploadDataSchema(Schema):
@@ -23,8 +23,10 @@ class UploadDataSchema(Schema):
     )
 
 
-class UploadSchema(Schema):
-    file = fields.Raw(type='file', required=True)
+class MultipartUploadSchema(Schema):
+    """
+    Multipart form with upload options sent as JSON in the data field.
+    """
     data = fields.Nested(UploadDataSchema, required=True)
 
     @pre_load
@@ -39,3 +41,33 @@ class UploadSchema(Schema):
                     field_name='data'
                 )
         return in_data
+
+
+class UploadSchema(MultipartUploadSchema):
+    file = fields.Raw(type='file', required=True)
+
+
+class UploadBatchSchema(MultipartUploadSchema):
+    files = fields.List(fields.Raw(type='file'), required=True, validate=validate.Length(min=1))
+
+    @validates('files')
+    def validate_files_count(self, files, **kwargs):
+        if (max_files := self.context.get('max_files')) and len(files) > max_files:
+            raise ValidationError(f'At most {max_files} files can be uploaded at once.')
+
+
+class PresignedUploadSchema(Schema):
+    name = fields.String(required=True, validate=validate.Length(min=1))
+    size = fields.Integer(required=True, validate=validate.Range(min=1))
+    content_type = fields.String(required=False, allow_none=True)
+    data = fields.Nested(UploadDataSchema, required=True)
+
+    @validates('size')
+    def validate_max_size(self, size, **kwargs):
+        # Content goes straight to the bucket, so the limit is checked before it is sent.
+        if (max_size := self.context.get('max_size')) and size > max_size:
+            raise ValidationError(f'Must be at most {max_size} bytes.')
+
+
+class UploadSessionSchema(PresignedUploadSchema):
+    pass
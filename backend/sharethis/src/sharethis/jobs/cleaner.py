@@ -4,14 +4,54 @@ import datetime
 import logging
 import logging.config
 import signal
-from typing import Callable, NoReturn
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, NoReturn, Optional
 
-from sharethis.infrastructure.main import db, config_logger, bucket_storage_client
+from sharethis.infrastructure.config import current_config
+from sharethis.adapters.repositories import ContentMetaRepository
+from prometheus_client import start_http_server
+
+from sharethis.infrastructure.main import config_logger, get_bucket_storage_client, get_db
+from sharethis.infrastructure.metrics import CLEANER_BATCH_DURATION, CLEANER_BATCH_SIZE
+from sharethis.jobs.mails import dispatch_mails
 from sharethis.services.uow import MainUnitOfWork
 
 
 tasks = {}
-logger = config_logger()
+logger = logging.getLogger(__name__)
+# Delay before the cleaner retries after an error, eg. database outage.
+ERROR_RETRY_SECONDS = 5.0
+
+
+class ReplicaThroughput:
+    """
+    Work done by this cleaner replica. Replicas claim disjoint batches with
+    SKIP LOCKED, so the total capacity is a sum over all replicas.
+    """
+    def __init__(self, replica_id: str):
+        self.replica_id = replica_id
+        self.deleted = 0
+        self.busy_seconds = 0.0
+
+    def record(self, deleted: int, elapsed: float):
+        self.deleted += deleted
+        self.busy_seconds += elapsed
+        if not deleted:
+            return
+        logger.info(
+            f'[{self.replica_id}] Cleaner deleted: {deleted} records and associated files '
+            f'in {elapsed:.2f}s ({deleted / max(elapsed, 1e-6):.1f} records/s). '
+            f'Total: {self.deleted} records, '
+            f'{self.deleted / max(self.busy_seconds, 1e-6):.1f} records/s.'
+        )
+
+
+throughput = ReplicaThroughput(current_config.CLEANER_REPLICA_ID)
+cleaner_executor = ThreadPoolExecutor(
+    max_workers=current_config.CLEANER_CONCURRENCY, thread_name_prefix='cleaner'
+)
 
 
 async def periodic_wrapper(
@@ -28,11 +68,16 @@ async def periodic_wrapper(
     Returns:
 
     """
+    loop = asyncio.get_running_loop()
     try:
         while True:
             await asyncio.sleep(interval.total_seconds())
             try:
-                func(**func_kwargs)
+                if asyncio.iscoroutinefunction(func):
+                    await func(**func_kwargs)
+                else:
+                    # Blocking jobs must not stall the event loop.
+                    await loop.run_in_executor(None, partial(func, **func_kwargs))
             except Exception as e:
                 logger.critical(e)
     except asyncio.CancelledError:
@@ -72,14 +117,167 @@ def register_signals(signals, loop):
         loop.add_signal_handler(sig, lambda: asyncio.create_task(shutdown(sig, loop)))
 
 
-def cleaner():
-    with MainUnitOfWork(db, bucket_storage_client) as uow:
-        to_delete = uow.content_meta.delete_expired()
+def delete_expired_batch(batch_size: int) -> list[str]:
+    """
+    Delete a single batch of expired records and their files in one transaction.
+    Shared blobs are deleted only with their last record.
+    Records are restored by rollback if bucket delete fails.
+
+    Returns: keys of deleted records.
+    """
+    with CLEANER_BATCH_DURATION.time(), \
+            MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+        expired = uow.content_meta.delete_expired(limit=batch_size)
+        to_delete = [key for key, blob_key in expired if blob_key is None]
+        to_delete += uow.blobs.release([blob_key for _, blob_key in expired if blob_key])
         uow.content.bulk_delete(to_delete)
         uow.commit()
-    if deleted := len(to_delete):
-        logger.info(f'Cleaner deleted: {deleted} records and associated files.')
+    CLEANER_BATCH_SIZE.observe(len(expired))
     logger.debug(f'Files deleted: {to_delete}')
+    return [key for key, _ in expired]
+
+
+async def cleaner(
+    batch_size: int = current_config.CLEANER_BATCH_SIZE,
+    concurrency: int = current_config.CLEANER_CONCURRENCY,
+) -> int:
+    """
+    Delete expired records and their files until nothing is left.
+
+    Up to `concurrency` batches are in flight, each in its own executor thread and
+    database transaction, so claiming rows of one batch overlaps with bucket deletes
+    of the others. Every batch is committed separately, so progress survives a failure.
+
+    Returns: number of deleted records.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+
+    async def pipeline() -> int:
+        deleted = 0
+        while True:
+            to_delete = await loop.run_in_executor(
+                cleaner_executor, delete_expired_batch, batch_size
+            )
+            deleted += len(to_delete)
+            if len(to_delete) < batch_size:
+                return deleted
+
+    deleted = sum(await asyncio.gather(*(pipeline() for _ in range(concurrency))))
+    throughput.record(deleted, time.monotonic() - start)
+    return deleted
+
+
+def next_expiration_date() -> Optional[datetime.datetime]:
+    with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+        return uow.content_meta.next_expiration_date()
+
+
+def compute_delay(
+    next_expiration: Optional[datetime.datetime],
+    now: datetime.datetime,
+    min_interval: float,
+    max_interval: float,
+) -> float:
+    """
+    Return number of seconds to sleep before the next cleaner run.
+    Zero means there is a backlog which should be processed right away.
+    """
+    if next_expiration is None:
+        return max_interval
+    if next_expiration <= now:
+        return 0
+    return min(max(min_interval, (next_expiration - now).total_seconds()), max_interval)
+
+
+class ExpirationListener:
+    """
+    Wake the cleaner up when a new record expires before its planned run.
+
+    Uses Postgres LISTEN/NOTIFY. With other databases the cleaner relies on
+    the max interval only.
+    """
+    def __init__(self, wake_up: asyncio.Event):
+        self._wake_up = wake_up
+        self._connection = None
+        self.planned_run: Optional[datetime.datetime] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if (db := get_db()).dialect_name != 'postgresql':
+            return
+        self._connection = db.create_dedicated_connection()
+        self._connection.autocommit = True
+        with self._connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {ContentMetaRepository.expiration_channel};')
+        loop.add_reader(self._connection.fileno(), self._on_notify)
+
+    def stop(self, loop: asyncio.AbstractEventLoop):
+        if self._connection is not None:
+            loop.remove_reader(self._connection.fileno())
+            self._connection.close()
+
+    def _on_notify(self):
+        self._connection.poll()
+        while self._connection.notifies:
+            expiration = datetime.datetime.fromisoformat(self._connection.notifies.pop().payload)
+            if self.planned_run and expiration < self.planned_run:
+                logger.debug(f'Cleaner woken up by record expiring at {expiration}.')
+                self._wake_up.set()
+
+
+async def adaptive_cleaner(
+    min_interval: float = current_config.CLEANER_MIN_INTERVAL_SECONDS,
+    max_interval: float = current_config.CLEANER_MAX_INTERVAL_SECONDS,
+) -> NoReturn:
+    """
+    Run the cleaner when the next record expires instead of polling on a fixed interval.
+    """
+    loop = asyncio.get_running_loop()
+    wake_up = asyncio.Event()
+    listener = ExpirationListener(wake_up)
+    listener.start(loop)
+    try:
+        while True:
+            now = datetime.datetime.now()
+            try:
+                deleted = await cleaner()
+                next_expiration = await loop.run_in_executor(
+                    cleaner_executor, next_expiration_date
+                )
+            except Exception as e:
+                logger.critical(e)
+                delay = ERROR_RETRY_SECONDS
+            else:
+                delay = compute_delay(next_expiration, now, min_interval, max_interval)
+                if not delay:
+                    if deleted:
+                        logger.info('Cleaner backlog detected. Running in catch-up mode.')
+                        continue
+                    # Expired rows exist, but are locked by another cleaner.
+                    delay = min_interval
+            listener.planned_run = now + datetime.timedelta(seconds=delay)
+            logger.debug(f'Next cleaner run at {listener.planned_run}.')
+            wake_up.clear()
+            try:
+                await asyncio.wait_for(wake_up.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    except asyncio.CancelledError:
+        logger.warning('Task cancelled')
+    finally:
+        listener.stop(loop)
+
+
+def upload_session_reaper():
+    with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+        abandoned = uow.upload_sessions.delete_expired(limit=current_config.CLEANER_BATCH_SIZE)
+        for key, upload_id in abandoned:
+            uow.content.abort_multipart_upload(key, upload_id)
+        uow.commit()
+    if reaped := len(abandoned):
+        logger.info(
+            f'[{throughput.replica_id}] Reaper deleted: {reaped} abandoned upload sessions.'
+        )
 
 
 async def main():
@@ -87,17 +285,27 @@ async def main():
         signals=(signal.SIGHUP, signal.SIGTERM, signal.SIGINT),
         loop=asyncio.get_event_loop(),
     )
-    cleaner_task = create_periodic_task(
-        name='cleaner',
-        func=cleaner,
-        interval=datetime.timedelta(seconds=5),
+    cleaner_task = asyncio.create_task(adaptive_cleaner(), name='cleaner')
+    upload_session_reaper_task = create_periodic_task(
+        name='upload_session_reaper',
+        func=upload_session_reaper,
+        interval=datetime.timedelta(minutes=1),
+    )
+    mail_dispatcher_task = create_periodic_task(
+        name='mail_dispatcher',
+        func=dispatch_mails,
+        interval=datetime.timedelta(seconds=current_config.MAIL_DISPATCH_INTERVAL_SECONDS),
     )
     try:
-        await asyncio.gather(cleaner_task)
+        await asyncio.gather(cleaner_task, upload_session_reaper_task, mail_dispatcher_task)
     except asyncio.CancelledError:
         logger.info('Gather cancelled')
         logger.info('Cleaning')
 
 
 if __name__ == '__main__':
+    config_logger()
+    # Cleaner runs in its own container, so it is scraped separately from the API.
+    if current_config.CLEANER_METRICS_PORT:
+        start_http_server(current_config.CLEANER_METRICS_PORT)
     asyncio.run(main())
@@ -0,0 +1,45 @@
+import logging
+
+from sharethis.adapters.mail import get_mail_service, MailServiceError
+from sharethis.infrastructure.config import current_config
+from sharethis.infrastructure.main import get_db, get_bucket_storage_client
+from sharethis.services.uow import MainUnitOfWork
+
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_mails(
+    batch_size: int = current_config.MAIL_DISPATCH_BATCH_SIZE,
+    max_attempts: int = current_config.MAIL_MAX_ATTEMPTS,
+) -> int:
+    """
+    Send due mails from the outbox. Failed mails are retried with exponential backoff.
+
+    Every mail is claimed and settled in its own transaction, so only one row is
+    locked during a request to the mailer and a failure never rolls back mails
+    which were already sent.
+
+    Returns: number of sent mails.
+    """
+    mail_service = get_mail_service()
+    sent = 0
+    for _ in range(batch_size):
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            if not (mails := uow.mail_outbox.claim_due(limit=1)):
+                break
+            mail = mails[0]
+            try:
+                mail_service.send(mail.template, mail.payload)
+            except MailServiceError as e:
+                uow.mail_outbox.mark_failed(mail, str(e), max_attempts)
+            except Exception as e:
+                logger.exception(e)
+                uow.mail_outbox.mark_failed(mail, repr(e), max_attempts)
+            else:
+                uow.mail_outbox.delete(mail)
+                sent += 1
+            uow.commit()
+    if sent:
+        logger.info(f'Dispatcher sent: {sent} mails.')
+    return sent
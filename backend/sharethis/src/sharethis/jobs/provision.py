@@ -0,0 +1,19 @@
+#!python
+"""
+One-time provisioning of the database schema and the bucket.
+Run it before starting the API and the cleaner:
+
+    python -m sharethis.jobs.provision
+"""
+import logging
+
+from sharethis.infrastructure.main import config_logger, provision
+
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == '__main__':
+    config_logger()
+    provision()
+    logger.info('Provisioned.')
@@ -10,13 +10,52 @@ class UploadDTO:
     email: Optional[str] = None
 
 
+@dataclass
+class PresignedUploadDTO:
+    name: str
+    size: int
+    content_type: Optional[str] = None
+
+
 @dataclass(frozen=True)
 class UploadResultDTO:
     key: str
 
 
+@dataclass(frozen=True)
+class UploadBatchResultDTO:
+    keys: list[str]
+
+
+@dataclass(frozen=True)
+class PresignedUploadResultDTO:
+    key: str
+    url: str
+    method: str
+    headers: dict
+
+
+@dataclass(frozen=True)
+class UploadSessionDTO:
+    key: str
+    size: int
+    chunk_size: int
+    chunks: int
+    received: list[int]
+    # Number of bytes received without gaps from the beginning of the file.
+    offset: int
+
+
 @dataclass(frozen=True)
 class DownloadResultDTO:
     url: str
     encryption_method: str
     file_name: str
+
+
+@dataclass(frozen=True)
+class LocalFileDTO:
+    path: str
+    internal_url: str
+    content_type: Optional[str] = None
+    content_disposition: Optional[str] = None
@@ -1,34 +1,173 @@
+import hashlib
+import logging
+import math
 import mimetypes
+import os
 import uuid
-from datetime import datetime
-from typing import Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import IO, Callable, Iterable, Mapping, Optional
 
 import urllib
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import UploadFile
+from werkzeug.datastructures import FileStorage
 
-from sharethis.adapters.mail import get_mail_service
-from sharethis.infrastructure.config import current_config
-from sharethis.infrastructure.main import db, bucket_storage_client
-from sharethis.infrastructure.models import ContentMeta
-from sharethis.logic.dtos import UploadDTO, UploadResultDTO, DownloadResultDTO
-from sharethis.services.uow import MainUnitOfWork
+from sharethis.adapters.bucket import IAsyncBucketStorageClient, LocalFilesystemClient
+from sharethis.infrastructure.config import ImproperlyConfigured, current_config
+from sharethis.infrastructure.db import AsyncSQLAlchemyDatabase
+from sharethis.infrastructure.exceptions import (
+    UploadNotCompleted,
+    ChunkConflict,
+    InvalidChunk,
+    InvalidUploadSession,
+    InvalidLink,
+    NotFound,
+)
+from sharethis.infrastructure.main import get_db, get_bucket_storage_client
+from sharethis.infrastructure.metrics import timed
+from sharethis.infrastructure.models import ContentMeta, ContentStatus, UploadSession
+from sharethis.logic.dtos import (
+    UploadDTO,
+    UploadBatchResultDTO,
+    UploadResultDTO,
+    DownloadResultDTO,
+    LocalFileDTO,
+    PresignedUploadDTO,
+    PresignedUploadResultDTO,
+    UploadSessionDTO,
+)
+from sharethis.services.uow import AsyncMainUnitOfWork, MainUnitOfWork
+
+
+logger = logging.getLogger(__name__)
+
+batch_upload_executor = ThreadPoolExecutor(
+    max_workers=current_config.UPLOAD_BATCH_CONCURRENCY, thread_name_prefix='batch-upload'
+)
 
 
 class UploadUseCase:
+    hash_chunk_size = 1024 * 1024
 
     @staticmethod
     def generate_unique_key() -> str:
         return str(uuid.uuid4().hex)
 
-    def send_new_upload_email(self, key: str, send_to: Optional[str] = None):
+    @classmethod
+    def hash_content(cls, file: IO[bytes]) -> tuple[str, int]:
+        """
+        Return the content addressed blob key and size of a seekable file.
+        The file is rewound, so it can be uploaded afterwards.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        while chunk := file.read(cls.hash_chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+        file.seek(0)
+        return f'sha256-{digest.hexdigest()}', size
+
+    def store_blobs(
+        self,
+        blobs: Mapping[str, tuple[FileStorage, int]],
+        references: Mapping[str, int],
+        save: Callable[[MainUnitOfWork], None],
+    ):
+        """
+        Upload blobs which are not stored yet, then add their references and call
+        `save` in one short transaction. No connection or row lock is held during
+        the transfer. Objects uploaded here are deleted again if the transaction fails.
+
+        Args:
+            blobs: file and size of every blob key
+            references: number of references added to every blob key
+            save: adds records of the upload, called before commit
+        """
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            missing = uow.blobs.missing(list(blobs))
+        uploaded: list[str] = []
+        try:
+            while True:
+                if missing:
+                    uploaded += missing
+                    with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+                        self.upload_blobs(uow, {key: blobs[key][0] for key in missing})
+                with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+                    missing = []
+                    # Rows are locked in the same order as by the cleaner.
+                    for key in sorted(blobs):
+                        if key in uploaded:
+                            uow.blobs.add(key, blobs[key][1], references[key])
+                        elif not uow.blobs.acquire(key, references[key]):
+                            missing.append(key)
+                    # Blob was deleted by the cleaner after the check, so its object
+                    # is uploaded again.
+                    if missing:
+                        continue
+                    save(uow)
+                    uow.commit()
+                    return
+        except BaseException:
+            self.discard_blobs(uploaded)
+            raise
+
+    def upload_blobs(self, uow: MainUnitOfWork, files: Mapping[str, FileStorage]):
+        for key, file in files.items():
+            uow.content.upload(key, file)
+
+    @staticmethod
+    def discard_blobs(keys: list[str]):
+        if not keys:
+            return
+        try:
+            with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+                # An object is kept once a concurrent upload of the same content
+                # has committed its blob.
+                uow.content.bulk_delete(uow.blobs.missing(keys))
+        except Exception as e:
+            logger.warning(f'Could not delete objects of a failed upload: {keys}.')
+            logger.exception(e)
+
+    def enqueue_new_upload_email(
+        self,
+        uow: MainUnitOfWork | AsyncMainUnitOfWork,
+        key: str,
+        send_to: Optional[str] = None,
+    ):
+        # Mail is stored in the outbox within the upload transaction
+        # and sent by the background dispatcher.
         if not send_to:
             return
-        get_mail_service().send_new_upload_mail(
-            url=f"{current_config.WEB_APP_DOMAIN}/key/{key}",
-            email=send_to,
+        uow.mail_outbox.add(
+            template='new_upload',
+            payload={'url': f"{current_config.WEB_APP_DOMAIN}/key/{key}", 'email': send_to},
+        )
+
+    @staticmethod
+    def build_pending_content_meta(
+        key: str, presigned_dto: PresignedUploadDTO, upload_dto: UploadDTO
+    ) -> ContentMeta:
+        return ContentMeta(
+            key=key,
+            name=presigned_dto.name,
+            content_type=(
+                presigned_dto.content_type
+                or mimetypes.guess_type(presigned_dto.name)[0]
+                or 'application/octet-stream'
+            ),
+            expiration_date=datetime.now() + upload_dto.time_to_live,
+            encryption_method=upload_dto.encryption_method,
+            status=ContentStatus.PENDING,
+            size=presigned_dto.size,
+            email=upload_dto.email,
         )
 
+    @timed('UploadUseCase.upload')
     def upload(self, file, upload_dto: UploadDTO) -> UploadResultDTO:
         unique_key_for_upload = self.generate_unique_key()
+        blob_key, size = self.hash_content(file)
 
         # Create instance of ContentMeta.
         cm = ContentMeta(
@@ -37,18 +176,277 @@ class UploadUseCase:
             content_type=file.content_type or mimetypes.guess_type(file.filename),
             expiration_date=datetime.now() + upload_dto.time_to_live,
             encryption_method=upload_dto.encryption_method,
+            size=size,
+            blob_key=blob_key,
         )
 
+        def save(uow: MainUnitOfWork):
+            uow.content_meta.add(cm)
+            # Send email about new upload.
+            self.enqueue_new_upload_email(uow, unique_key_for_upload, upload_dto.email)
+
         # Execute logic.
-        with MainUnitOfWork(db, bucket_storage_client) as uow:
+        self.store_blobs({blob_key: (file, size)}, {blob_key: 1}, save)
+        return UploadResultDTO(key=unique_key_for_upload)
+
+
+class UploadBatchUseCase(UploadUseCase):
+    """
+    Upload many files with shared options. Files are hashed and transferred to the
+    bucket in parallel, then records are inserted at once in one transaction and
+    a single mail lists all of them.
+    """
+    @staticmethod
+    def run_in_pool(func: Callable, arguments: Iterable[tuple]) -> list:
+        futures = [batch_upload_executor.submit(func, *args) for args in arguments]
+        # Request files are closed once the response is sent, so all transfers
+        # have to end before the first error is raised.
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def upload_blobs(self, uow: MainUnitOfWork, files: Mapping[str, FileStorage]):
+        self.run_in_pool(uow.content.upload, files.items())
+
+    def enqueue_new_batch_upload_email(
+        self,
+        uow: MainUnitOfWork,
+        keys: list[str],
+        send_to: Optional[str] = None,
+    ):
+        if not send_to:
+            return
+        uow.mail_outbox.add(
+            template='new_batch_upload',
+            payload={
+                'urls': [f"{current_config.WEB_APP_DOMAIN}/key/{key}" for key in keys],
+                'email': send_to,
+            },
+        )
+
+    @timed('UploadBatchUseCase.upload')
+    def upload(self, files: list, upload_dto: UploadDTO) -> UploadBatchResultDTO:
+        hashes = self.run_in_pool(self.hash_content, [(file,) for file in files])
+        expiration_date = datetime.now() + upload_dto.time_to_live
+        content_metas = [
+            ContentMeta(
+                key=self.generate_unique_key(),
+                name=file.filename,
+                content_type=(
+                    file.content_type
+                    or mimetypes.guess_type(file.filename)[0]
+                    or 'application/octet-stream'
+                ),
+                expiration_date=expiration_date,
+                encryption_method=upload_dto.encryption_method,
+                size=size,
+                blob_key=blob_key,
+            )
+            for file, (blob_key, size) in zip(files, hashes)
+        ]
+        keys = [cm.key for cm in content_metas]
+        # The same content sent twice is uploaded once, with a reference per file.
+        references = Counter(blob_key for blob_key, _ in hashes)
+        blobs: dict[str, tuple[FileStorage, int]] = {}
+        for file, (blob_key, size) in zip(files, hashes):
+            blobs.setdefault(blob_key, (file, size))
+
+        def save(uow: MainUnitOfWork):
+            uow.content_meta.add_all(content_metas)
+            self.enqueue_new_batch_upload_email(uow, keys, upload_dto.email)
+
+        self.store_blobs(blobs, references, save)
+        return UploadBatchResultDTO(keys=keys)
+
+
+class AsyncUploadUseCase(UploadUseCase):
+    def __init__(
+        self,
+        db_client: AsyncSQLAlchemyDatabase,
+        bucket_storage_client: IAsyncBucketStorageClient,
+    ):
+        self._db_client = db_client
+        self._bucket_storage_client = bucket_storage_client
+
+    @timed('AsyncUploadUseCase.upload')
+    async def upload(self, file: UploadFile, upload_dto: UploadDTO) -> UploadResultDTO:
+        unique_key_for_upload = self.generate_unique_key()
+        # Parsed form keeps the file in memory or in a temporary file, so this is cheap.
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+
+        cm = ContentMeta(
+            key=unique_key_for_upload,
+            name=file.filename,
+            content_type=(
+                file.content_type
+                or mimetypes.guess_type(file.filename)[0]
+                or 'application/octet-stream'
+            ),
+            expiration_date=datetime.now() + upload_dto.time_to_live,
+            encryption_method=upload_dto.encryption_method,
+            size=size,
+        )
+
+        async with AsyncMainUnitOfWork(self._db_client, self._bucket_storage_client) as uow:
+            # Upload comes first, so no database connection is held during the transfer.
+            await uow.content.upload(unique_key_for_upload, file, size)
+            try:
+                await uow.content_meta.add(cm)
+                self.enqueue_new_upload_email(uow, unique_key_for_upload, upload_dto.email)
+                await uow.commit()
+            except Exception:
+                await uow.content.delete(unique_key_for_upload)
+                raise
+
+        return UploadResultDTO(key=unique_key_for_upload)
+
+
+class PresignedUploadUseCase(UploadUseCase):
+    """
+    Two-phase upload where file content goes directly to the bucket.
+
+    `create` registers pending ContentMeta and returns a write-only link,
+    `confirm` checks that the object landed in the bucket and publishes it.
+    """
+
+    def create(
+        self, presigned_dto: PresignedUploadDTO, upload_dto: UploadDTO
+    ) -> PresignedUploadResultDTO:
+        unique_key_for_upload = self.generate_unique_key()
+        cm = self.build_pending_content_meta(unique_key_for_upload, presigned_dto, upload_dto)
+
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            link = uow.content.presigned_upload_link(unique_key_for_upload, cm.content_type)
             uow.content_meta.add(cm)
-            uow.content.upload(unique_key_for_upload, file)
             uow.commit()
 
-        # Send email about new upload.
-        self.send_new_upload_email(unique_key_for_upload, upload_dto.email)
+        return PresignedUploadResultDTO(key=unique_key_for_upload, **link)
 
-        return UploadResultDTO(key=unique_key_for_upload)
+    def confirm(self, key: str) -> UploadResultDTO:
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            cm = uow.content_meta.retrieve_pending_by_key(key)
+            if (size := uow.content.size(key)) != cm.size:
+                raise UploadNotCompleted(details={'expected_size': cm.size, 'size': size})
+            cm.status = ContentStatus.UPLOADED
+            self.enqueue_new_upload_email(uow, key, cm.email)
+            uow.commit()
+
+        return UploadResultDTO(key=key)
+
+
+class ResumableUploadUseCase(UploadUseCase):
+    """
+    Upload sent in numbered chunks which can be retried independently.
+
+    Chunks map onto S3 multipart upload parts or Azure staged blocks.
+    """
+    # S3 multipart upload limits, Azure accepts smaller and more blocks.
+    min_chunk_size = 5 * 1024 * 1024
+    max_chunks = 10000
+
+    @staticmethod
+    def session_to_dto(upload_session: UploadSession) -> UploadSessionDTO:
+        received = sorted(part.number for part in upload_session.parts)
+        contiguous = 0
+        for number in received:
+            if number != contiguous:
+                break
+            contiguous += 1
+        return UploadSessionDTO(
+            key=upload_session.key,
+            size=upload_session.size,
+            chunk_size=upload_session.chunk_size,
+            chunks=math.ceil(upload_session.size / upload_session.chunk_size),
+            received=received,
+            offset=min(contiguous * upload_session.chunk_size, upload_session.size),
+        )
+
+    @staticmethod
+    def expected_chunk_size(upload_session: UploadSession, number: int) -> int:
+        chunks = math.ceil(upload_session.size / upload_session.chunk_size)
+        if not 0 <= number < chunks:
+            raise InvalidChunk(details={'number': f'Chunk number must be in [0, {chunks}).'})
+        if number == chunks - 1:
+            return upload_session.size - upload_session.chunk_size * (chunks - 1)
+        return upload_session.chunk_size
+
+    @classmethod
+    def validate_chunks(cls, size: int, chunk_size: int) -> None:
+        if chunk_size < cls.min_chunk_size:
+            raise ImproperlyConfigured(
+                f'UPLOAD_CHUNK_SIZE must be at least {cls.min_chunk_size} bytes.'
+            )
+        if math.ceil(size / chunk_size) > cls.max_chunks:
+            raise InvalidUploadSession(
+                details={'size': f'Must be at most {chunk_size * cls.max_chunks} bytes.'}
+            )
+
+    def create(self, presigned_dto: PresignedUploadDTO, upload_dto: UploadDTO) -> UploadSessionDTO:
+        self.validate_chunks(presigned_dto.size, current_config.UPLOAD_CHUNK_SIZE)
+        unique_key_for_upload = self.generate_unique_key()
+        cm = self.build_pending_content_meta(unique_key_for_upload, presigned_dto, upload_dto)
+
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            upload_session = UploadSession(
+                key=unique_key_for_upload,
+                upload_id=uow.content.start_multipart_upload(
+                    unique_key_for_upload, cm.content_type
+                ),
+                size=presigned_dto.size,
+                chunk_size=current_config.UPLOAD_CHUNK_SIZE,
+                expiration_date=min(
+                    datetime.now() + timedelta(hours=current_config.UPLOAD_SESSION_TTL_HOURS),
+                    cm.expiration_date,
+                ),
+            )
+            uow.content_meta.add(cm)
+            uow.upload_sessions.add(upload_session)
+            uow.commit()
+            return self.session_to_dto(upload_session)
+
+    def status(self, key: str) -> UploadSessionDTO:
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            return self.session_to_dto(uow.upload_sessions.retrieve_active_by_key(key))
+
+    def upload_chunk(self, key: str, number: int, stream: IO[bytes]) -> UploadSessionDTO:
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            upload_session = uow.upload_sessions.retrieve_active_by_key(key)
+            expected_size = self.expected_chunk_size(upload_session, number)
+            # Never read more than one chunk into memory.
+            data = stream.read(expected_size + 1)
+            if len(data) != expected_size:
+                raise InvalidChunk(
+                    details={'size': f'Chunk {number} must have {expected_size} bytes.'}
+                )
+            etag = uow.content.upload_part(key, upload_session.upload_id, number, data)
+            uow.upload_sessions.save_part(upload_session, number, len(data), etag)
+            try:
+                uow.commit()
+            except IntegrityError:
+                # Concurrent request saved the same chunk first. Bucket keeps one of
+                # the uploaded parts, so the client has to send it again.
+                raise ChunkConflict(details={'number': number})
+            return self.session_to_dto(upload_session)
+
+    def finalize(self, key: str) -> UploadResultDTO:
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            upload_session = uow.upload_sessions.retrieve_active_by_key(key)
+            cm = uow.content_meta.retrieve_pending_by_key(key)
+            session_dto = self.session_to_dto(upload_session)
+            if missing := sorted(set(range(session_dto.chunks)) - set(session_dto.received)):
+                raise UploadNotCompleted(details={'missing': missing})
+            uow.content.complete_multipart_upload(
+                key,
+                upload_session.upload_id,
+                sorted((part.number, part.etag) for part in upload_session.parts),
+                cm.content_type,
+            )
+            cm.status = ContentStatus.UPLOADED
+            uow.upload_sessions.delete(upload_session)
+            self.enqueue_new_upload_email(uow, key, cm.email)
+            uow.commit()
+
+        return UploadResultDTO(key=key)
 
 
 class DownloadUseCase:
@@ -63,10 +461,39 @@ class DownloadUseCase:
         overwritten = base._replace(scheme=new.scheme, netloc=new.netloc)
         return overwritten.geturl()
 
+    @timed('DownloadUseCase.download')
     def download(self, key: str) -> DownloadResultDTO:
-        with MainUnitOfWork(db, bucket_storage_client) as uow:
-            cm = uow.content_meta.retrieve_non_expired_by_key(key)
-            presigned_url = uow.content.presigned_download_link(cm.key, cm.content_type, cm.name)
+        with MainUnitOfWork(get_db(), get_bucket_storage_client()) as uow:
+            # Session connects to the database lazily, so a cache hit needs no connection.
+            cm = uow.content_meta.retrieve_non_expired_snapshot_by_key(key)
+            presigned_url = uow.content.presigned_download_link(
+                cm.object_key, cm.content_type, cm.name
+            )
+        return DownloadResultDTO(
+            url=self.format_download_url(
+                presigned_url, current_config.OBJECT_STORAGE_ACCESSIBLE_URL
+            ),
+            encryption_method=cm.encryption_method,
+            file_name=cm.name,
+        )
+
+
+class AsyncDownloadUseCase(DownloadUseCase):
+    def __init__(
+        self,
+        db_client: AsyncSQLAlchemyDatabase,
+        bucket_storage_client: IAsyncBucketStorageClient,
+    ):
+        self._db_client = db_client
+        self._bucket_storage_client = bucket_storage_client
+
+    @timed('AsyncDownloadUseCase.download')
+    async def download(self, key: str) -> DownloadResultDTO:
+        async with AsyncMainUnitOfWork(self._db_client, self._bucket_storage_client) as uow:
+            cm = await uow.content_meta.retrieve_non_expired_snapshot_by_key(key)
+            presigned_url = uow.content.presigned_download_link(
+                cm.object_key, cm.content_type, cm.name
+            )
         return DownloadResultDTO(
             url=self.format_download_url(
                 presigned_url, current_config.OBJECT_STORAGE_ACCESSIBLE_URL
@@ -74,3 +501,31 @@ class DownloadUseCase:
             encryption_method=cm.encryption_method,
             file_name=cm.name,
         )
+
+
+class LocalFileUseCase:
+    """
+    Signed links of the LOCAL storage provider. Only the signature is checked here,
+    file content is left to nginx.
+    """
+    def __init__(self):
+        if not isinstance(client := get_bucket_storage_client(), LocalFilesystemClient):
+            raise NotFound
+        self._client = client
+
+    def download(self, key: str, params: Mapping[str, str]) -> LocalFileDTO:
+        if (headers := self._client.verify_link('GET', key, params)) is None:
+            raise InvalidLink
+        if self._client.get_size(key) is None:
+            raise NotFound
+        return LocalFileDTO(
+            path=self._client.path(key),
+            internal_url=self._client.internal_url(key),
+            content_type=headers.get('content_type'),
+            content_disposition=headers.get('content_disposition'),
+        )
+
+    def upload(self, key: str, params: Mapping[str, str], stream: IO[bytes]):
+        if self._client.verify_link('PUT', key, params) is None:
+            raise InvalidLink
+        self._client.upload(key, stream)
@@ -1,12 +1,25 @@
 from abc import ABC, abstractmethod
 import logging
+from typing import TYPE_CHECKING
 
-from sharethis.infrastructure.db import SQLAlchemyDatabase
+from sharethis.infrastructure.db import AsyncSQLAlchemyDatabase, SQLAlchemyDatabase
+from sharethis.infrastructure.metrics import timed
 
-from sharethis.adapters.bucket import IBucketStorageClient
+from sharethis.adapters.bucket import IAsyncBucketStorageClient, IBucketStorageClient
 from sqlalchemy.orm import Session, scoped_session
 
-from sharethis.adapters.repositories import ContentRepository, ContentMetaRepository
+from sharethis.adapters.repositories import (
+    AsyncContentMetaRepository,
+    BlobRepository,
+    AsyncContentRepository,
+    ContentRepository,
+    ContentMetaRepository,
+    MailOutboxRepository,
+    UploadSessionRepository,
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class IUnitOfWork(ABC):
@@ -56,10 +69,12 @@ class MainUnitOfWork(IUnitOfWork):
         else:
             self._close()
 
+    @timed('MainUnitOfWork.rollback')
     def rollback(self):
         self._session.rollback()
         self._logger.debug('UOW rollback')
 
+    @timed('MainUnitOfWork.commit')
     def commit(self):
         self._session.commit()
         self._logger.debug('UOW commit')
@@ -75,3 +90,67 @@ class MainUnitOfWork(IUnitOfWork):
     @property
     def content_meta(self) -> ContentMetaRepository:
         return ContentMetaRepository(self._session)
+
+    @property
+    def blobs(self) -> BlobRepository:
+        return BlobRepository(self._session)
+
+    @property
+    def upload_sessions(self) -> UploadSessionRepository:
+        return UploadSessionRepository(self._session)
+
+    @property
+    def mail_outbox(self) -> MailOutboxRepository:
+        return MailOutboxRepository(self._session)
+
+
+class AsyncMainUnitOfWork:
+    """
+    MainUnitOfWork counterpart for the ASGI entrypoint, used with `async with`.
+    """
+    def __init__(
+        self,
+        db_client: AsyncSQLAlchemyDatabase,
+        bucket_storage_client: IAsyncBucketStorageClient,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        self._db_client = db_client
+        self._bucket_storage_client = bucket_storage_client
+        self._logger = logger
+
+    async def __aenter__(self):
+        self._session: 'AsyncSession' = self._db_client.get_session()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        self._logger.debug(f'UOW exit | type: {type}, value: {value}, traceback: {traceback}')
+        if type:
+            await self.rollback()
+        await self._close()
+
+    @timed('AsyncMainUnitOfWork.rollback')
+    async def rollback(self):
+        await self._session.rollback()
+        self._logger.debug('UOW rollback')
+
+    @timed('AsyncMainUnitOfWork.commit')
+    async def commit(self):
+        await self._session.commit()
+        self._logger.debug('UOW commit')
+
+    async def _close(self):
+        await self._session.close()
+        self._logger.debug('UOW close')
+
+    @property
+    def content(self) -> AsyncContentRepository:
+        return AsyncContentRepository(self._bucket_storage_client)
+
+    @property
+    def content_meta(self) -> AsyncContentMetaRepository:
+        return AsyncContentMetaRepository(self._session)
+
+    @property
+    def mail_outbox(self) -> MailOutboxRepository:
+        # Outbox only adds instances, which AsyncSession does without IO.
+        return MailOutboxRepository(self._session)
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+
+# sharethis.infrastructure.config reads required variables on import.
+# Tests which need a database or a bucket get a SQLite file and a local directory.
+_directory = tempfile.mkdtemp(prefix='sharethis-tests-')
+os.environ.setdefault('DB_CONNECTION_STRING', f'sqlite:///{_directory}/db.sqlite3')
+os.environ.setdefault('OBJECT_STORAGE_PROVIDER', 'LOCAL')
+os.environ.setdefault('LOCAL_STORAGE_PATH', os.path.join(_directory, 'files'))
+os.environ.setdefault('LOCAL_STORAGE_SECRET', 'secret')
+os.environ.setdefault('LOCAL_STORAGE_URL', 'http://localhost/api/files')
+os.environ.setdefault('MAIL_SERVICE', 'mock')
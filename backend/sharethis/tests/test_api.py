@@ -0,0 +1,53 @@
+from urllib.parse import urlsplit
+
+from sharethis.entrypoints.api import app
+from sharethis.infrastructure.config import current_config
+
+from tests.test_use_cases import UseCaseTestCase
+
+
+class ApiTestCase(UseCaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = app.test_client()
+
+    @staticmethod
+    def local_path(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.path}?{parts.query}'
+
+
+class TestPresignedUpload(ApiTestCase):
+    def create(self, size: int):
+        return self.client.post('/api/upload/presigned', json={
+            'name': 'file.txt',
+            'size': size,
+            'data': {'time_to_live': 1, 'encryption_method': None},
+        })
+
+    def test_uploaded_file_is_confirmed(self):
+        link = self.create(size=5).json
+        self.assertEqual(
+            self.client.put(self.local_path(link['url']), data=b'hello').status_code, 204
+        )
+
+        response = self.client.post(f"/api/upload/{link['key']}/confirm")
+
+        self.assertEqual(response.json, {'key': link['key']})
+        self.assertEqual(self.client.get(f"/api/download/{link['key']}").status_code, 200)
+
+    def test_size_mismatch_is_not_confirmed(self):
+        link = self.create(size=5).json
+        self.client.put(self.local_path(link['url']), data=b'hell')
+
+        response = self.client.post(f"/api/upload/{link['key']}/confirm")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json['details'], {'expected_size': 5, 'size': 4})
+        self.assertEqual(self.client.get(f"/api/download/{link['key']}").status_code, 404)
+
+    def test_size_is_limited(self):
+        response = self.create(size=current_config.MAX_UPLOAD_SIZE + 1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.json['details'])
@@ -0,0 +1,204 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import TestCase, mock
+from urllib.parse import parse_qsl, urlsplit
+
+from sharethis.adapters.bucket import (
+    AWSS3Client,
+    BucketStorageError,
+    LocalFilesystemClient,
+    TransferProgress,
+    chunked,
+    stage_blocks,
+)
+
+
+class FakeBlobClient:
+    def __init__(self):
+        self.staged = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def stage_block(self, block_id, data):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+            self.staged[block_id] = data
+
+
+class TestStageBlocks(TestCase):
+    def test_blocks_are_ordered_and_complete(self):
+        client = FakeBlobClient()
+        data = bytes(range(256)) * 10
+
+        blocks = stage_blocks(client, io.BytesIO(data), block_size=100, max_concurrency=3)
+
+        self.assertEqual(len(blocks), 26)
+        self.assertEqual(b''.join(client.staged[block.id] for block in blocks), data)
+
+    def test_concurrency_is_bounded(self):
+        client = FakeBlobClient()
+
+        stage_blocks(client, io.BytesIO(b'x' * 1000), block_size=10, max_concurrency=2)
+
+        self.assertLessEqual(client.max_in_flight, 2)
+
+    def test_first_block_starts_the_blob(self):
+        client = FakeBlobClient()
+
+        blocks = stage_blocks(
+            client, io.BytesIO(b'cd'), block_size=2, max_concurrency=1, first_block=b'ab'
+        )
+
+        self.assertEqual([client.staged[block.id] for block in blocks], [b'ab', b'cd'])
+
+
+class TestChunked(TestCase):
+    def test_chunks_respect_limit(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_empty_iterable_gives_no_chunks(self):
+        self.assertEqual(list(chunked([], 2)), [])
+
+
+class TestLocalFilesystemClient(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = LocalFilesystemClient(
+            root=self.directory.name, secret='secret', url='http://api.localhost/api/files'
+        )
+        self.client.provision()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def link_params(url: str) -> dict:
+        return dict(parse_qsl(urlsplit(url).query))
+
+    def test_upload_is_stored_in_sharded_tree(self):
+        self.client.upload('abc', io.BytesIO(b'content'))
+
+        relative = os.path.relpath(self.client.path('abc'), self.directory.name)
+        self.assertEqual(len(relative.split(os.sep)), 3)
+        self.assertEqual(self.client.get_size('abc'), 7)
+        self.assertEqual(self.client.internal_url('abc'), f'/protected/{relative}')
+        # Only the file itself is left, temporary files are renamed over it.
+        self.assertEqual(os.listdir(os.path.dirname(self.client.path('abc'))), ['abc'])
+
+    def test_invalid_key_is_refused(self):
+        with self.assertRaises(BucketStorageError):
+            self.client.upload('../abc', io.BytesIO(b'content'))
+
+    def test_signed_link_is_verified(self):
+        params = self.link_params(self.client.generate_temporary_access_link(
+            'abc', 'text/plain', 'attachment; filename=a.txt'
+        ))
+
+        self.assertEqual(
+            self.client.verify_link('GET', 'abc', params),
+            {'content_type': 'text/plain', 'content_disposition': 'attachment; filename=a.txt'}
+        )
+        self.assertIsNone(self.client.verify_link('PUT', 'abc', params))
+        self.assertIsNone(self.client.verify_link('GET', 'abd', params))
+        self.assertIsNone(
+            self.client.verify_link('GET', 'abc', {**params, 'content_type': 'text/html'})
+        )
+
+    def test_expired_link_is_refused(self):
+        link = self.client.generate_temporary_upload_link('abc', expires_in=timedelta(seconds=-1))
+
+        self.assertIsNone(self.client.verify_link('PUT', 'abc', self.link_params(link['url'])))
+
+    def test_multipart_upload_is_assembled_in_order(self):
+        upload_id = self.client.create_multipart_upload('abc')
+        parts = [
+            (number, self.client.upload_part('abc', upload_id, number, data))
+            for number, data in reversed(list(enumerate([b'ab', b'cd', b'e'])))
+        ]
+
+        self.client.complete_multipart_upload('abc', upload_id, sorted(parts))
+
+        with open(self.client.path('abc'), 'rb') as file:
+            self.assertEqual(file.read(), b'abcde')
+
+    def test_bulk_delete_skips_missing_files(self):
+        keys = [f'key{number}' for number in range(5)]
+        for key in keys[:3]:
+            self.client.upload(key, io.BytesIO(b'x'))
+
+        self.client.bulk_delete(keys)
+
+        self.assertEqual([self.client.get_size(key) for key in keys], [None] * 5)
+
+
+class TestTransferProgress(TestCase):
+    def test_bytes_from_all_threads_are_counted(self):
+        progress = TransferProgress()
+        threads = [
+            threading.Thread(target=lambda: [progress(10) for _ in range(100)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(progress.transferred, 4000)
+
+
+class TestAWSS3Client(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('tests.bucket.aws')
+
+    def upload(self, size: int, **kwargs) -> tuple[mock.Mock, list[str]]:
+        client = AWSS3Client(
+            'http://s3.localhost', 'access', 'secret', 'bucket', logger=self.logger, **kwargs
+        )
+
+        def upload_fileobj(Callback, **kwargs):
+            for _ in range(size // 10):
+                Callback(10)
+
+        with mock.patch.object(client, '_client') as s3, self.assertLogs(self.logger) as logs:
+            s3.upload_fileobj.side_effect = upload_fileobj
+            client.upload('key', io.BytesIO(b'x' * size))
+        return s3.upload_fileobj.call_args.kwargs['Config'], logs.output
+
+    def test_transfer_is_configured(self):
+        config, _ = self.upload(
+            size=100, upload_part_size=50, upload_max_concurrency=4,
+            upload_multipart_threshold=60, upload_io_chunksize=20,
+        )
+
+        self.assertEqual(config.multipart_chunksize, 50)
+        self.assertEqual(config.multipart_threshold, 60)
+        self.assertEqual(config.max_concurrency, 4)
+        self.assertEqual(config.io_chunksize, 20)
+        self.assertTrue(config.use_threads)
+
+    def test_single_worker_uploads_without_threads(self):
+        config, _ = self.upload(size=100, upload_max_concurrency=1)
+
+        self.assertFalse(config.use_threads)
+
+    def test_throughput_is_logged_with_parts(self):
+        _, logs = self.upload(size=100, upload_part_size=30, upload_multipart_threshold=50)
+
+        self.assertIn('Uploaded key: 100 bytes', logs[-1])
+        self.assertIn('4 parts', logs[-1])
+
+    def test_small_upload_is_logged_as_one_part(self):
+        _, logs = self.upload(size=40, upload_part_size=30, upload_multipart_threshold=50)
+
+        self.assertIn('Uploaded key: 40 bytes', logs[-1])
+        self.assertIn('1 parts', logs[-1])
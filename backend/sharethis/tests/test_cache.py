@@ -0,0 +1,50 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from sharethis.infrastructure.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=timedelta(seconds=10), clock=self.clock)
+
+    def test_entry_expires(self):
+        self.cache.set('a', 1)
+        self.clock.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats(), {'size': 0, 'hits': 1, 'misses': 1})
+
+    def test_entry_ttl_overrides_default(self):
+        self.cache.set('a', 1, ttl=timedelta(seconds=2))
+        self.clock.now = 2
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_get_or_set_calls_factory_once(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return 'url'
+
+        self.assertEqual(self.cache.get_or_set('a', factory), 'url')
+        self.assertEqual(self.cache.get_or_set('a', factory), 'url')
+        self.assertEqual(len(calls), 1)
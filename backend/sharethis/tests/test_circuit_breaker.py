@@ -0,0 +1,97 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from sharethis.adapters.mail import MailService, MailServiceError
+from sharethis.infrastructure.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(2, timedelta(seconds=10), clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_trial_call_after_reset_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_release_lets_next_call_try(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = ''
+
+
+class TestMailServiceBreaker(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.service = MailService(
+            url='http://mailer', breaker=CircuitBreaker(1, timedelta(seconds=10), clock=self.clock)
+        )
+        self.responses = []
+        self.service._session.post = lambda *args, **kwargs: self.responses.pop(0)
+
+    def send(self):
+        self.service.send_new_upload_mail(url='http://x.com/k', email='a@example.com')
+
+    def open_breaker(self):
+        self.responses.append(FakeResponse(503))
+        with self.assertRaises(MailServiceError):
+            self.send()
+        self.clock.now = 10
+
+    def test_rejected_trial_call_closes_breaker(self):
+        self.open_breaker()
+        self.responses.append(FakeResponse(400))
+        with self.assertRaises(MailServiceError):
+            self.send()
+
+        self.assertEqual(self.service.stats()['circuit'], CircuitBreaker.CLOSED)
+        self.responses.append(FakeResponse(202))
+        self.send()
+
+    def test_unexpected_error_releases_trial_call(self):
+        self.open_breaker()
+        self.responses.append(None)
+        with self.assertRaises(AttributeError):
+            self.send()
+
+        self.responses.append(FakeResponse(202))
+        self.send()
+        self.assertEqual(self.service.stats()['circuit'], CircuitBreaker.CLOSED)
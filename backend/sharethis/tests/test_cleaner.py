@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+from sqlalchemy import select
+
+from sharethis.infrastructure.config import current_config
+from sharethis.infrastructure.main import get_bucket_storage_client
+from sharethis.infrastructure.models import UploadSession
+from sharethis.jobs import cleaner
+
+from tests.test_use_cases import UseCaseTestCase
+
+
+class FakeExpiredRecords:
+    """
+    Stand-in for delete_expired_batch which counts batches in flight.
+    """
+    def __init__(self, records: int):
+        self.records = records
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, batch_size: int) -> list[str]:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            claimed = min(batch_size, self.records)
+            self.records -= claimed
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        return ['key'] * claimed
+
+
+class TestCleaner(TestCase):
+    def run_cleaner(self, records: int, **kwargs) -> tuple[int, FakeExpiredRecords]:
+        batches = FakeExpiredRecords(records)
+        with mock.patch.object(cleaner, 'delete_expired_batch', batches):
+            return asyncio.run(cleaner.cleaner(**kwargs)), batches
+
+    def test_batches_are_processed_concurrently(self):
+        deleted, batches = self.run_cleaner(records=50, batch_size=5, concurrency=3)
+
+        self.assertEqual(deleted, 50)
+        self.assertEqual(batches.records, 0)
+        self.assertEqual(batches.max_in_flight, 3)
+
+    def test_pipeline_stops_after_a_partial_batch(self):
+        deleted, batches = self.run_cleaner(records=3, batch_size=5, concurrency=1)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(batches.max_in_flight, 1)
+
+
+class TestReplicaThroughput(TestCase):
+    def test_totals_are_reported_with_replica_id(self):
+        throughput = cleaner.ReplicaThroughput('cleaner-1')
+
+        with self.assertLogs(cleaner.logger, 'INFO') as logs:
+            throughput.record(10, 2.0)
+            throughput.record(0, 1.0)
+            throughput.record(20, 1.0)
+
+        self.assertEqual((throughput.deleted, throughput.busy_seconds), (30, 4.0))
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('[cleaner-1]', logs.output[-1])
+        self.assertIn('Total: 30 records, 7.5 records/s.', logs.output[-1])
+
+
+class TestUploadSessionReaper(UseCaseTestCase):
+    def add_session(self, key: str, expiration_date: datetime) -> str:
+        upload_id = get_bucket_storage_client().create_multipart_upload(key)
+        self.session.add(UploadSession(
+            key=key, upload_id=upload_id, size=1, chunk_size=1, expiration_date=expiration_date,
+        ))
+        self.session.commit()
+        return upload_id
+
+    @staticmethod
+    def multipart_exists(upload_id: str) -> bool:
+        return os.path.isdir(get_bucket_storage_client()._multipart_path(upload_id))
+
+    def test_expired_sessions_are_reaped_in_batches(self):
+        expired = [self.add_session(key, datetime.now() - timedelta(hours=1)) for key in 'abc']
+        alive = self.add_session('alive', datetime.now() + timedelta(hours=1))
+
+        with mock.patch.object(current_config, 'CLEANER_BATCH_SIZE', 2):
+            cleaner.upload_session_reaper()
+
+        self.session.expire_all()
+        keys = self.session.execute(select(UploadSession.key)).scalars().all()
+        self.assertEqual(len(keys), 2)
+        self.assertIn('alive', keys)
+        self.assertTrue(self.multipart_exists(alive))
+        self.assertEqual(sum(map(self.multipart_exists, expired)), 1)
@@ -0,0 +1,15 @@
+from unittest import TestCase
+
+from sharethis.infrastructure.db import async_connection_url
+
+
+class TestAsyncConnectionUrl(TestCase):
+    def test_postgres_uses_asyncpg(self):
+        url = async_connection_url('postgresql+psycopg2://user:secret@db/postgres')
+        self.assertEqual(url.drivername, 'postgresql+asyncpg')
+        self.assertEqual(url.password, 'secret')
+
+    def test_sqlite_uses_aiosqlite(self):
+        self.assertEqual(
+            async_connection_url('sqlite:////tmp/db.sqlite').drivername, 'sqlite+aiosqlite'
+        )
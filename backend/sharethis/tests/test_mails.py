@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+from sqlalchemy import select
+
+from sharethis.adapters.mail import MailService, MailServiceError
+from sharethis.infrastructure.models import MailOutbox
+from sharethis.jobs.mails import dispatch_mails
+
+from tests.test_use_cases import UseCaseTestCase
+
+
+class FakeMailService:
+    def __init__(self, errors: dict[str, Exception]):
+        self.errors = errors
+        self.sent = []
+
+    def send(self, template, payload):
+        if error := self.errors.get(payload['email']):
+            raise error
+        self.sent.append(payload['email'])
+
+
+class TestDispatchMails(UseCaseTestCase):
+    def add_mail(self, email: str):
+        self.session.add(MailOutbox(
+            template='new_upload',
+            payload={'url': 'https://example.com', 'email': email},
+            attempts=0,
+            next_attempt_at=datetime.now(),
+        ))
+        self.session.commit()
+
+    def dispatch(self, errors=None, **kwargs) -> FakeMailService:
+        service = FakeMailService(errors or {})
+        with mock.patch('sharethis.jobs.mails.get_mail_service', return_value=service):
+            dispatch_mails(**kwargs)
+        return service
+
+    def outbox(self) -> dict[str, MailOutbox]:
+        self.session.expire_all()
+        return {
+            mail.payload['email']: mail
+            for mail in self.session.execute(select(MailOutbox)).scalars()
+        }
+
+    def test_sent_mails_are_deleted(self):
+        self.add_mail('a@example.com')
+
+        self.assertEqual(self.dispatch().sent, ['a@example.com'])
+        self.assertEqual(self.outbox(), {})
+
+    def test_failed_mail_is_retried_with_backoff(self):
+        self.add_mail('a@example.com')
+        error = MailServiceError('Mail service is unavailable.')
+
+        self.dispatch({'a@example.com': error})
+        mail = self.outbox()['a@example.com']
+        self.assertEqual(mail.attempts, 1)
+        self.assertEqual(mail.last_error, 'Mail service is unavailable.')
+        self.assertAlmostEqual(
+            mail.next_attempt_at, datetime.now() + timedelta(seconds=30),
+            delta=timedelta(seconds=5),
+        )
+
+        mail.next_attempt_at = datetime.now()
+        self.session.commit()
+        self.dispatch({'a@example.com': error})
+        mail = self.outbox()['a@example.com']
+        self.assertEqual(mail.attempts, 2)
+        self.assertAlmostEqual(
+            mail.next_attempt_at, datetime.now() + timedelta(seconds=60),
+            delta=timedelta(seconds=5),
+        )
+
+    def test_mail_is_given_up_after_max_attempts(self):
+        self.add_mail('a@example.com')
+        error = MailServiceError('Mail service is unavailable.')
+
+        for _ in range(2):
+            self.dispatch({'a@example.com': error}, max_attempts=2)
+            mail = self.outbox()['a@example.com']
+            if mail.next_attempt_at:
+                mail.next_attempt_at = datetime.now()
+                self.session.commit()
+
+        mail = self.outbox()['a@example.com']
+        self.assertEqual(mail.attempts, 2)
+        self.assertIsNone(mail.next_attempt_at)
+        self.assertEqual(self.dispatch().sent, [])
+
+    def test_unexpected_error_does_not_undo_other_mails(self):
+        self.add_mail('a@example.com')
+        self.add_mail('b@example.com')
+
+        service = self.dispatch({'a@example.com': RuntimeError('broken')})
+
+        self.assertEqual(service.sent, ['b@example.com'])
+        [mail] = self.outbox().values()
+        self.assertEqual(mail.payload['email'], 'a@example.com')
+        self.assertEqual(mail.attempts, 1)
+        self.assertEqual(mail.last_error, "RuntimeError('broken')")
+
+
+class TestMailService(TestCase):
+    def test_post_is_not_retried_after_it_was_sent(self):
+        service = MailService(url='http://mailer.localhost/api/send')
+        retry = service._session.get_adapter(service._url).max_retries
+
+        self.assertNotIn('POST', retry.allowed_methods)
+        self.assertFalse(retry.is_retry('POST', 503))
@@ -0,0 +1,43 @@
+import tempfile
+import tracemalloc
+from unittest import TestCase
+
+from flask import Flask, request
+
+from sharethis.infrastructure.memory_tracing import MemoryTracer
+from sharethis.infrastructure.profiling import ProfileStore
+
+
+class TestMemoryTracer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tracer = MemoryTracer(ProfileStore(self.directory.name))
+        self.app = Flask(__name__)
+        self.tracer.initialize(self.app)
+
+        @self.app.route('/copy/<int:times>', methods=['POST'])
+        def copy(times: int):
+            return {'size': len(request.get_data() * times)}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_peak_is_recorded_per_route_and_size(self):
+        response = self.app.test_client().post('/copy/4', data=b'x' * 2 ** 20)
+
+        self.assertEqual(response.json, {'size': 4 * 2 ** 20})
+        trace, = self.tracer.store.list()
+        self.assertEqual((trace['method'], trace['route']), ('POST', '/copy/<int:times>'))
+        self.assertEqual(trace['size'], 2 ** 20)
+        self.assertGreaterEqual(trace['peak'], 4 * 2 ** 20)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_report_keeps_the_worst_peak_of_a_route(self):
+        client = self.app.test_client()
+        client.post('/copy/1', data=b'x' * 2 ** 20)
+        client.post('/copy/8', data=b'x' * 2 ** 20)
+
+        summary = self.tracer.report()['summary']['POST /copy/<int:times>']
+
+        self.assertEqual(summary['requests'], 2)
+        self.assertGreaterEqual(summary['peak_per_byte_max'], 8)
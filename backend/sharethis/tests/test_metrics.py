@@ -0,0 +1,63 @@
+import asyncio
+from unittest import TestCase
+
+from prometheus_client import REGISTRY
+
+from sharethis.adapters.bucket import IBucketStorageClient
+from sharethis.infrastructure.metrics import render, timed
+
+
+def sample(name: str, stage: str) -> float:
+    return REGISTRY.get_sample_value(name, {'stage': stage}) or 0.0
+
+
+class TestTimed(TestCase):
+    def test_duration_is_recorded(self):
+        before = sample('sharethis_stage_duration_seconds_count', 'test.sync')
+
+        self.assertEqual(timed('test.sync')(lambda value: value * 2)(2), 4)
+
+        self.assertEqual(sample('sharethis_stage_duration_seconds_count', 'test.sync'), before + 1)
+
+    def test_errors_are_counted(self):
+        @timed('test.error')
+        def fail():
+            raise ValueError
+
+        before = sample('sharethis_stage_errors_total', 'test.error')
+        with self.assertRaises(ValueError):
+            fail()
+
+        self.assertEqual(sample('sharethis_stage_errors_total', 'test.error'), before + 1)
+
+    def test_coroutine_is_awaited(self):
+        @timed('test.async')
+        async def double(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        before = sample('sharethis_stage_duration_seconds_count', 'test.async')
+
+        self.assertEqual(asyncio.run(double(2)), 4)
+        self.assertEqual(
+            sample('sharethis_stage_duration_seconds_count', 'test.async'), before + 1
+        )
+
+
+class TestBucketClientMethods(TestCase):
+    def test_implementations_are_timed(self):
+        methods = {name: lambda *args, **kwargs: None for name in [
+            'upload', 'generate_temporary_access_link', 'generate_temporary_upload_link',
+            'create_multipart_upload', 'upload_part', 'complete_multipart_upload',
+            'abort_multipart_upload', 'bulk_delete', 'provision',
+        ]}
+        client_class = type('FakeClient', (IBucketStorageClient,), {
+            **methods, 'get_size': lambda self, key: 1
+        })
+
+        self.assertEqual(client_class().get_size('key'), 1)
+
+        self.assertEqual(
+            sample('sharethis_stage_duration_seconds_count', 'FakeClient.get_size'), 1
+        )
+        self.assertIn(b'sharethis_stage_duration_seconds_bucket', render()[0])
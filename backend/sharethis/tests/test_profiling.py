@@ -0,0 +1,53 @@
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import TestCase
+
+from sharethis.infrastructure.profiling import ProfileStore, StackSampler, collapse
+
+
+def busy(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class TestStackSampler(TestCase):
+    def test_collapse_starts_from_root(self):
+        stack = collapse(sys._getframe())
+
+        self.assertTrue(stack.endswith(f'{__name__}:test_collapse_starts_from_root'))
+
+    def test_samples_are_taken_from_the_given_thread(self):
+        sampler = StackSampler(threading.get_ident(), interval=0.001)
+        sampler.start()
+        busy(0.05)
+        stacks = sampler.stop()
+
+        # A few samples may land in start or stop.
+        self.assertIn(f'{__name__}:busy', stacks.most_common(1)[0][0])
+
+
+class TestProfileStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.directory.name, capacity=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_oldest_profiles_are_dropped(self):
+        ids = [self.store.save({'path': f'/{number}'}) for number in range(3)]
+
+        self.assertEqual([profile['id'] for profile in self.store.list()], ids[:0:-1])
+        self.assertIsNone(self.store.get(ids[0]))
+
+    def test_stacks_are_collapsed(self):
+        profile_id = self.store.save({'stacks': Counter({'a;b': 2, 'a': 1})})
+
+        self.assertEqual(self.store.collapsed(self.store.get(profile_id)), 'a;b 2\na 1\n')
+
+    def test_invalid_id_is_not_read(self):
+        self.assertIsNone(self.store.get('../secret'))
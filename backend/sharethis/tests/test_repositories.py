@@ -0,0 +1,181 @@
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import Session
+
+from sharethis.adapters.repositories import BlobRepository, ContentMetaRepository
+from sharethis.infrastructure.models import Base, Blob, ContentMeta
+
+
+class RepositoryTestCase(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+
+    def tearDown(self):
+        self.session.close()
+
+
+class TestBlobRepository(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.blobs = BlobRepository(self.session)
+
+    def ref_count(self, key: str):
+        return self.session.execute(
+            select(Blob.ref_count).where(Blob.key == key)
+        ).scalar_one_or_none()
+
+    def test_missing_blob_is_not_acquired(self):
+        self.assertFalse(self.blobs.acquire('sha256-a'))
+
+    def test_existing_blob_gets_another_reference(self):
+        self.blobs.add('sha256-a', 10)
+        self.assertTrue(self.blobs.acquire('sha256-a'))
+        self.blobs.add('sha256-a', 10)
+
+        self.assertEqual(self.ref_count('sha256-a'), 3)
+
+    def test_references_are_added_at_once(self):
+        self.blobs.add('sha256-a', 10, references=2)
+        self.blobs.acquire('sha256-a', references=3)
+
+        self.assertEqual(self.ref_count('sha256-a'), 5)
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        self.blobs.add('sha256-a', 10)
+        self.blobs.acquire('sha256-a')
+        self.blobs.add('sha256-b', 10)
+
+        self.assertEqual(self.blobs.release(['sha256-a', 'sha256-b']), ['sha256-b'])
+        self.assertEqual(self.ref_count('sha256-a'), 1)
+        self.assertIsNone(self.ref_count('sha256-b'))
+        self.assertEqual(self.blobs.release(['sha256-a']), ['sha256-a'])
+
+
+class TestContentMetaRepository(RepositoryTestCase):
+    def test_expired_records_are_returned_with_their_blobs(self):
+        expired = datetime.now() - timedelta(days=1)
+        self.session.add_all([
+            ContentMeta(key='own', name='a', content_type='text/plain', expiration_date=expired),
+            ContentMeta(
+                key='shared', name='b', content_type='text/plain', expiration_date=expired,
+                blob_key='sha256-a',
+            ),
+            ContentMeta(
+                key='alive', name='c', content_type='text/plain',
+                expiration_date=datetime.now() + timedelta(days=1),
+            ),
+        ])
+        self.session.flush()
+
+        self.assertEqual(
+            sorted(ContentMetaRepository(self.session).delete_expired()),
+            [('own', None), ('shared', 'sha256-a')],
+        )
+
+    def test_records_are_added_at_once(self):
+        repository = ContentMetaRepository(self.session)
+        repository.add_all([
+            ContentMeta(
+                key=key, name=key, content_type='text/plain',
+                expiration_date=datetime.now() + timedelta(days=1), blob_key='sha256-a',
+            )
+            for key in ['a', 'b']
+        ])
+
+        keys = self.session.execute(select(ContentMeta.key).order_by(ContentMeta.key)).scalars()
+        self.assertEqual(keys.all(), ['a', 'b'])
+
+
+class TestContentMetaSnapshots(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        ContentMetaRepository.snapshot_cache.clear()
+        self.addCleanup(ContentMetaRepository.snapshot_cache.clear)
+        self.repository = ContentMetaRepository(self.session)
+
+    def add(self, key: str, expiration_date: datetime):
+        self.session.add(ContentMeta(
+            key=key, name=key, content_type='text/plain', expiration_date=expiration_date,
+        ))
+        self.session.commit()
+
+    def delete_elsewhere(self, key: str):
+        # Another process deletes the row without touching the cache of this one.
+        with Session(self.engine) as other:
+            other.query(ContentMeta).filter(ContentMeta.key == key).delete()
+            other.commit()
+
+    def test_record_deleted_by_other_process_is_served_until_snapshot_expires(self):
+        self.add('a', datetime.now() + timedelta(days=1))
+        self.repository.retrieve_non_expired_snapshot_by_key('a')
+        self.delete_elsewhere('a')
+
+        self.assertEqual(self.repository.retrieve_non_expired_snapshot_by_key('a').key, 'a')
+        with mock.patch.object(ContentMetaRepository.snapshot_cache, '_clock') as clock:
+            clock.return_value = time.monotonic() + ContentMetaRepository.snapshot_ttl.seconds
+            with self.assertRaises(NoResultFound):
+                self.repository.retrieve_non_expired_snapshot_by_key('a')
+
+    def test_record_deleted_by_this_process_is_not_served(self):
+        self.add('a', datetime.now() + timedelta(days=1))
+        self.repository.retrieve_non_expired_snapshot_by_key('a')
+        self.repository.delete_by_key('a')
+
+        with self.assertRaises(NoResultFound):
+            self.repository.retrieve_non_expired_snapshot_by_key('a')
+
+    def test_snapshot_is_not_served_after_record_expiration(self):
+        self.add('a', datetime.now() + timedelta(seconds=1))
+        self.repository.retrieve_non_expired_snapshot_by_key('a')
+        self.delete_elsewhere('a')
+
+        with mock.patch.object(ContentMetaRepository.snapshot_cache, '_clock') as clock:
+            clock.return_value = time.monotonic() + 1
+            with self.assertRaises(NoResultFound):
+                self.repository.retrieve_non_expired_snapshot_by_key('a')
+
+
+class TestExpirationNotify(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notified = []
+        self.checkouts = 0
+
+        @event.listens_for(self.engine, 'checkout')
+        def checkout(connection, *args):
+            self.checkouts += 1
+            connection.create_function('pg_notify', 2, lambda *args: self.notified.append(args))
+
+        patcher = mock.patch.object(ContentMetaRepository, 'notify_dialects', {'sqlite'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def content_meta(self, key: str, days: int) -> ContentMeta:
+        return ContentMeta(
+            key=key, name=key, content_type='text/plain',
+            expiration_date=datetime(2030, 1, 1) + timedelta(days=days),
+        )
+
+    def test_expiration_is_announced_on_commit(self):
+        repository = ContentMetaRepository(self.session)
+        repository.add(self.content_meta('b', days=2))
+        repository.add(self.content_meta('a', days=1))
+
+        self.assertEqual(self.checkouts, 0)
+        self.session.commit()
+        self.assertEqual(
+            self.notified, [(ContentMetaRepository.expiration_channel, '2030-01-02T00:00:00')]
+        )
+
+    def test_rolled_back_records_are_not_announced(self):
+        ContentMetaRepository(self.session).add(self.content_meta('a', days=1))
+        self.session.rollback()
+        self.session.commit()
+
+        self.assertEqual(self.notified, [])
@@ -0,0 +1,244 @@
+import io
+import os
+from datetime import timedelta
+from unittest import TestCase, mock
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import FileStorage
+
+from sharethis.adapters.repositories import BlobRepository, UploadSessionRepository
+from sharethis.infrastructure.config import ImproperlyConfigured, current_config
+from sharethis.infrastructure.exceptions import (
+    ChunkConflict,
+    InvalidUploadSession,
+    UploadNotCompleted,
+)
+from sharethis.infrastructure.main import get_bucket_storage_client, get_db, provision
+from sharethis.infrastructure.models import (
+    Blob,
+    ContentMeta,
+    MailOutbox,
+    UploadSession,
+    UploadSessionPart,
+)
+from sharethis.logic.dtos import PresignedUploadDTO, UploadDTO
+from sharethis.logic.use_cases import ResumableUploadUseCase, UploadBatchUseCase, UploadUseCase
+
+
+def upload_file(content: bytes, name: str = 'file.txt') -> FileStorage:
+    return FileStorage(stream=io.BytesIO(content), filename=name, content_type='text/plain')
+
+
+class ConnectionsInUse:
+    def __init__(self, engine):
+        self._engine = engine
+        self.in_use = 0
+
+    def _checkout(self, *args):
+        self.in_use += 1
+
+    def _checkin(self, *args):
+        self.in_use -= 1
+
+    def __enter__(self):
+        event.listen(self._engine, 'checkout', self._checkout)
+        event.listen(self._engine, 'checkin', self._checkin)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self._engine, 'checkout', self._checkout)
+        event.remove(self._engine, 'checkin', self._checkin)
+
+
+class UseCaseTestCase(TestCase):
+    """
+    Runs use cases against the SQLite database and the local bucket from conftest.
+    """
+    upload_dto = UploadDTO(
+        time_to_live=timedelta(days=1), encryption_method=None, email='a@example.com'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        provision()
+
+    def setUp(self):
+        self.session = get_db().get_session()
+        for model in [ContentMeta, Blob, MailOutbox, UploadSessionPart, UploadSession]:
+            self.session.execute(delete(model))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def ref_counts(self) -> dict[str, int]:
+        self.session.expire_all()
+        return dict(self.session.execute(select(Blob.key, Blob.ref_count)).all())
+
+    @staticmethod
+    def stored(key: str) -> bool:
+        return os.path.exists(get_bucket_storage_client().path(key))
+
+
+class TestUploadUseCase(UseCaseTestCase):
+    def test_same_content_is_stored_once(self):
+        first = UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+        with mock.patch.object(UploadUseCase, 'upload_blobs') as upload_blobs:
+            second = UploadUseCase().upload(upload_file(b'hello', 'other.txt'), self.upload_dto)
+
+        upload_blobs.assert_not_called()
+        [(blob_key, ref_count)] = self.ref_counts().items()
+        self.assertEqual(ref_count, 2)
+        self.assertTrue(self.stored(blob_key))
+        self.assertNotEqual(first.key, second.key)
+
+    def test_no_connection_is_held_during_transfer(self):
+        upload_blobs = UploadUseCase.upload_blobs
+        during_transfer = []
+
+        def transfer(use_case, uow, files):
+            during_transfer.append(connections.in_use)
+            upload_blobs(use_case, uow, files)
+
+        with ConnectionsInUse(get_db()._engine) as connections, \
+                mock.patch.object(UploadUseCase, 'upload_blobs', transfer):
+            UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+
+        self.assertEqual(during_transfer, [0])
+
+    def test_uploaded_object_is_deleted_on_rollback(self):
+        with mock.patch.object(
+            UploadUseCase, 'enqueue_new_upload_email', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+
+        blob_key, _ = UploadUseCase.hash_content(io.BytesIO(b'hello'))
+        self.assertFalse(self.stored(blob_key))
+        self.assertEqual(self.ref_counts(), {})
+        self.assertEqual(self.session.execute(select(ContentMeta)).all(), [])
+
+    def test_shared_object_is_kept_on_rollback(self):
+        UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+        with mock.patch.object(
+            UploadUseCase, 'enqueue_new_upload_email', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+
+        [(blob_key, ref_count)] = self.ref_counts().items()
+        self.assertEqual(ref_count, 1)
+        self.assertTrue(self.stored(blob_key))
+
+    def test_blob_deleted_after_check_is_uploaded_again(self):
+        missing = BlobRepository.missing
+        calls = []
+
+        def deleted_after_check(repository, keys):
+            calls.append(keys)
+            return [] if len(calls) == 1 else missing(repository, keys)
+
+        with mock.patch.object(BlobRepository, 'missing', deleted_after_check):
+            UploadUseCase().upload(upload_file(b'hello'), self.upload_dto)
+
+        [(blob_key, ref_count)] = self.ref_counts().items()
+        self.assertEqual(ref_count, 1)
+        self.assertTrue(self.stored(blob_key))
+
+
+class TestUploadBatchUseCase(UseCaseTestCase):
+    def test_batch_is_saved_with_one_mail(self):
+        result = UploadBatchUseCase().upload(
+            [upload_file(b'a'), upload_file(b'b'), upload_file(b'a')], self.upload_dto
+        )
+
+        self.assertEqual(len(result.keys), 3)
+        self.assertEqual(sorted(self.ref_counts().values()), [1, 2])
+        [mail] = self.session.execute(select(MailOutbox)).scalars()
+        self.assertEqual(mail.template, 'new_batch_upload')
+        self.assertEqual([url.rsplit('/', 1)[1] for url in mail.payload['urls']], result.keys)
+
+    def test_uploaded_objects_are_deleted_when_one_transfer_fails(self):
+        upload = get_bucket_storage_client().upload
+
+        def fail_on_b(key, file):
+            if file.read() == b'b':
+                raise RuntimeError
+            file.seek(0)
+            upload(key, file)
+
+        with mock.patch.object(get_bucket_storage_client(), 'upload', fail_on_b), \
+                self.assertRaises(RuntimeError):
+            UploadBatchUseCase().upload([upload_file(b'a'), upload_file(b'b')], self.upload_dto)
+
+        blob_key, _ = UploadUseCase.hash_content(io.BytesIO(b'a'))
+        self.assertFalse(self.stored(blob_key))
+        self.assertEqual(self.ref_counts(), {})
+
+
+class TestResumableUploadUseCase(UseCaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Tiny chunks, the S3 minimum is checked separately.
+        for patcher in [
+            mock.patch.object(ResumableUploadUseCase, 'min_chunk_size', 1),
+            mock.patch.object(current_config, 'UPLOAD_CHUNK_SIZE', 4),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create(self, size: int):
+        return ResumableUploadUseCase().create(
+            PresignedUploadDTO(name='file.txt', size=size, content_type=None), self.upload_dto
+        )
+
+    def test_chunks_smaller_than_s3_minimum_are_rejected(self):
+        with mock.patch.object(ResumableUploadUseCase, 'min_chunk_size', 5), \
+                self.assertRaises(ImproperlyConfigured):
+            self.create(size=10)
+
+    def test_too_many_chunks_are_rejected(self):
+        with mock.patch.object(ResumableUploadUseCase, 'max_chunks', 2), \
+                self.assertRaises(InvalidUploadSession) as context:
+            self.create(size=9)
+
+        self.assertEqual(context.exception.details, {'size': 'Must be at most 8 bytes.'})
+        self.assertEqual(self.session.execute(select(UploadSession)).all(), [])
+
+    def test_retried_chunk_replaces_previous_one(self):
+        key = self.create(size=6).key
+        use_case = ResumableUploadUseCase()
+        use_case.upload_chunk(key, 0, io.BytesIO(b'xxxx'))
+        use_case.upload_chunk(key, 0, io.BytesIO(b'hell'))
+        status = use_case.upload_chunk(key, 1, io.BytesIO(b'o!'))
+
+        self.assertEqual(status.received, [0, 1])
+        use_case.finalize(key)
+        with open(get_bucket_storage_client().path(key), 'rb') as file:
+            self.assertEqual(file.read(), b'hello!')
+
+    def test_finalize_reports_missing_chunks(self):
+        key = self.create(size=10).key
+        ResumableUploadUseCase().upload_chunk(key, 1, io.BytesIO(b'abcd'))
+
+        with self.assertRaises(UploadNotCompleted) as context:
+            ResumableUploadUseCase().finalize(key)
+
+        self.assertEqual(context.exception.details, {'missing': [0, 2]})
+
+    def test_concurrent_chunk_is_a_conflict(self):
+        key = self.create(size=6).key
+        save_part = UploadSessionRepository.save_part
+
+        def saved_concurrently(repository, upload_session, number, size, etag):
+            save_part(repository, upload_session, number, size, etag)
+            with Session(get_db()._engine) as other:
+                other.add(UploadSessionPart(
+                    session_id=upload_session.id, number=number, size=size, etag='other'
+                ))
+                other.commit()
+
+        with mock.patch.object(UploadSessionRepository, 'save_part', saved_concurrently), \
+                self.assertRaises(ChunkConflict):
+            ResumableUploadUseCase().upload_chunk(key, 0, io.BytesIO(b'hell'))
+
+        self.assertEqual(ResumableUploadUseCase().status(key).received, [0])